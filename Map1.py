@@ -1,13 +1,66 @@
-import pandas as pd
 import re
 import os
 import json
 import subprocess
 import datetime
-from collections import Counter
+from collections import Counter, OrderedDict
 import sys
 import urllib.parse
-import numpy as np
+import argparse
+import hashlib
+import pickle
+import importlib.util
+import gzip
+import filecmp
+import ctypes
+import ctypes.util
+import select
+import struct
+import time
+import tempfile
+import shutil
+import contextlib
+import concurrent.futures
+import itertools
+import functools
+import inspect
+
+def lazy_import(name):
+    """Модуль, который загрузится при первом обращении к его атрибуту.
+    Импорт pandas и NumPy — ~0.3 с; запуск «входные файлы не изменились» обходится без них."""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+pd = lazy_import("pandas")
+np = lazy_import("numpy")
+asyncio = lazy_import("asyncio")  # только для --serve
+cProfile = lazy_import("cProfile")  # только для --profile
+pstats = lazy_import("pstats")
+
+try:
+    import brotli  # необязательно: без него пишем только .gz
+except ImportError:
+    brotli = None
+try:
+    import resource  # нет на Windows: тогда без CPU дочерних процессов и пика памяти
+except ImportError:
+    resource = None
+try:
+    import orjson  # необязательно: быстрый JSON для данных карты
+except ImportError:
+    orjson = None
+try:
+    import fcntl  # нет на Windows: там блокировка запуска через msvcrt
+except ImportError:
+    fcntl = None
+    import msvcrt
 
 # ==========================================
 # 🔑 ВАШ КЛЮЧ
@@ -27,42 +80,461 @@ RATES_DS = {
     "Ночной грузчик": 400, "Ночной сборщик": 287, "Уборщица": 0,
 }
 
+# ==========================================
+# 🏷️ ПРАВИЛА ДОЛЖНОСТЕЙ
+# ==========================================
+# Должность из выгрузки (в нижнем регистре, пробелы схлопнуты) -> единое название: первое правило, все шаблоны
+# которого (регулярные выражения) нашлись в строке; role: None — оставить как есть, с заглавной буквы.
+# Иконка и сдельная оплата определяются по шаблонам в едином названии, ставка — по RATES_WS / RATES_DS.
+# Менять правила и ставки можно без правки кода — файлом rules.json в папке проекта с любыми из ключей:
+#   {"roles": [{"match": ["кладовщик"], "role": "Кладовщик"}, ...], "icons": [{"match": "кладовщик", "icon": "📋"}],
+#    "default_icon": "🛒", "piecework": "построчно", "rates": {"WS": {"Кладовщик": 280}, "DS": {"Кладовщик": 290}}}
+# Ключ из файла заменяет встроенную таблицу целиком (rates — по каждому типу магазина отдельно).
+RULES_FILE = "rules.json"
+ROLE_RULES = [
+    {"match": ["построчно", "сборщик"], "role": "Сборщик (построчно)"},
+    {"match": ["построчно"], "role": None},
+    {"match": ["грузчик", "ноч"], "role": "Ночной грузчик"}, {"match": ["грузчик"], "role": "Дневной грузчик"},
+    {"match": ["сборщик", "ноч"], "role": "Ночной сборщик"}, {"match": ["сборщик"], "role": "Дневной сборщик"},
+    {"match": ["продавец", "ноч"], "role": "Ночной продавец"}, {"match": ["продавец"], "role": "Дневной продавец"},
+    {"match": ["кассир"], "role": "Кассир"},
+    {"match": ["бариста"], "role": "Бариста"},
+    {"match": ["убор|клинер"], "role": "Уборщица"},
+    {"match": ["повар"], "role": "Повар"},
+]
+ROLE_ICONS = [{"match": "грузчик", "icon": "📦"}, {"match": "бариста", "icon": "☕"}, {"match": "сборщик", "icon": "🎒"}]
+DEFAULT_ICON = "🛒"
+PIECEWORK_PATTERN = "построчно"
+
+# Листы/файлы потребности, которые берём в работу
+SHEET_MARKERS = ["Сегодня", "Завтра", "ДС", "ВС-ГС"]
+
+# ==========================================
+# 🗺️ РЕГИОНЫ
+# ==========================================
+# Без regions.json в папке проекта — одна карта Москвы и МО, как раньше. regions.json — список регионов:
+#   [{"name": "moscow", "bbox": [54.0, 35.0, 57.5, 41.0], "center": [55.75, 37.62], "manager": "79152977432"},
+#    {"name": "spb", "polygon": [[59.5, 29.4], [60.3, 29.4], [60.3, 31.0], [59.5, 31.0]], "center": [59.94, 30.31],
+#     "zoom": 10, "manager": "79110000000"}]
+# bbox — [широта_мин, долгота_мин, широта_макс, долгота_макс], polygon — вершины [широта, долгота].
+# Магазин относится к первому подходящему региону; вне всех регионов — не попадает на карту.
+# Первый регион выкладывается в корень сайта, остальные — в подпапки по имени (или "dir").
+REGIONS_FILE = "regions.json"
+MANAGER_PHONE = "79152977432"
+DEFAULT_REGIONS = [{"name": "moscow", "bbox": [54.0, 35.0, 57.5, 41.0], "center": [55.75, 37.62], "zoom": 10,
+                    "manager": MANAGER_PHONE, "dir": ""}]
+
 project_dir = os.getcwd()
-print(f"📂 Папка проекта: {project_dir}")
 
-# --- 1. ЗАГРУЗКА ДАННЫХ ---
-all_needs = []
+# ==========================================
+# 📝 АТОМАРНАЯ ЗАПИСЬ
+# ==========================================
+# Все выходные файлы и кэш пишутся во временный файл рядом и подменяются через os.replace: веб-сервер, git
+# и параллельный запуск видят либо старый файл, либо новый целиком, но не половину.
+_temp_ids = itertools.count()
+
+@contextlib.contextmanager
+def atomic_path(path):
+    """Временный путь в той же папке (os.replace работает только в пределах одной файловой системы); при выходе
+    без ошибки он становится path, при ошибке — удаляется"""
+    directory, name = os.path.split(path)
+    os.makedirs(directory or ".", exist_ok=True)
+    tmp = os.path.join(directory, f".{name}.{os.getpid()}.{next(_temp_ids)}.tmp")
+    try:
+        yield tmp
+        if os.path.exists(tmp):  # удалён через discard_temp — path оставляем как есть
+            os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+def discard_temp(tmp):
+    """Отказаться от временного файла atomic_path: содержимое совпало с прежним, подменять нечего"""
+    if os.path.exists(tmp):
+        os.remove(tmp)
+
+def write_atomic(path, data):
+    with atomic_path(path) as tmp, open(tmp, "xb") as f:
+        f.write(data)
+
+# ==========================================
+# 💾 КЭШ РАЗОБРАННЫХ ФАЙЛОВ
+# ==========================================
+# Ключ файла: путь + mtime/размер (быстрая проверка) -> sha256 содержимого.
+# По sha256 храним уже очищенные таблицы, а по хэшу строк магазина — готовый HTML карточек.
+CACHE_VERSION = 4
+CACHE_DIR = os.path.join(project_dir, ".map_cache")
+use_cache = True
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def load_cache_index():
+    try:
+        with open(os.path.join(CACHE_DIR, "index.json"), encoding="utf-8") as f:
+            index = json.load(f)
+        if index.get("version") == CACHE_VERSION:
+            return index
+    except (OSError, ValueError):
+        pass
+    return {"version": CACHE_VERSION, "files": {}, "build": None}
+
+def save_cache_index(index):
+    if not use_cache:
+        return
+    write_atomic(os.path.join(CACHE_DIR, "index.json"), json.dumps(index, ensure_ascii=False, indent=1).encode("utf-8"))
+
+def content_hash(path, index, st=None):
+    """sha256 файла; файл перечитывается, только если изменились mtime или размер"""
+    st = st or os.stat(path)
+    entry = index["files"].get(path)
+    if entry and entry["mtime_ns"] == st.st_mtime_ns and entry["size"] == st.st_size:
+        return entry["sha256"]
+    digest = file_hash(path)
+    index["files"][path] = {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "sha256": digest}
+    return digest
+
+def build_fingerprint(digests):
+    """Отпечаток сборки: входные файлы, сегодняшняя дата (фильтр по дате) и сам скрипт (ставки, шаблоны)"""
+    h = hashlib.sha256()
+    for part in [str(CACHE_VERSION), str(datetime.date.today()), file_hash(os.path.abspath(__file__)), *digests]:
+        h.update(part.encode("utf-8") + b"\0")
+    return h.hexdigest()
+
+def code_fingerprint(*parts):
+    """Отпечаток кода: исходники функций и значения констант (12 hex-символов)"""
+    h = hashlib.sha256()
+    for part in parts:
+        try:
+            text = inspect.getsource(part) if callable(part) else repr(part)
+        except (OSError, TypeError):
+            text = file_hash(os.path.abspath(__file__))  # исходник недоступен — считаем, что изменилось всё
+        h.update(text.encode("utf-8") + b"\0")
+    return h.hexdigest()[:12]
+
+# Кэш разбора, реестра и карточек не должен переживать правку кода, который их строит: отпечаток этого кода
+# входит в имя файла кэша (таблицы, реестр) или в ключ карточки. Правки остального скрипта кэш не сбрасывают.
+@functools.cache
+def parser_fingerprint():
+    return code_fingerprint(read_needs_sheet, clean_and_check, as_str, map_unique, apply_schema, CATEGORY_COLUMNS,
+                            concat_needs, _date_strings, detect_date_format, parse_dates, DATE_FORMATS, DATE_SAMPLE)
+
+@functools.cache
+def registry_fingerprint():
+    return code_fingerprint(build_store_registry, extract_tt, _normalize_unique_tt, normalize_tt, store_numbers,
+                            build_grid, _grid_cells, GRID_CELL_DEG)
+
+@functools.cache
+def card_fingerprint():
+    return code_fingerprint(make_card_html, card_dates, as_str, quote_unique, concat_columns, map_unique)
+
+def _frame_path(kind, digest):
+    # Версия и отпечаток кода разбора в имени: таблицы, разобранные прежним кодом, не подхватываются
+    return os.path.join(CACHE_DIR, "frames", f"{kind}-v{CACHE_VERSION}-{parser_fingerprint()}-{digest}")
+
+def read_cached_frame(kind, digest):
+    if not use_cache:
+        return None
+    path = _frame_path(kind, digest)
+    try:
+        if os.path.exists(path + ".parquet"):
+            return pd.read_parquet(path + ".parquet")
+        if os.path.exists(path + ".pkl"):
+            return pd.read_pickle(path + ".pkl")
+    except Exception as e:
+        print(f"⚠️ Кэш повреждён ({os.path.basename(path)}): {e}")
+    return None
+
+def write_cached_frame(df, kind, digest):
+    """Parquet (если есть pyarrow и типы столбцов позволяют), иначе pickle"""
+    if not use_cache:
+        return
+    path = _frame_path(kind, digest)
+    try:
+        with atomic_path(path + ".parquet") as tmp:
+            df.to_parquet(tmp, index=False)
+    except Exception:
+        with atomic_path(path + ".pkl") as tmp:
+            df.to_pickle(tmp)
+
+def _card_cache_path(region_name):
+    # У каждого региона свой файл: регионы собираются параллельно и не пишут в один файл
+    return os.path.join(CACHE_DIR, f"cards-{region_name}.pkl")
+
+def load_card_cache(region_name):
+    if use_cache:
+        try:
+            with open(_card_cache_path(region_name), "rb") as f:
+                return pickle.load(f)
+        except (OSError, pickle.PickleError, EOFError):
+            pass
+    return {}
+
+def save_card_cache(cards, region_name):
+    if not use_cache:
+        return
+    write_atomic(_card_cache_path(region_name), pickle.dumps(cards, protocol=pickle.HIGHEST_PROTOCOL))
+
+def _registry_path(digest):
+    return os.path.join(CACHE_DIR, f"registry-v{CACHE_VERSION}-{registry_fingerprint()}-{digest}.pkl")
+
+def prune_cache(index, file_digests, regions):
+    """После удачной сборки: удаляет из кэша таблицы и реестры файлов, которых среди входных уже нет (или от прежней
+    версии скрипта), карточки удалённых регионов и записи index["files"] об исчезнувших файлах"""
+    if not use_cache or not os.path.isdir(CACHE_DIR):
+        return
+    paths = {os.path.join(project_dir, name) for name in file_digests}
+    for path in [p for p in index["files"] if p not in paths]:
+        del index["files"][path]
+    digests = set(file_digests.values())
+    keep = ({os.path.basename(_registry_path(d)) for d in digests}
+            | {os.path.basename(_card_cache_path(r["name"])) for r in regions})
+    stale = [os.path.join(CACHE_DIR, name) for name in os.listdir(CACHE_DIR)
+             if name.endswith(".pkl") and name.startswith(("registry-", "cards-")) and name not in keep]
+    frames_dir = os.path.join(CACHE_DIR, "frames")
+    if os.path.isdir(frames_dir):
+        wanted = {f"v{CACHE_VERSION}-{parser_fingerprint()}-{d}" for d in digests}
+        stale += [os.path.join(frames_dir, name) for name in os.listdir(frames_dir)
+                  if not name.endswith(".tmp") and name.rsplit(".", 1)[0].split("-", 1)[-1] not in wanted]
+    for path in stale:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    if stale:
+        print(f"🧹 Кэш: удалено устаревших файлов — {len(stale)}.")
+
+# ==========================================
+# ⏱️ ЗАМЕРЫ ЭТАПОВ
+# ==========================================
+# Каждый этап сборки обёрнут в `with stage("имя") as st:` (st["rows"] = сколько строк на выходе).
+# Для этапа считаем стену, CPU (свой процесс + дочерние — листы Excel читает пул) и пиковую память:
+# на Linux пик процесса (VmHWM) сбрасывается в начале этапа через /proc/self/clear_refs, поэтому пик — именно этого этапа.
+# На других системах сбросить пик нельзя: у этапа — пик процесса с начала запуска (в журнале "peak_per_stage": false).
+# Вложенные этапы (json внутри write) вычитаются из внешнего, повторные (куски --stream, тайлы) складываются.
+STAGES = ["discovery", "load", "dedup", "date filter", "pay calc", "merge", "geo filter",
+          "card render", "grouping", "json", "write", "publish"]
+METRICS_LOG = "map_metrics.jsonl"
+stage_metrics = {}
+_stage_stack = []
+_profile = None  # --profile: {"stage", "enable", "disable", "dump"}
+PEAK_PER_STAGE = os.path.exists("/proc/self/clear_refs")
+
+def _cpu_seconds():
+    cpu = time.process_time()
+    if resource is not None:
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu += children.ru_utime + children.ru_stime
+    return cpu
+
+def _peak_rss_kb(reset=False):
+    """Пик RSS процесса в КБ; reset=True — начать отсчёт пика заново (только Linux)"""
+    try:
+        if reset:
+            with open("/proc/self/clear_refs", "w") as f:
+                f.write("5")
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak  # на macOS ru_maxrss в байтах, на Linux и BSD — в КБ
+
+@contextlib.contextmanager
+def stage(name):
+    record = {"rows": None}
+    frame = {"name": name, "wall": 0.0, "cpu": 0.0, "peak": 0}
+    # Профилируем только внешний вход в этап: вложенный повтор того же имени уже внутри замера
+    profiler = _profile if _profile and _profile["stage"] == name and all(f["name"] != name for f in _stage_stack) else None
+    if _stage_stack:
+        _stage_stack[-1]["peak"] = max(_stage_stack[-1]["peak"], _peak_rss_kb())
+    _peak_rss_kb(reset=True)
+    _stage_stack.append(frame)
+    if profiler is not None:
+        profiler["enable"]()
+    wall, cpu = time.perf_counter(), _cpu_seconds()
+    try:
+        yield record
+    finally:
+        wall, cpu = time.perf_counter() - wall, _cpu_seconds() - cpu
+        if profiler is not None:
+            profiler["disable"]()
+        _stage_stack.pop()
+        peak = max(frame["peak"], _peak_rss_kb())
+        total = stage_metrics.setdefault(name, {"wall_s": 0.0, "cpu_s": 0.0, "peak_mb": 0.0, "rows": None, "calls": 0})
+        total["wall_s"] += wall - frame["wall"]
+        total["cpu_s"] += cpu - frame["cpu"]
+        total["peak_mb"] = max(total["peak_mb"], peak / 1024)
+        total["calls"] += 1
+        if record["rows"] is not None:
+            total["rows"] = (total["rows"] or 0) + int(record["rows"])
+        if _stage_stack:
+            _stage_stack[-1]["wall"] += wall
+            _stage_stack[-1]["cpu"] += cpu
+            _stage_stack[-1]["peak"] = max(_stage_stack[-1]["peak"], peak)
+
+def start_profiling(stage_name, kind):
+    """--profile: профилировщик включается только на время этапа stage_name; отчёт — в report_metrics"""
+    global _profile
+    path = os.path.join(project_dir, "profile_" + re.sub(r"\W+", "_", stage_name))
+    if kind == "pyinstrument":
+        try:
+            import pyinstrument
+        except ImportError:
+            print("⚠️ pyinstrument не установлен — профилируем через cProfile.")
+        else:
+            profiler = pyinstrument.Profiler()
+
+            def dump():
+                with open(path + ".html", "w", encoding="utf-8") as f:
+                    f.write(profiler.output_html())
+                print(profiler.output_text(unicode=True))
+                print(f"🔬 Профиль этапа '{stage_name}': {path}.html")
+            _profile = {"stage": stage_name, "enable": profiler.start, "disable": profiler.stop, "dump": dump}
+            return
+    profiler = cProfile.Profile()
+
+    def dump():
+        profiler.dump_stats(path + ".prof")
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(15)
+        print(f"🔬 Профиль этапа '{stage_name}': {path}.prof (snakeviz / python -m pstats)")
+    _profile = {"stage": stage_name, "enable": profiler.enable, "disable": profiler.disable, "dump": dump}
+
+def report_metrics(metrics_log, run_info):
+    """Таблица этапов в консоль и строка JSON в журнал metrics_log (пусто — не писать); затем счётчики обнуляются"""
+    if not stage_metrics:
+        return
+    names = [n for n in STAGES if n in stage_metrics] + [n for n in stage_metrics if n not in STAGES]
+    total_wall = sum(m["wall_s"] for m in stage_metrics.values())
+    print("\n⏱️ Этапы:")
+    print(f"   {'этап':<12} {'стена, с':>9} {'CPU, с':>8} {'доля':>6} {'пик, МБ':>8} {'строк':>10}")
+    for name in names:
+        m = stage_metrics[name]
+        rows = "—" if m["rows"] is None else m["rows"]
+        print(f"   {name:<12} {m['wall_s']:>9.2f} {m['cpu_s']:>8.2f} {m['wall_s'] / max(total_wall, 1e-9):>6.0%} "
+              f"{m['peak_mb']:>8.0f} {rows:>10}")
+    print(f"   {'всего':<12} {total_wall:>9.2f} {sum(m['cpu_s'] for m in stage_metrics.values()):>8.2f}")
+    if not PEAK_PER_STAGE:
+        print("   ℹ️ Пик памяти по этапам считается только на Linux; здесь это пик процесса с начала запуска.")
+
+    if metrics_log:
+        line = {"time": datetime.datetime.now().isoformat(timespec="seconds"), **run_info, "wall_s": round(total_wall, 3),
+                "peak_per_stage": PEAK_PER_STAGE,
+                "stages": {name: {k: round(v, 3) if isinstance(v, float) else v for k, v in stage_metrics[name].items()}
+                           for name in names}}
+        with open(os.path.join(project_dir, metrics_log), "a", encoding="utf-8") as f:
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+    if _profile is not None:
+        if _profile["stage"] in stage_metrics:
+            _profile["dump"]()
+        else:
+            print(f"ℹ️ Этап '{_profile['stage']}' в этом запуске не выполнялся — профиля нет.")
+    stage_metrics.clear()
+
+# === ВЕКТОРНЫЕ ПОМОЩНИКИ ===
+# Почти все столбцы имеют мало уникальных значений (роли, ТТ, время, даты),
+# поэтому считаем результат один раз на уникальное значение и раскладываем по строкам.
+def map_unique(series, func, categorical=False):
+    """Применяет векторную func к таблице уникальных значений серии и разворачивает результат по строкам.
+    categorical=True — результат сразу категориальный (категории отсортированы), без второго прохода по строкам."""
+    codes, uniques = pd.factorize(series, use_na_sentinel=False)
+    table = np.asarray(func(pd.Series(np.asarray(uniques, dtype=object), dtype=object)), dtype=object)
+    if categorical:
+        table_codes, categories = pd.factorize(table, sort=True)
+        return pd.Series(pd.Categorical.from_codes(table_codes[codes], categories=categories), index=series.index)
+    return pd.Series(table[codes], index=series.index, dtype=object)
+
+def as_str(series, categorical=False):
+    """Аналог str(x) для каждой строки (NaN -> 'nan')"""
+    return map_unique(series, lambda u: u.map(str), categorical)
 
 # === ГЛАВНАЯ ФУНКЦИЯ "ЧИСТКИ" НАЗВАНИЙ ===
-def standardize_role_name(name):
-    clean = str(name).lower().strip()
-    clean = " ".join(clean.split())
-
-    if "построчно" in clean:
-        if "сборщик" in clean:
-            return "Сборщик (построчно)"
-        return clean.capitalize()
-
-    if "грузчик" in clean:
-        return "Ночной грузчик" if "ноч" in clean else "Дневной грузчик"
-
-    if "сборщик" in clean:
-        return "Ночной сборщик" if "ноч" in clean else "Дневной сборщик"
-
-    if "продавец" in clean:
-        return "Ночной продавец" if "ноч" in clean else "Дневной продавец"
-
-    if "кассир" in clean:
-        return "Кассир"
-    if "бариста" in clean:
-        return "Бариста"
-    if "убор" in clean or "клинер" in clean:
-        return "Уборщица"
-    if "повар" in clean:
-        return "Повар"
+# Правила компилируются один раз, а результат запоминается для каждого написания должности (их сотни,
+# строк — миллионы): память живёт весь процесс, так что куски потокового режима и пересборки --watch
+# проверяют правила только для новых написаний.
+RULES_KEYS = {"roles", "icons", "default_icon", "piecework", "rates"}
+
+def compile_role_rules(config):
+    """Правила из config (словарь как в rules.json; нет ключа — встроенная таблица) с готовыми регулярными
+    выражениями и пустой памятью результатов. Ошибка в правилах -> ValueError."""
+    try:
+        roles = [([re.compile(p) for p in ([rule["match"]] if isinstance(rule["match"], str) else rule["match"])],
+                  None if rule.get("role") is None else str(rule["role"]))
+                 for rule in config.get("roles", ROLE_RULES)]
+        icons = [(re.compile(rule["match"]), str(rule["icon"])) for rule in config.get("icons", ROLE_ICONS)]
+        rates = {kind: {str(role): float(rate) for role, rate in config.get("rates", {}).get(kind, default).items()}
+                 for kind, default in (("WS", RATES_WS), ("DS", RATES_DS))}
+        piecework = re.compile(config.get("piecework", PIECEWORK_PATTERN))
+    except (KeyError, TypeError, AttributeError, ValueError, re.error) as e:
+        raise ValueError(f"{type(e).__name__}: {e}") from None
+    return {"config": config, "roles": roles, "icons": icons, "default_icon": str(config.get("default_icon", DEFAULT_ICON)),
+            "piecework": piecework, "rates": rates, "memo": {}, "info": {}}
+
+role_rules = compile_role_rules({})
+
+def load_role_rules():
+    """Настройки правил из RULES_FILE ({} — встроенные). Ошибка в файле -> ValueError с понятным текстом."""
+    path = os.path.join(project_dir, RULES_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    if not isinstance(config, dict):
+        raise ValueError(f"нужен объект с ключами {', '.join(sorted(RULES_KEYS))}")
+    if set(config) - RULES_KEYS:
+        raise ValueError(f"неизвестные ключи: {', '.join(sorted(set(config) - RULES_KEYS))}")
+    compile_role_rules(config)
+    return config
+
+def set_role_rules(config):
+    """Новые правила; если они не изменились (пересборка в --watch), остаются прежние вместе с памятью"""
+    global role_rules
+    if role_rules["config"] != config:
+        role_rules = compile_role_rules(config)
+
+def classify_role(raw, rules):
+    clean = " ".join(str(raw).lower().split())
+    for patterns, role in rules["roles"]:
+        if all(p.search(clean) for p in patterns):
+            return clean.capitalize() if role is None else role
     return clean.capitalize()
 
-def clean_and_check(df, filename):
+def role_info(role, rules):
+    """(иконка, сдельная ли, ставка WS, ставка DS) для единого названия должности — тоже с памятью"""
+    info = rules["info"].get(role)
+    if info is None:
+        low = str(role).lower()
+        icon = next((icon for pattern, icon in rules["icons"] if pattern.search(low)), rules["default_icon"])
+        info = rules["info"][role] = (icon, rules["piecework"].search(low) is not None,
+                                      rules["rates"]["WS"].get(role, 0.0), rules["rates"]["DS"].get(role, 0.0))
+    return info
+
+def standardize_needs(df):
+    if 'Должность' in df.columns:
+        df['Должность'] = standardize_roles(df['Должность'])
+    return df
+
+def standardize_roles(series):
+    """Приводит написание должностей к единому виду: правила — только для ещё не встречавшихся написаний,
+    по строкам — одно категориальное отображение"""
+    rules = role_rules
+    memo = rules["memo"]
+
+    def lookup(uniques):
+        return [memo[raw] if raw in memo else memo.setdefault(raw, classify_role(raw, rules)) for raw in uniques.tolist()]
+    return map_unique(series, lookup, categorical=True)
+
+def clean_and_check(df, filename, date_formats=None):
+    """Единые названия столбцов, компактные типы и дата смены Дата_DT.
+    date_formats — {файл: формат даты}: формат определяется на первом куске файла и дальше не ищется."""
     df.columns = [str(c).strip() for c in df.columns]
     col_map = {
         "Роль": "Должность", "Кол-во сотрудников": "Количество сотрудников",
@@ -71,233 +543,736 @@ def clean_and_check(df, filename):
     }
     df.rename(columns=col_map, inplace=True)
     if 'Должность' in df.columns:
-        df['Должность'] = df['Должность'].apply(standardize_role_name)
+        # К единому виду должности приводит standardize_roles уже после склейки листов (в главном процессе,
+        # где загружены правила); здесь — только к строкам, чтобы категории разных листов склеивались
+        df['Должность'] = as_str(df['Должность'], categorical=True)
+    df = apply_schema(df)
+    if 'Дата выхода' in df.columns:
+        formats = {} if date_formats is None else date_formats
+        if filename not in formats:
+            formats[filename] = detect_date_format(df['Дата выхода'])
+        df['Дата_DT'] = parse_dates(df['Дата выхода'], formats[filename])
     return df
 
-# Ищем файлы (оптимизация: объединяем поиск Excel и CSV)
-files = [f for f in os.listdir(project_dir) if ('потребность' in f.lower() and f.endswith('.xlsx')) or
-         (f.endswith(".csv") and any(x in f for x in ["Сегодня", "Завтра", "ДС", "ВС-ГС"]))]
+# === КОМПАКТНЫЕ ТИПЫ СТОЛБЦОВ ===
+# Коды ТТ, должности, даты и время смен повторяются на тысячах строк: храним их категориями,
+# тогда сортировка, groupby и дедупликация работают по целым кодам, а не по строкам.
+# Исходные строки времени остаются (они идут в карточку как есть), минуты от начала суток — отдельно в Int16.
+CATEGORY_COLUMNS = ['ТТ', 'Должность', 'Дата выхода', 'Начало смены', 'Конец смены']
 
-for filename in files:
-    filepath = os.path.join(project_dir, filename)
-    try:
-        if filename.endswith('.xlsx'):
-            xls = pd.ExcelFile(filepath)
-            for sheet_name in xls.sheet_names:
-                if any(x in sheet_name for x in ["Сегодня", "Завтра", "ДС", "ВС-ГС"]):
-                    df = pd.read_excel(xls, sheet_name=sheet_name)
-                    all_needs.append(clean_and_check(df, filename))
-        elif filename.endswith('.csv'):
-            df = pd.read_csv(filepath)
-            all_needs.append(clean_and_check(df, filename))
-    except Exception as e:
-        print(f"⚠️ Ошибка при загрузке {filename}: {e}")
+def apply_schema(df):
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    count = 'Количество сотрудников'
+    if count in df.columns and pd.api.types.is_integer_dtype(df[count]):
+        df[count] = pd.to_numeric(df[count], downcast='integer')
+    return df
 
-if not all_needs:
-    print("🛑 ОШИБКА: Файлы не найдены.")
-    sys.exit()
+def concat_needs(frames):
+    """pd.concat с сохранением категорий: у таблиц разных листов свои категории, приводим их к общему отсортированному набору"""
+    frames = [f for f in frames if len(f.columns)]
+    if not frames:
+        return pd.DataFrame()
+    for col in dict.fromkeys(c for f in frames for c in f.columns if isinstance(f[c].dtype, pd.CategoricalDtype)):
+        parts = [f[col] if isinstance(f[col].dtype, pd.CategoricalDtype) else f[col].astype('category')
+                 for f in frames if col in f.columns]
+        dtype = pd.CategoricalDtype(pd.api.types.union_categoricals(parts, sort_categories=True).categories)
+        frames = [f.assign(**{col: f[col].astype(dtype)}) if col in f.columns else f for f in frames]
+    return pd.concat(frames, ignore_index=True)
 
-needs_df = pd.concat(all_needs, ignore_index=True)
+# --- 1. ЗАГРУЗКА ДАННЫХ ---
+def is_needs_file(name):
+    return ('потребность' in name.lower() and name.endswith('.xlsx')) or (name.endswith(".csv") and any(x in name for x in SHEET_MARKERS))
 
-# ==========================================
-# 🔥 УДАЛЕНИЕ ДУБЛИКАТОВ
-# ==========================================
-print(f"📊 Всего строк до очистки: {len(needs_df)}")
-dedup_cols = [col for col in ['ТТ', 'Должность', 'Дата выхода', 'Начало смены', 'Конец смены', 'Количество сотрудников']
-              if col in needs_df.columns]
-needs_df.drop_duplicates(subset=dedup_cols, keep='first', inplace=True)
-print(f"✨ Строк после удаления дублей: {len(needs_df)}")
-
-# Загрузка координат (оптимизация: поиск файла более эффективно)
-coords_files = [f for f in os.listdir(project_dir) if ("coords" in f.lower() or "координаты" in f.lower()) and f.endswith(".csv")]
-if not coords_files:
-    print("🛑 ОШИБКА: Файл координат не найден.")
-    sys.exit()
-coords_filename = coords_files[0]  # Берем первый подходящий
-coords_df = pd.read_csv(os.path.join(project_dir, coords_filename))
-coords_df.columns = [c.strip() for c in coords_df.columns]
+def is_coords_file(name):
+    return ("coords" in name.lower() or "координаты" in name.lower()) and name.endswith(".csv")
+
+def is_input_file(name):
+    return is_needs_file(name) or is_coords_file(name) or name in (REGIONS_FILE, RULES_FILE)
+
+def discover_inputs(directory):
+    """Файлы потребности (в фиксированном порядке — от него зависит, какой дубль останется), файлы координат
+    и stat каждого из них — за один проход os.scandir"""
+    stats = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if is_input_file(entry.name) and entry.is_file():
+                stats[entry.name] = entry.stat()
+    names = sorted(stats)
+    return [f for f in names if is_needs_file(f)], [f for f in names if is_coords_file(f)], stats
+
+def pick_excel_engine(name):
+    """'auto' -> calamine, если установлен python-calamine (заметно быстрее openpyxl), иначе openpyxl"""
+    if name == "auto":
+        return "calamine" if importlib.util.find_spec("python_calamine") else "openpyxl"
+    return name
+
+def read_needs_sheet(filepath, sheet_name, engine):
+    """Задача для воркера: один лист Excel (или весь CSV при sheet_name=None) -> очищенная таблица"""
+    if sheet_name is None:
+        df = pd.read_csv(filepath)
+    else:
+        df = pd.read_excel(filepath, sheet_name=sheet_name, engine=engine)
+    return clean_and_check(df, os.path.basename(filepath))
+
+def list_sheet_tasks(filepath, engine):
+    if filepath.endswith('.csv'):
+        return [(filepath, None)]
+    with pd.ExcelFile(filepath, engine=engine) as xls:
+        return [(filepath, sheet) for sheet in xls.sheet_names if any(x in sheet for x in SHEET_MARKERS)]
+
+def load_needs_files(paths, engine, workers):
+    """Читает листы всех файлов в пуле процессов.
+
+    Возвращает {путь: [таблицы листов по порядку]} или {путь: Exception}. Листы, прочитанные
+    до ошибки, сохраняются в порядке файла, как и при последовательном чтении.
+    """
+    tasks, results = [], {}
+    for path in paths:
+        try:
+            tasks.extend(list_sheet_tasks(path, engine))
+            results[path] = []
+        except Exception as e:
+            results[path] = e
+
+    if workers > 1 and len(tasks) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            futures = [pool.submit(read_needs_sheet, path, sheet, engine) for path, sheet in tasks]
+            outcomes = []
+            for future in futures:
+                try:
+                    outcomes.append(future.result())
+                except Exception as e:
+                    outcomes.append(e)
+    else:
+        outcomes = []
+        for path, sheet in tasks:
+            try:
+                outcomes.append(read_needs_sheet(path, sheet, engine))
+            except Exception as e:
+                outcomes.append(e)
+
+    for (path, _), outcome in zip(tasks, outcomes):
+        if isinstance(results[path], Exception):
+            continue  # после первой ошибки остальные листы файла не берём
+        if isinstance(outcome, Exception):
+            results[path] = (results[path], outcome)
+        else:
+            results[path].append(outcome)
+    return results
+
+def load_needs(files, file_digests, engine, workers):
+    all_needs = []
+    paths = {f: os.path.join(project_dir, f) for f in files}
+    frames = {}
+    for filename in files:
+        df = read_cached_frame("needs", file_digests[filename])
+        if df is not None:
+            frames[filename] = df
+    if frames:
+        print(f"💾 Из кэша: {len(frames)} из {len(files)} файлов.")
+
+    to_read = [f for f in files if f not in frames]
+    loaded = load_needs_files([paths[f] for f in to_read], engine, workers)
+    for filename in to_read:
+        result = loaded[paths[filename]]
+        if isinstance(result, tuple):
+            # Ошибка посреди файла: листы до неё берём, но в кэш не пишем
+            partial, error = result
+            print(f"⚠️ Ошибка при загрузке {filename}: {error}")
+            frames[filename] = concat_needs(partial)
+        elif isinstance(result, Exception):
+            print(f"⚠️ Ошибка при загрузке {filename}: {result}")
+        else:
+            frames[filename] = concat_needs(result)
+            write_cached_frame(frames[filename], "needs", file_digests[filename])
+
+    for filename in files:
+        if filename in frames and len(frames[filename].columns):
+            all_needs.append(frames[filename])
+    return all_needs
 
 # --- 2. ОБРАБОТКА ---
-print(f"✅ Данные загружены. Обработка {len(needs_df)} строк...")
+def detect_store_types(tt):
+    """Darkstore, если в коде ТТ есть 'дс'"""
+    return map_unique(tt, lambda u: np.where(u.map(str).str.lower().str.contains("дс", regex=False),
+                                             "Darkstore", "Whitestore"), categorical=True)
 
-def detect_store_type(tt_str):
-    return "Darkstore" if "дс" in str(tt_str).lower() else "Whitestore"
+# --- РАСЧЕТ ЧАСОВ И ЗАРПЛАТЫ (векторно) ---
+# Время смены бывает строкой 'ЧЧ:ММ' или 'ЧЧ:ММ:СС', объектом time/datetime (ячейка Excel с форматом времени)
+# или долей суток (ячейка Excel без формата: 0.5 — полдень). Секунды отбрасываем, 24:00 — конец суток.
+TIME_RE = r'^\s*([0-9]{1,2})\s*:\s*([0-9]{1,2})(?:\s*:\s*[0-9]{2}(?:[.,][0-9]*)?)?\s*$'
 
-needs_df['Тип_По_ТТ'] = needs_df['ТТ'].apply(detect_store_type)
-needs_df['Дата_DT'] = pd.to_datetime(needs_df['Дата выхода'], dayfirst=True, errors='coerce')
+def _unique_minutes(u):
+    minutes = pd.Series(np.nan, index=u.index)
+    text = u.map(lambda v: isinstance(v, str)).to_numpy(dtype=bool)
+    if text.any():
+        parts = u[text].str.extract(TIME_RE).astype(float)
+        minutes[text] = (parts[0] * 60 + parts[1]).where(parts[1] < 60)
+    clock = u.map(lambda v: isinstance(v, (datetime.time, datetime.datetime))).to_numpy(dtype=bool)
+    if clock.any():
+        minutes[clock] = [v.hour * 60 + v.minute for v in u[clock].tolist()]
+    rest = ~text & ~clock | text & minutes.isna().to_numpy()
+    if rest.any():
+        plain = u[rest].map(lambda v: v if isinstance(v, (str, int, float, np.number)) and not isinstance(v, bool) else None)
+        fraction = pd.to_numeric(plain, errors='coerce')
+        minutes[rest] = (fraction.where((fraction >= 0) & (fraction < 1)) * 1440).round()
+    return minutes.where(minutes <= 24 * 60)
 
-# ==========================================
-# 📅 ФИЛЬТР ПО ДАТЕ (ТОЛЬКО СЕГОДНЯ И БУДУЩЕЕ)
-# ==========================================
-today = pd.Timestamp.now().normalize()
-rows_before = len(needs_df)
-needs_df = needs_df[needs_df['Дата_DT'] >= today]
-rows_after = len(needs_df)
-print(f"📅 Фильтр по дате: удалено {rows_before - rows_after} старых вакансий.")
-needs_df.sort_values(by=['ТТ', 'Должность', 'Дата_DT'], inplace=True)
-
-# --- РАСЧЕТ ЧАСОВ И ЗАРПЛАТЫ (оптимизация: векторизованные операции где возможно) ---
-def parse_time(time_str):
-    try:
-        h, m = map(int, str(time_str).split(':'))
-        return h + m / 60
-    except:
-        return np.nan
-
-needs_df['Start_Hour'] = needs_df['Начало смены'].apply(parse_time)
-needs_df['End_Hour'] = needs_df['Конец смены'].apply(parse_time)
-needs_df['Часы'] = np.where(needs_df['End_Hour'] < needs_df['Start_Hour'],
-                            (24 - needs_df['Start_Hour']) + needs_df['End_Hour'],
-                            needs_df['End_Hour'] - needs_df['Start_Hour'])
-needs_df['Часы'] = needs_df['Часы'].fillna(0.0)
-
-def get_pay_value(row):
-    """Считает чистую сумму за смену (число)"""
-    role = str(row['Должность'])
-    hours = row['Часы']
-    s_type = row['Тип_По_ТТ']
-
-    if "построчно" in role.lower():
-        return 0  # Сдельная, не считаем в сумму
-
-    rate = RATES_DS.get(role, 0) if s_type == "Darkstore" else RATES_WS.get(role, 0)
-    return int(hours * rate)
-
-def get_pay_str(row):
-    """Формирует строку для карточки"""
-    val = row['Pay_Numeric']
-    role = str(row['Должность'])
-    s_type = row['Тип_По_ТТ']
-    rate = RATES_DS.get(role, 0) if s_type == "Darkstore" else RATES_WS.get(role, 0)
-
-    if "построчно" in role.lower():
-        return "💰 Сдельная"
-    if val > 0:
-        return f"💰 {rate} ₽/ч (≈<b>{val}₽</b>)"
-    return "💰 Уточняйте"
-
-def get_role_icon(role):
-    role = role.lower()
-    if "грузчик" in role:
-        return "📦"
-    if "бариста" in role:
-        return "☕"
-    if "сборщик" in role:
-        return "🎒"
-    if "продавец" in role or "кассир" in role:
-        return "🛒"
-    return "🛒"
-
-needs_df['Pay_Numeric'] = needs_df.apply(get_pay_value, axis=1)  # Число для расчетов
-needs_df['Pay'] = needs_df.apply(get_pay_str, axis=1)  # Строка для карточки
-
-# Создаем "Полное имя для фильтра" (Иконка + Название) сразу, чтобы посчитать мин/макс
-needs_df['Icon'] = needs_df['Должность'].apply(get_role_icon)
-needs_df['Filter_Name'] = needs_df['Icon'] + " " + needs_df['Должность']
-
-# --- СБОР СТАТИСТИКИ ПО ЗАРПЛАТАМ ДЛЯ МЕНЮ ---
-salary_stats = needs_df[needs_df['Pay_Numeric'] > 0].groupby('Filter_Name')['Pay_Numeric'].agg(['min', 'max']).to_dict('index')
+def parse_minutes(series):
+    """Время смены -> минуты от начала суток (Int16), нераспознанное -> <NA>"""
+    return map_unique(series, _unique_minutes).astype(float).astype('Int16')
+
+def plain_number(value):
+    """270.0 -> 270: целая ставка выглядит в карточке и JSON как раньше; дробная (270.5) остаётся дробной"""
+    return int(value) if float(value).is_integer() else float(value)
+
+def rate_values(rates):
+    """Столбец ставок -> список для JSON (шаблон карточек, API) через plain_number"""
+    return map_unique(rates, lambda u: [plain_number(v) for v in u.tolist()]).tolist()
+
+def role_columns(roles, store_types):
+    """Свойства должностей по правилам: role_info считается на уникальную должность, по строкам раскладывается
+    по кодам должностей. -> (ставка, сдельная, иконка, имя фильтра «иконка + должность»)"""
+    codes, uniques = pd.factorize(roles, use_na_sentinel=False)
+    uniques = np.asarray(uniques, dtype=object)
+    info = np.array([role_info(role, role_rules) for role in uniques.tolist()], dtype=object).reshape(len(uniques), 4)
+    darkstore = (store_types == "Darkstore").to_numpy(dtype=bool)
+    rates = np.where(darkstore, info[:, 3].astype(float)[codes], info[:, 2].astype(float)[codes])
+
+    def by_code(table):
+        table_codes, categories = pd.factorize(table, sort=True)
+        return pd.Series(pd.Categorical.from_codes(table_codes[codes], categories=categories), index=roles.index)
+    return (pd.Series(rates, index=roles.index), pd.Series(info[:, 1].astype(bool)[codes], index=roles.index),
+            by_code(info[:, 0]), by_code(info[:, 0] + " " + np.array([str(r) for r in uniques.tolist()], dtype=object)))
+
+def get_pay_values(roles, hours, rates, piecework):
+    """Чистая сумма за смену (число); сдельную не считаем"""
+    return pd.Series(np.where(piecework, 0, np.trunc(hours * rates)), index=roles.index).astype(np.int32)
+
+def get_pay_strs(pay, rates, piecework):
+    """Строка оплаты для карточки. Различных (сдельная, ставка, сумма) немного: строим строки для них, результат — категория"""
+    codes, uniques = pd.MultiIndex.from_arrays([piecework.to_numpy(), rates.to_numpy(), pay.to_numpy()]).factorize()
+    u_piece, u_rate, u_pay = (uniques.get_level_values(i).to_numpy() for i in range(3))
+    hourly = ["💰 " + str(plain_number(r)) + " ₽/ч (≈<b>" + str(p) + "₽</b>)" for r, p in zip(u_rate.tolist(), u_pay.tolist())]
+    table = np.select([u_piece, u_pay > 0], [np.array("💰 Сдельная", dtype=object), np.array(hourly, dtype=object)],
+                      default="💰 Уточняйте")
+    return map_unique(pd.Series(codes, index=pay.index), lambda u: table[u.to_numpy(dtype=np.int64)], categorical=True)
+
+DEDUP_COLUMNS = ['ТТ', 'Должность', 'Дата выхода', 'Начало смены', 'Конец смены', 'Количество сотрудников']
+
+# Форматы дат в выгрузках; формат файла — тот, под который подошло больше всего его дат (при равенстве — первый)
+DATE_FORMATS = ["%d.%m.%Y", "%d.%m.%y", "%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y",
+                "%d.%m.%Y %H:%M:%S", "%d.%m.%Y %H:%M", "%Y-%m-%d %H:%M:%S"]
+DATE_SAMPLE = 1000  # уникальных дат файла, по которым выбираем формат
+
+def _date_strings(series):
+    codes, uniques = pd.factorize(series)
+    u = pd.Series(np.asarray(uniques, dtype=object), dtype=object)
+    return codes, u, u.map(lambda v: isinstance(v, str)).to_numpy(dtype=bool)
+
+def detect_date_format(series):
+    """Формат из DATE_FORMATS для строковых дат серии; None — строк нет (даты Excel) или ни один формат не подошёл"""
+    _, u, text = _date_strings(series)
+    sample = u[text].iloc[:DATE_SAMPLE].str.strip()
+    if sample.empty:
+        return None
+    counts = [pd.to_datetime(sample, format=fmt, errors='coerce').notna().sum() for fmt in DATE_FORMATS]
+    best = int(np.argmax(counts))
+    return DATE_FORMATS[best] if counts[best] else None
+
+def parse_dates(series, date_format=None):
+    """Дата -> datetime64 по уникальным значениям (для категорий pd.to_datetime вернул бы категорию).
+    Строки — по формату файла, без угадывания на каждой строке; не подошедшие к нему — по остальным DATE_FORMATS,
+    а даты Excel и прочее — как раньше, pd.to_datetime с dayfirst."""
+    codes, u, text = _date_strings(series)
+    parsed = pd.Series(pd.NaT, index=u.index, dtype="datetime64[ns]")
+    strings = u.where(text).str.strip()
+    for fmt in dict.fromkeys([date_format] + DATE_FORMATS if date_format else DATE_FORMATS):
+        rest = text & parsed.isna().to_numpy()
+        if not rest.any():
+            break
+        parsed[rest] = pd.to_datetime(strings[rest], format=fmt, errors='coerce')
+    rest = parsed.isna().to_numpy() & u.notna().to_numpy()
+    if rest.any():
+        parsed[rest] = pd.to_datetime(u[rest], dayfirst=True, errors='coerce', format="mixed")
+    table = np.append(parsed.to_numpy(dtype="datetime64[ns]"), np.datetime64("NaT", "ns"))  # код -1 (NaN) -> NaT
+    return pd.Series(table[codes], index=series.index)
+
+def add_store_types(needs_df):
+    needs_df['Тип_По_ТТ'] = detect_store_types(needs_df['ТТ'])
+    return needs_df
+
+def is_actual(needs_df):
+    """Только сегодня и будущее"""
+    return needs_df['Дата_DT'] >= pd.Timestamp.now().normalize()
+
+def prepare_needs(needs_df):
+    # ==========================================
+    # 🔥 УДАЛЕНИЕ ДУБЛИКАТОВ
+    # ==========================================
+    print(f"📊 Всего строк до очистки: {len(needs_df)}")
+    with stage("dedup") as st:
+        dedup_cols = [col for col in DEDUP_COLUMNS if col in needs_df.columns]
+        needs_df.drop_duplicates(subset=dedup_cols, keep='first', inplace=True)
+        st["rows"] = len(needs_df)
+    print(f"✨ Строк после удаления дублей: {len(needs_df)}")
+
+    print(f"✅ Данные загружены. Обработка {len(needs_df)} строк...")
+    with stage("date filter") as st:
+        needs_df = add_store_types(needs_df)
+
+        # ==========================================
+        # 📅 ФИЛЬТР ПО ДАТЕ (ТОЛЬКО СЕГОДНЯ И БУДУЩЕЕ)
+        # ==========================================
+        rows_before = len(needs_df)
+        needs_df = needs_df[is_actual(needs_df)]
+        rows_after = st["rows"] = len(needs_df)
+        needs_df = needs_df.sort_values(by=['ТТ', 'Должность', 'Дата_DT'])
+    print(f"📅 Фильтр по дате: удалено {rows_before - rows_after} старых вакансий.")
+    with stage("pay calc") as st:
+        needs_df = add_pay_columns(needs_df)
+        st["rows"] = len(needs_df)
+    return needs_df
+
+def add_pay_columns(needs_df):
+    needs_df['Start_Min'] = parse_minutes(needs_df['Начало смены'])
+    needs_df['End_Min'] = parse_minutes(needs_df['Конец смены'])
+    start, end = needs_df['Start_Min'].astype(float), needs_df['End_Min'].astype(float)
+    # Конец раньше начала — смена через полночь: заканчивается на следующий день
+    length = end - start + np.where(end < start, 24 * 60, 0)
+    needs_df['Start_DT'] = needs_df['Дата_DT'] + pd.to_timedelta(start, unit='min')
+    needs_df['End_DT'] = needs_df['Start_DT'] + pd.to_timedelta(length, unit='min')
+    # Часы — как в исходной версии, ч + мин/60 (а не минуты/60): оплата усекается до рубля, и разница
+    # в последнем знаке дробной части меняет её на рубль (0:00–1:40 по 270 ₽ — 449, а не 450)
+    start_h, end_h = start // 60 + start % 60 / 60, end // 60 + end % 60 / 60
+    needs_df['Часы'] = pd.Series(np.where(end_h < start_h, (24 - start_h) + end_h, end_h - start_h),
+                                 index=needs_df.index).fillna(0.0)
+
+    # Создаем "Полное имя для фильтра" (Иконка + Название) сразу, чтобы посчитать мин/макс
+    rates, piecework, needs_df['Icon'], needs_df['Filter_Name'] = role_columns(needs_df['Должность'], needs_df['Тип_По_ТТ'])
+    needs_df['Pay_Numeric'] = get_pay_values(needs_df['Должность'], needs_df['Часы'], rates, piecework)  # Число для расчетов
+    needs_df['Pay'] = get_pay_strs(needs_df['Pay_Numeric'], rates, piecework)  # Строка для карточки
+    needs_df['Rate'] = rates.where(~piecework, -1)  # Ставка для шаблона карточек и API; -1 — сдельная
+    return needs_df
+
+def salary_ranges(df):
+    """Вилка оплаты по фильтрам для меню: {фильтр: {'min': ..., 'max': ...}}"""
+    return df[df['Pay_Numeric'] > 0].groupby('Filter_Name', observed=True)['Pay_Numeric'].agg(['min', 'max']).to_dict('index')
 
 # --- 3. MERGE С КООРДИНАТАМИ ---
+# Реестр магазинов: строится из файла координат один раз и хранится в кэше (pickle, грузится за миллисекунды).
+#   keys    — нормализованный код ТТ -> строка реестра (точное совпадение)
+#   numbers — номер магазина (цифры в начале кода) -> строка, если номер однозначный (нечёткое совпадение)
+#   grid    — сетка по координатам для запросов "ближайший магазин" и "магазины в радиусе"
+GRID_CELL_DEG = 0.02  # ~2 км по широте
+EARTH_RADIUS_KM = 6371.0
+
 def extract_tt(desc):
     m = re.search(r'Код ТТ:\s*([^\n\r"]+)', str(desc))
     return m.group(1).strip() if m else None
 
-coords_df['JOIN_KEY'] = coords_df['Описание'].apply(extract_tt)
-coords_clean = coords_df.drop_duplicates('JOIN_KEY')[['JOIN_KEY', 'Широта', 'Долгота', 'Адрес']]
-full_data = needs_df.merge(coords_clean, left_on='ТТ', right_on='JOIN_KEY', how='left').dropna(subset=['Широта'])
+def _normalize_unique_tt(raw):
+    clean = raw.map(str).str.lower().str.replace("ё", "е", regex=False).str.replace(r"\s+", "", regex=True)
+    return clean.str.replace(r"[_\-()]*дс\)?$", "", regex=True)
 
-# ==========================================
-# 📍 ФИЛЬТР ПО МОСКВЕ И МО
-# ==========================================
-full_data = full_data[
-    (full_data['Широта'] > 54.0) & (full_data['Широта'] < 57.5) &
-    (full_data['Долгота'] > 35.0) & (full_data['Долгота'] < 41.0)
-]
+def normalize_tt(series):
+    """Ключ для сопоставления кодов ТТ: регистр, пробелы и хвост 'дс' не важны"""
+    return map_unique(series, _normalize_unique_tt)
 
-def make_card_html(row):
-    d_str = row['Дата_DT'].strftime('%d.%m') if not pd.isna(row['Дата_DT']) else str(row['Дата выхода'])
-    lat, lon = row['Широта'], row['Долгота']
-
-    wa_text = (f"Здравствуйте! Хочу записаться на смену.\n"
-               f"💼 Должность: {row['Должность']}\n"
-               f"📍 Адрес: {row['Адрес']}\n"
-               f"📅 Дата: {d_str}\n"
-               f"🕒 Время: {row['Начало смены']} - {row['Конец смены']}")
-
-    wa_encoded = urllib.parse.quote(wa_text)
-    wa_link = f"https://wa.me/79152977432?text={wa_encoded}"
-    w_nav = f"https://yandex.ru/maps/?rtext=~{lat},{lon}&rtt=mt"
-
-    return (f"<div style='margin-bottom:12px; border-bottom:1px solid #eee; padding-bottom:8px; font-family:sans-serif;'>"
-            f"📅 <b>{d_str}</b> | 👤 {row['Количество сотрудников']} чел.<br>"
-            f"🕒 {row['Начало смены']} - {row['Конец смены']} | {row['Pay']}<br>"
-            f"<div style='margin-top:8px; display:flex; flex-direction:column; gap:8px;'>"
-            f"<a href='{wa_link}' target='_blank' style='background:#25D366; color:white; padding:10px; border-radius:6px; text-decoration:none; font-weight:bold; text-align:center;'>📝 Записаться через WhatsApp</a>"
-            f"<a href='{w_nav}' target='_blank' style='background:#f0f0f0; color:black; border:1px solid #ccc; padding:8px; border-radius:6px; text-decoration:none; font-size:14px; text-align:center;'>📍 Построить маршрут</a>"
-            f"<div style='display:flex; gap:5px; margin-top:5px;'>"
-            f" <button onclick='openInfo()' style='flex:1; background:#007bff; color:white; border:none; padding:8px; border-radius:6px; cursor:pointer; font-weight:bold; font-size:12px;'>ℹ️ Инфо</button>"
-            f" <button onclick='openWhatsAppWithGreeting()' style='flex:1; background:#128c7e; color:white; border:none; padding:8px; border-radius:6px; cursor:pointer; font-weight:bold; font-size:12px;'>📞 Менеджер</button>"
-            f"</div>"
-            f"</div></div>")
-
-full_data['HTML_Card'] = full_data.apply(make_card_html, axis=1)
-
-# Группируем для карты, добавляем Filter_Name чтобы знать тип
-grouped = full_data.groupby(['ТТ', 'Должность', 'Filter_Name', 'Широта', 'Долгота', 'Адрес', 'Тип_По_ТТ'])['HTML_Card'].apply(''.join).reset_index()
+def store_numbers(series):
+    return map_unique(series, lambda u: u.map(str).str.extract(r"^\s*(\d+)")[0])
+
+def _grid_cells(lat, lon):
+    return np.floor(np.asarray(lat) / GRID_CELL_DEG).astype(np.int64), np.floor(np.asarray(lon) / GRID_CELL_DEG).astype(np.int64)
+
+def build_store_registry(coords_df):
+    coords_df = coords_df.copy()
+    coords_df['JOIN_KEY'] = coords_df['Описание'].apply(extract_tt)
+    # Дубли кода: берём первую строку, у которой есть координаты
+    stores = coords_df.dropna(subset=['JOIN_KEY', 'Широта', 'Долгота']).drop_duplicates('JOIN_KEY').reset_index(drop=True)
+
+    keys, numbers = {}, {}
+    for row, (key, number) in enumerate(zip(normalize_tt(stores['JOIN_KEY']), store_numbers(stores['JOIN_KEY']))):
+        keys.setdefault(key, row)
+        if isinstance(number, str):
+            numbers[number] = row if number not in numbers else -1  # -1: номер встречается у нескольких ТТ
+
+    lat, lon = stores['Широта'].to_numpy(float), stores['Долгота'].to_numpy(float)
+    return {
+        "codes": stores['JOIN_KEY'].to_numpy(object), "address": stores['Адрес'].to_numpy(object),
+        "lat": lat, "lon": lon, "keys": keys, "numbers": {n: r for n, r in numbers.items() if r >= 0},
+        "grid": build_grid(lat, lon),
+    }
+
+def build_grid(lat, lon):
+    """Сетка GRID_CELL_DEG: ячейка -> номера точек; годится для stores_within/nearest_stores/rows_in_bbox
+    (им нужны только ключи grid, lat и lon)"""
+    cell_lat, cell_lon = _grid_cells(lat, lon)
+    grid = {}
+    for row, cell in enumerate(zip(cell_lat.tolist(), cell_lon.tolist())):
+        grid.setdefault(cell, []).append(row)
+    return {cell: np.array(rows) for cell, rows in grid.items()}
+
+def load_store_registry(coords_filename, digest):
+    path = _registry_path(digest)
+    if use_cache and os.path.exists(path):
+        try:
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except (OSError, pickle.PickleError, EOFError) as e:
+            print(f"⚠️ Кэш реестра повреждён: {e}")
+    coords_df = pd.read_csv(os.path.join(project_dir, coords_filename))
+    coords_df.columns = [c.strip() for c in coords_df.columns]
+    registry = build_store_registry(coords_df)
+    if use_cache:
+        write_atomic(path, pickle.dumps(registry, protocol=pickle.HIGHEST_PROTOCOL))
+    return registry
+
+def match_stores(registry, tt):
+    """Строка реестра для каждого кода ТТ (-1 — не найден) и способ сопоставления"""
+    by_key = normalize_tt(tt).map(registry["keys"])
+    by_number = store_numbers(tt).map(registry["numbers"])
+    rows = by_key.fillna(by_number).fillna(-1).astype(np.int64)
+    how = np.select([by_key.notna(), by_number.notna()], ["exact", "number"], default="")
+    rows[tt.isna()] = -1
+    return rows, how
+
+def canonicalize_tt(needs_df, registry):
+    """Коды ТТ -> код магазина из реестра (как в файле координат): тип магазина, дубли и точки карты считаются
+    по магазину, а не по написанию ('6737' и '6737ДС_…' — один даркстор). Ненайденные коды остаются как есть.
+    Меняет needs_df на месте; -> сколько строк найдено только по номеру магазина"""
+    def canonical(u):
+        rows = match_stores(registry, u)[0].to_numpy()
+        return np.where(rows >= 0, registry["codes"][np.maximum(rows, 0)], u.to_numpy(dtype=object))
+    _, how = match_stores(registry, needs_df['ТТ'])
+    needs_df['ТТ'] = map_unique(needs_df['ТТ'], canonical, categorical=True)
+    return int((how == "number").sum())
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+def stores_within(registry, lat, lon, radius_km):
+    """Магазины в радиусе radius_km: (строки реестра, расстояния), по возрастанию расстояния"""
+    d_lat = radius_km / 111.0
+    d_lon = radius_km / (111.0 * max(np.cos(np.radians(lat)), 0.01))
+    (lat0, lat1), (lon0, lon1) = _grid_cells([lat - d_lat, lat + d_lat], [lon - d_lon, lon + d_lon])
+    cells = [registry["grid"].get((i, j)) for i in range(lat0, lat1 + 1) for j in range(lon0, lon1 + 1)]
+    cells = [c for c in cells if c is not None]
+    if not cells:
+        return np.array([], dtype=np.int64), np.array([])
+    rows = np.concatenate(cells)
+    dist = haversine_km(lat, lon, registry["lat"][rows], registry["lon"][rows])
+    keep = dist <= radius_km
+    order = np.argsort(dist[keep], kind="stable")
+    return rows[keep][order], dist[keep][order]
+
+def rows_in_bbox(registry, lat_min, lon_min, lat_max, lon_max):
+    """Точки внутри прямоугольника, по возрастанию номера"""
+    (lat0, lat1), (lon0, lon1) = _grid_cells([lat_min, lat_max], [lon_min, lon_max])
+    if (lat1 - lat0 + 1) * (lon1 - lon0 + 1) > len(registry["grid"]):
+        cells = list(registry["grid"].values())  # прямоугольник больше всей сетки — дешевле перебрать точки
+    else:
+        cells = [registry["grid"].get((i, j)) for i in range(lat0, lat1 + 1) for j in range(lon0, lon1 + 1)]
+        cells = [c for c in cells if c is not None]
+    if not cells:
+        return np.array([], dtype=np.int64)
+    rows = np.sort(np.concatenate(cells))
+    lat, lon = registry["lat"][rows], registry["lon"][rows]
+    return rows[(lat >= lat_min) & (lat <= lat_max) & (lon >= lon_min) & (lon <= lon_max)]
+
+def nearest_stores(registry, lat, lon, k=1, max_radius_km=200.0):
+    """k ближайших магазинов: радиус поиска удваивается, пока в круг не попадёт k магазинов"""
+    radius = GRID_CELL_DEG * 111.0
+    while True:
+        rows, dist = stores_within(registry, lat, lon, radius)
+        if len(rows) >= k or radius >= max_radius_km:
+            return rows[:k], dist[:k]
+        radius *= 2
+
+def load_regions():
+    """Регионы из REGIONS_FILE (проверенные, с zoom/manager/dir по умолчанию) или DEFAULT_REGIONS.
+    Ошибка в файле -> ValueError с понятным текстом."""
+    path = os.path.join(project_dir, REGIONS_FILE)
+    if not os.path.exists(path):
+        return DEFAULT_REGIONS
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    if not isinstance(config, list) or not config:
+        raise ValueError("нужен непустой список регионов")
+    regions, dirs = [], {DATA_DIR, ASSETS_DIR}
+    for i, raw in enumerate(config):
+        name = str(raw.get("name", "")) if isinstance(raw, dict) else ""
+        if not re.fullmatch(r"[\w-]+", name):
+            raise ValueError(f"регион №{i + 1}: имя — буквы, цифры, '-' или '_'")
+        try:
+            region = {"name": name, "center": [float(v) for v in raw["center"]], "zoom": int(raw.get("zoom", 10)),
+                      "manager": re.sub(r"\D", "", str(raw.get("manager", MANAGER_PHONE))),
+                      "dir": str(raw.get("dir", "" if i == 0 else name)).strip("/")}
+            if ("bbox" in raw) == ("polygon" in raw):
+                raise ValueError("нужен ровно один из bbox или polygon")
+            if "bbox" in raw:
+                region["bbox"] = [float(v) for v in raw["bbox"]]
+            else:
+                region["polygon"] = [[float(lat), float(lon)] for lat, lon in raw["polygon"]]
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"регион {name}: {e}") from None
+        if len(region["center"]) != 2 or len(region.get("bbox", [0] * 4)) != 4 or len(region.get("polygon", [0] * 3)) < 3:
+            raise ValueError(f"регион {name}: center — [широта, долгота], bbox — 4 числа, polygon — от 3 вершин")
+        if region["dir"] != "" and (region["dir"] in dirs or not re.fullmatch(r"[\w-]+(/[\w-]+)*", region["dir"])):
+            raise ValueError(f"регион {name}: папка '{region['dir']}' занята или недопустима")
+        if region["dir"] == "" and "" in dirs:
+            raise ValueError(f"регион {name}: в корне сайта уже другой регион")
+        dirs.add(region["dir"])
+        regions.append(region)
+    return regions
+
+def point_in_polygon(lat, lon, polygon):
+    """Чётно-нечётное правило: луч от точки на восток пересекает границу нечётное число раз — точка внутри.
+    Цикл по рёбрам многоугольника (их десятки), по точкам — векторно."""
+    lat, lon = np.asarray(lat, dtype=float), np.asarray(lon, dtype=float)
+    vertices = np.asarray(polygon, dtype=float)
+    inside = np.zeros(len(lat), dtype=bool)
+    for (lat1, lon1), (lat2, lon2) in zip(vertices.tolist(), np.roll(vertices, -1, axis=0).tolist()):
+        if lat1 == lat2:
+            continue  # горизонтальное ребро луч не пересекает
+        crosses = (lat1 > lat) != (lat2 > lat)
+        inside ^= crosses & (lon < lon1 + (lat - lat1) * (lon2 - lon1) / (lat2 - lat1))
+    return inside
+
+def in_region(lat, lon, region):
+    if "polygon" in region:
+        return point_in_polygon(lat, lon, region["polygon"])
+    lat_min, lon_min, lat_max, lon_max = region["bbox"]
+    return (lat > lat_min) & (lat < lat_max) & (lon > lon_min) & (lon < lon_max)
+
+def assign_regions(lat, lon, regions):
+    """Номер региона для каждой точки (первый подходящий по порядку), -1 — вне всех регионов; NaN — тоже -1"""
+    lat, lon = np.asarray(lat, dtype=float), np.asarray(lon, dtype=float)
+    codes = np.full(len(lat), -1, dtype=np.int64)
+    for i, region in enumerate(regions):
+        free = codes < 0
+        codes[free & in_region(lat, lon, region)] = i
+    return codes
+
+def report_unmatched(counts, fuzzy):
+    """counts — число строк по каждому коду ТТ без координат"""
+    if fuzzy:
+        print(f"🔎 Сопоставлено по номеру магазина: {fuzzy} строк.")
+    if counts.empty:
+        return
+    counts = counts.sort_values(ascending=False, kind="stable")
+    unmatched = int(counts.sum())
+    with atomic_path(os.path.join(project_dir, "unmatched_tt.csv")) as tmp:
+        counts.rename_axis('ТТ').reset_index(name='Строк').to_csv(tmp, index=False)
+    print(f"⚠️ Нет координат для {len(counts)} кодов ТТ ({unmatched} строк), список в unmatched_tt.csv: "
+          + ", ".join(counts.index[:5].map(str)) + ("..." if len(counts) > 5 else ""))
+
+def attach_coords(needs_df, registry):
+    """-> (строки с координатами в пределах регионов, число строк по ненайденным кодам ТТ).
+    Коды ТТ уже приведены canonicalize_tt. Номер региона строки — в столбце 'Регион' (registry["region"] заполняет load_registry)."""
+    with stage("merge") as st:
+        rows, _ = match_stores(registry, needs_df['ТТ'])
+        unmatched = needs_df.loc[(rows < 0).to_numpy() & needs_df['ТТ'].notna().to_numpy(), 'ТТ'].value_counts()
+        unmatched = unmatched[unmatched > 0]  # у категорий value_counts перечисляет и отсутствующие коды
+        found = (rows >= 0).to_numpy()
+        full_data = needs_df[found].reset_index(drop=True)
+        idx = rows.to_numpy()[found]
+        full_data['JOIN_KEY'] = registry["codes"][idx]
+        full_data['Широта'] = registry["lat"][idx]
+        full_data['Долгота'] = registry["lon"][idx]
+        full_data['Адрес'] = registry["address"][idx]
+        full_data['Регион'] = registry["region"][idx]
+        st["rows"] = len(full_data)
+
+    # ==========================================
+    # 📍 ФИЛЬТР ПО РЕГИОНАМ
+    # ==========================================
+    with stage("geo filter") as st:
+        full_data = full_data[full_data['Регион'].to_numpy() >= 0]
+        st["rows"] = len(full_data)
+    return full_data, unmatched
+
+def merge_coords(needs_df, registry, fuzzy=0):
+    full_data, unmatched = attach_coords(needs_df, registry)
+    report_unmatched(unmatched, fuzzy)
+    return full_data
+
+def quote_unique(series):
+    """urllib.parse.quote по уникальным значениям (quote работает посимвольно, поэтому части можно кодировать отдельно)"""
+    return map_unique(series, lambda u: u.map(lambda v: urllib.parse.quote(str(v))))
+
+def concat_columns(index, *parts):
+    """Склеивает строки и строковые столбцы за один проход (без промежуточных Series на каждый '+')"""
+    columns = [np.asarray(p, dtype=object) if isinstance(p, pd.Series) else [p] * len(index) for p in parts]
+    return pd.Series(["".join(row) for row in zip(*columns)], index=index, dtype=object)
+
+def card_dates(df):
+    """Дата смены для карточки: 'ДД.ММ', а если дата не распозналась — как в исходном файле"""
+    dates = map_unique(df['Дата_DT'], lambda u: pd.to_datetime(u).dt.strftime('%d.%m'))
+    return dates.where(df['Дата_DT'].notna(), as_str(df['Дата выхода']))
+
+def make_card_html(df, manager=MANAGER_PHONE):
+    """HTML карточек смен для всех строк сразу; manager — WhatsApp менеджера региона"""
+    d_str = card_dates(df)
+    start, end = as_str(df['Начало смены']), as_str(df['Конец смены'])
+    q = urllib.parse.quote
+
+    return concat_columns(
+        df.index,
+        "<div style='margin-bottom:12px; border-bottom:1px solid #eee; padding-bottom:8px; font-family:sans-serif;'>"
+        "📅 <b>", d_str, "</b> | 👤 ", as_str(df['Количество сотрудников']), " чел.<br>"
+        "🕒 ", start, " - ", end, " | ", as_str(df['Pay']), "<br>"
+        "<div style='margin-top:8px; display:flex; flex-direction:column; gap:8px;'>"
+        f"<a href='https://wa.me/{manager}?text=" + q("Здравствуйте! Хочу записаться на смену.\n💼 Должность: "), quote_unique(df['Должность']),
+        q("\n📍 Адрес: "), quote_unique(df['Адрес']),
+        q("\n📅 Дата: "), quote_unique(d_str),
+        q("\n🕒 Время: "), quote_unique(df['Начало смены']), q(" - "), quote_unique(df['Конец смены']),
+        "' target='_blank' style='background:#25D366; color:white; padding:10px; border-radius:6px; text-decoration:none; font-weight:bold; text-align:center;'>📝 Записаться через WhatsApp</a>"
+        "<a href='https://yandex.ru/maps/?rtext=~", as_str(df['Широта']), ",", as_str(df['Долгота']), "&rtt=mt"
+        "' target='_blank' style='background:#f0f0f0; color:black; border:1px solid #ccc; padding:8px; border-radius:6px; text-decoration:none; font-size:14px; text-align:center;'>📍 Построить маршрут</a>"
+        "<div style='display:flex; gap:5px; margin-top:5px;'>"
+        " <button onclick='openInfo()' style='flex:1; background:#007bff; color:white; border:none; padding:8px; border-radius:6px; cursor:pointer; font-weight:bold; font-size:12px;'>ℹ️ Инфо</button>"
+        " <button onclick='openWhatsAppWithGreeting()' style='flex:1; background:#128c7e; color:white; border:none; padding:8px; border-radius:6px; cursor:pointer; font-weight:bold; font-size:12px;'>📞 Менеджер</button>"
+        "</div>"
+        "</div></div>")
+
+# Группируем для карты, добавляем Filter_Name чтобы знать тип.
+# Карточки перерисовываем только для групп, чьи строки изменились с прошлого запуска.
+GROUP_COLUMNS = ['ТТ', 'Должность', 'Filter_Name', 'Широта', 'Долгота', 'Адрес', 'Тип_По_ТТ']
+CARD_COLUMNS = ['Дата_DT', 'Дата выхода', 'Количество сотрудников', 'Начало смены', 'Конец смены', 'Pay',
+                'Должность', 'Адрес', 'Широта', 'Долгота']
+
+def group_cards(full_data, region):
+    with stage("card render"):
+        old_cards, cards = load_card_cache(region["name"]), {}
+    grouped, stale = render_cards(full_data, old_cards, cards, region["manager"])
+    with stage("card render"):
+        save_card_cache(cards, region["name"])
+    print(f"🧩 Карточки: перерисовано {stale} из {len(grouped)} групп.")
+    return grouped
+
+def render_cards(full_data, old_cards, cards, manager=MANAGER_PHONE):
+    """Группы с готовым HTML_Card; карточки из old_cards переиспользуются, все актуальные попадают в cards
+    (cards=None — не собирать, как в режиме --stream). Возвращает (группы, сколько перерисовано).
+    Телефон менеджера входит в ключ карточки: он есть в её HTML и у каждого региона свой; отпечаток кода
+    карточки — чтобы после правки шаблона карточки перерисовывались."""
+    salt = (card_fingerprint() + manager).encode()
+    with stage("grouping") as st:
+        full_data = full_data.assign(Row_Hash=pd.util.hash_pandas_object(full_data[CARD_COLUMNS], index=False).to_numpy())
+        groups = full_data.groupby(GROUP_COLUMNS, observed=True)
+        grouped = groups['Row_Hash'].agg(
+            lambda h: hashlib.sha1(salt + h.to_numpy().tobytes()).hexdigest()).reset_index(name='Card_Key')
+        group_ids = groups.ngroup()
+        st["rows"] = len(grouped)
+
+    with stage("card render") as st:
+        card_keys = grouped['Card_Key'].to_numpy()
+        stale = np.flatnonzero(~grouped['Card_Key'].isin(old_cards).to_numpy())
+        stale_rows = full_data[group_ids.isin(stale)]
+        rendered = make_card_html(stale_rows, manager).groupby(group_ids[stale_rows.index]).agg(''.join)
+        current = {key: old_cards[key] for key in card_keys if key in old_cards}
+        current.update((card_keys[g], html) for g, html in rendered.items())
+        grouped['HTML_Card'] = [current[key] for key in card_keys]
+        grouped['Times'] = group_times(full_data, group_ids, len(grouped))
+        st["rows"] = len(stale_rows)
+    if cards is not None:
+        cards.update(current)
+    return grouped, len(stale)
+
+def group_shifts(full_data):
+    """Режим --cards template: вместо HTML у группы только список смен [дата, начало, конец, чел., ставка, сумма].
+    Карточки и ссылки собирает JS страницы при открытии балуна; ставка -1 означает сдельную оплату."""
+    with stage("grouping") as st:
+        groups = full_data.groupby(GROUP_COLUMNS, observed=True)
+        grouped = groups.size().reset_index(name='Shifts_Total')
+        group_ids = groups.ngroup()
+
+        shifts = pd.Series(list(zip(card_dates(full_data), as_str(full_data['Начало смены']), as_str(full_data['Конец смены']),
+                                    as_str(full_data['Количество сотрудников']), rate_values(full_data['Rate']), full_data['Pay_Numeric'].tolist())),
+                           index=full_data.index, dtype=object)
+        per_group = shifts[group_ids.notna()].groupby(group_ids).agg(list)
+        grouped['Shifts'] = [[list(s) for s in per_group[g]] for g in range(len(grouped))]
+        grouped['Times'] = group_times(full_data, group_ids, len(grouped))
+        st["rows"] = len(grouped)
+    return grouped
+
+def group_times(full_data, group_ids, n_groups):
+    """Начало и конец смен каждой группы для индекса по времени: массив (смен, 2) минут от 1970-01-01
+    по местному времени магазина. Как и в API, смена с нераспознанным временем считается с полуночи своего дня
+    и нулевой длины (попадает в «на дату», но не в «идут сейчас»); без даты в индекс не попадает."""
+    ids = group_ids.to_numpy(dtype=float)
+    start = full_data['Start_DT'].to_numpy(dtype='datetime64[m]')
+    start = np.where(np.isnat(start), full_data['Дата_DT'].to_numpy(dtype='datetime64[m]'), start)
+    end = full_data['End_DT'].to_numpy(dtype='datetime64[m]')
+    end = np.where(np.isnat(end), start, end)
+    valid = ~np.isnan(ids) & ~np.isnat(start)
+    ids = ids[valid].astype(np.int64)
+    order = np.argsort(ids, kind='stable')
+    pairs = np.column_stack([start[valid].astype(np.int64), end[valid].astype(np.int64)])[order]
+    bounds = np.searchsorted(ids[order], np.arange(n_groups + 1)).tolist()
+    return [pairs[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
 
 # --- 4. СБОРКА WEB КАРТЫ ---
-print("\n🚀 Генерируем обновленный интерфейс...")
-features = []
-filter_counts = Counter()
-
-for idx, row in grouped.iterrows():
-    role = row['Должность']
-    filter_name = row['Filter_Name']
-    store_type = "DS" if row['Тип_По_ТТ'] == "Darkstore" else "WS"
-
-    filter_counts[filter_name] += 1
-
-    features.append({
-        "type": "Feature",
-        "id": idx,
-        "geometry": {"type": "Point", "coordinates": [row['Широта'], row['Долгота']]},
-        "properties": {
-            "balloonContentHeader": f"<b style='font-size:16px'>{role}</b> ({store_type})<br><span style='color:grey;font-size:13px'>{row['Адрес']}</span>",
-            "balloonContentBody": f"<div style='max-height:300px; overflow-y:auto; font-size:14px'>{row['HTML_Card']}</div>",
-            "clusterCaption": str(idx),
-            "hintContent": role,
-            "filterType": filter_name
-        }
-    })
+# Признаки точек собираем по столбцам: таблица id/координаты/подсказка/фильтр + содержимое балуна,
+# а JSON склеиваем из заранее закодированных столбцов (json_column) — без словаря и json.dumps на каждую строку.
+def build_features(grouped, cards="html", first_id=0):
+    """-> (таблица признаков, Counter точек по фильтрам)"""
+    index = grouped.index
+    features = pd.DataFrame({
+        "id": np.arange(first_id, first_id + len(grouped), dtype=np.int64),
+        "lat": grouped['Широта'].to_numpy(float),
+        "lon": grouped['Долгота'].to_numpy(float),
+        "hintContent": as_str(grouped['Должность']).to_numpy(),
+        "filterType": as_str(grouped['Filter_Name']).to_numpy(),
+    }, index=index)
+    store_type = pd.Series(np.where(grouped['Тип_По_ТТ'] == "Darkstore", "DS", "WS"), index=index, dtype=object)
+    address = as_str(grouped['Адрес'])
+    if 'Times' in grouped:
+        features["times"] = grouped['Times']  # не в JSON точки, а в индекс по времени (write_time_index)
+
+    if cards == "template":
+        features["store"] = store_type
+        features["address"] = address
+        features["shifts"] = grouped['Shifts']
+    else:
+        features["header"] = concat_columns(index, "<b style='font-size:16px'>", features["hintContent"], "</b> (", store_type,
+                                            ")<br><span style='color:grey;font-size:13px'>", address, "</span>")
+        features["body"] = concat_columns(index, "<div style='max-height:300px; overflow-y:auto; font-size:14px'>",
+                                          grouped['HTML_Card'], "</div>")
 
-json_data = json.dumps({"type": "FeatureCollection", "features": features}, ensure_ascii=False)
+    counts = features["filterType"].value_counts(sort=False)
+    return features.reset_index(drop=True), Counter({name: int(n) for name, n in counts.items() if n})
 
 # === ГЕНЕРАЦИЯ КНОПОК С ЗАРПЛАТОЙ ===
-buttons_html = ""
-sorted_filters = sorted(filter_counts.items())
+def build_buttons(filter_counts, salary_stats):
+    buttons_html = ""
+    sorted_filters = sorted(filter_counts.items())
 
-for name, count in sorted_filters:
-    stats = salary_stats.get(name)
+    for name, count in sorted_filters:
+        stats = salary_stats.get(name)
 
-    salary_text = ""
-    daily_pay_label = ""
+        salary_text = ""
+        daily_pay_label = ""
 
-    if stats:
-        min_p = stats['min']
-        max_p = stats['max']
-        if min_p == max_p:
-            salary_text = f"<span style='display:block; font-size:11px; color:#555; margin-top:2px;'>💰 {min_p} ₽/смена</span>"
-        else:
-            salary_text = f"<span style='display:block; font-size:11px; color:#555; margin-top:2px;'>💰 от {min_p} до {max_p} ₽</span>"
+        if stats:
+            min_p = stats['min']
+            max_p = stats['max']
+            if min_p == max_p:
+                salary_text = f"<span style='display:block; font-size:11px; color:#555; margin-top:2px;'>💰 {min_p} ₽/смена</span>"
+            else:
+                salary_text = f"<span style='display:block; font-size:11px; color:#555; margin-top:2px;'>💰 от {min_p} до {max_p} ₽</span>"
 
-        daily_pay_label = "<span style='display:block; font-size:10px; color:#128c7e; font-weight:bold;'>⚡ оплата ежедневно</span>"
-    elif "построчно" in name.lower():
-        salary_text = "<span style='display:block; font-size:11px; color:#555; margin-top:2px;'>💰 Сдельная оплата</span>"
-        daily_pay_label = "<span style='display:block; font-size:10px; color:#128c7e; font-weight:bold;'>⚡ оплата ежедневно</span>"
+            daily_pay_label = "<span style='display:block; font-size:10px; color:#128c7e; font-weight:bold;'>⚡ оплата ежедневно</span>"
+        elif "построчно" in name.lower():
+            salary_text = "<span style='display:block; font-size:11px; color:#555; margin-top:2px;'>💰 Сдельная оплата</span>"
+            daily_pay_label = "<span style='display:block; font-size:10px; color:#128c7e; font-weight:bold;'>⚡ оплата ежедневно</span>"
 
-    buttons_html += f'''
-    <button class="filter-btn" onclick="filterMap('{name}', this)">
+        buttons_html += f'''
+    <button class="filter-btn" data-filter="{name}" onclick="filterMap('{name}', this)">
         <div style="display:flex; flex-direction:column; align-items:flex-start;">
             <span class="btn-text">{name}</span>
             {salary_text}
@@ -306,86 +1281,493 @@ for name, count in sorted_filters:
         <span class="badge">{count}</span>
     </button>
     '''
+    return buttons_html
 
-total_points = len(grouped)
-html_template = f"""<!DOCTYPE html>
-<html>
-<head>
-    <title>Работа - Карта Смен</title>
-    <meta charset="utf-8" />
-    <meta name="viewport" content="width=device-width, initial-scale=1.0, maximum-scale=1.0, user-scalable=no">
-    <script src="https://api-maps.yandex.ru/2.1/?apikey={API_KEY}&lang=ru_RU"></script>
-    <style>
-        body, html {{ padding: 0; margin: 0; width: 100%; height: 100%; font-family: -apple-system, BlinkMacSystemFont, Roboto, Helvetica, Arial, sans-serif; }}
-        #map {{ width: 100%; height: 100%; }}
-        #menu-trigger {{
+# ==========================================
+# 🌊 ПОТОКОВЫЙ РЕЖИМ (--stream)
+# ==========================================
+# Для очень больших выгрузок: CSV читаются кусками, старые даты отсекаются сразу, дубли ищутся по набору хэшей
+# ключа дедупликации, а строки раскладываются по тайлам во временные файлы. Потом тайлы собираются по одному —
+# full_data целиком в памяти не бывает. Дата и ТТ входят в ключ, поэтому фильтр до дедупликации её не меняет.
+SPILL_COLUMNS = list(dict.fromkeys(GROUP_COLUMNS + CARD_COLUMNS + ['Pay_Numeric', 'Rate', 'Start_DT', 'End_DT']))
+
+def iter_needs_chunks(filepath, engine, chunksize):
+    if filepath.endswith('.csv'):
+        date_formats = {}
+        for chunk in pd.read_csv(filepath, chunksize=chunksize):
+            yield standardize_needs(clean_and_check(chunk, os.path.basename(filepath), date_formats))
+    else:
+        for path, sheet in list_sheet_tasks(filepath, engine):
+            yield standardize_needs(read_needs_sheet(path, sheet, engine))
+
+def first_seen(df, seen):
+    """Маска строк, чей ключ дедупликации ещё не встречался (как drop_duplicates keep='first'); seen пополняется"""
+    key = df[[col for col in DEDUP_COLUMNS if col in df.columns]]
+    # Числа приводим к float: в соседних кусках CSV один столбец бывает то int, то float
+    key = key.apply(lambda c: c.astype(float) if pd.api.types.is_numeric_dtype(c) else c)
+    mask = np.zeros(len(df), dtype=bool)
+    for i, h in enumerate(pd.util.hash_pandas_object(key, index=False).tolist()):
+        if h not in seen:
+            seen.add(h)
+            mask[i] = True
+    return mask
+
+def spill_by_tile(full_data, spill_dir):
+    os.makedirs(spill_dir, exist_ok=True)
+    cells = np.floor(full_data[['Широта', 'Долгота']].to_numpy(float) / TILE_SIZE_DEG).astype(np.int64)
+    for (lat, lon), part in full_data[SPILL_COLUMNS].groupby([cells[:, 0], cells[:, 1]]):
+        with open(os.path.join(spill_dir, f"{lat}_{lon}.pkl"), "ab") as f:
+            pickle.dump(part, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+def read_spill(path):
+    parts = []
+    with open(path, "rb") as f:
+        while True:
+            try:
+                parts.append(pickle.load(f))
+            except EOFError:
+                return concat_needs(parts)
+
+def stream_needs(files, registry, engine, chunksize, spill_dir):
+    """Первый проход: куски -> фильтры -> дедупликация -> расчёт оплаты -> тайлы в spill_dir/<номер региона>.
+    Возвращает статистику зарплат для меню каждого региона: {номер региона: {фильтр: {'min', 'max'}}}."""
+    seen, salary, unmatched = set(), {}, Counter()
+    rows_total = rows_actual = rows_kept = fuzzy = 0
+    for filename in files:
+        try:
+            chunks = iter_needs_chunks(os.path.join(project_dir, filename), engine, chunksize)
+            while True:
+                with stage("load") as st:
+                    chunk = next(chunks, None)
+                    st["rows"] = 0 if chunk is None else len(chunk)
+                if chunk is None:
+                    break
+                rows_total += len(chunk)
+                with stage("merge"):
+                    fuzzy += canonicalize_tt(chunk, registry)
+                with stage("date filter") as st:
+                    chunk = add_store_types(chunk)
+                    chunk = chunk[is_actual(chunk)]
+                    st["rows"] = len(chunk)
+                rows_actual += len(chunk)
+                with stage("dedup") as st:
+                    chunk = chunk[first_seen(chunk, seen)].copy()
+                    st["rows"] = len(chunk)
+                rows_kept += len(chunk)
+                if chunk.empty:
+                    continue
+                with stage("pay calc") as st:
+                    chunk = add_pay_columns(chunk)
+                    st["rows"] = len(chunk)
+                full_data, missing = attach_coords(chunk, registry)
+                unmatched.update(missing.to_dict())
+                regions = full_data.groupby('Регион', sort=False)
+                with stage("pay calc"):
+                    for region, part in regions:
+                        acc = salary.setdefault(region, {})
+                        for name, paid in salary_ranges(part).items():
+                            old = acc.get(name)
+                            acc[name] = {'min': min(paid['min'], old['min']), 'max': max(paid['max'], old['max'])} if old else paid
+                with stage("spill") as st:
+                    for region, part in regions:
+                        spill_by_tile(part, os.path.join(spill_dir, str(region)))
+                    st["rows"] = len(full_data)
+        except Exception as e:
+            print(f"⚠️ Ошибка при загрузке {filename}: {e}")
+    print(f"📊 Всего строк: {rows_total}, актуальных: {rows_actual}, без дублей: {rows_kept}")
+    report_unmatched(pd.Series(unmatched, dtype=np.int64), fuzzy)
+    return salary
+
+def stream_features(spill_dir, cards, filter_counts, manager=MANAGER_PHONE):
+    """Второй проход: по одному тайлу -> группы -> признаки (одна партия на тайл для write_site)"""
+    next_id = 0
+    for name in sorted(os.listdir(spill_dir) if os.path.isdir(spill_dir) else []):
+        with stage("spill") as st:
+            full_data = read_spill(os.path.join(spill_dir, name)).sort_values(by=['ТТ', 'Должность', 'Дата_DT'])
+            st["rows"] = len(full_data)
+        grouped = group_shifts(full_data) if cards == "template" else render_cards(full_data, {}, None, manager)[0]
+        with stage("json") as st:
+            features, counts = build_features(grouped, cards, first_id=next_id)
+            st["rows"] = len(features)
+        next_id += len(features)
+        filter_counts.update(counts)
+        yield features
+
+PAGE_CSS = """        body, html { padding: 0; margin: 0; width: 100%; height: 100%; font-family: -apple-system, BlinkMacSystemFont, Roboto, Helvetica, Arial, sans-serif; }
+        #map { width: 100%; height: 100%; }
+        #menu-trigger {
             position: absolute; top: 15px; left: 50%; transform: translateX(-50%); z-index: 1000;
             background: #fff; color: #333; padding: 10px 20px; border-radius: 30px;
             box-shadow: 0 4px 15px rgba(0,0,0,0.2); font-weight: bold; cursor: pointer; display: flex; align-items: center; gap: 8px; border: 1px solid #ddd;
-        }}
-        #controls {{
+        }
+        #controls {
             position: absolute; top: 0; left: 0; z-index: 2000;
             background: #f4f4f6; width: 100%; height: 100%;
             display: flex; flex-direction: column;
             transition: transform 0.3s cubic-bezier(0.25, 0.46, 0.45, 0.94);
             transform: translateY(0);
-        }}
-        #controls.closed {{ transform: translateY(100%); }}
-        @media (min-width: 768px) {{
-            #controls {{ width: 350px; transform: translateX(0); border-right: 1px solid #ccc; }}
-            #controls.closed {{ transform: translateX(-100%); }}
-            #menu-trigger {{ display: none; }}
-        }}
-        .header {{ padding: 20px; background: #fff; box-shadow: 0 2px 5px rgba(0,0,0,0.05); }}
-        .header-top {{ display: flex; justify-content: space-between; align-items: center; margin-bottom: 15px; }}
-        .header h2 {{ margin: 0; font-size: 20px; }}
+        }
+        #controls.closed { transform: translateY(100%); }
+        @media (min-width: 768px) {
+            #controls { width: 350px; transform: translateX(0); border-right: 1px solid #ccc; }
+            #controls.closed { transform: translateX(-100%); }
+            #menu-trigger { display: none; }
+        }
+        .header { padding: 20px; background: #fff; box-shadow: 0 2px 5px rgba(0,0,0,0.05); }
+        .header-top { display: flex; justify-content: space-between; align-items: center; margin-bottom: 15px; }
+        .header h2 { margin: 0; font-size: 20px; }
        
-        .header-buttons {{ display: flex; gap: 8px; flex-wrap: wrap; }}
+        .header-buttons { display: flex; gap: 8px; flex-wrap: wrap; }
        
-        .filters-list {{ padding: 15px; overflow-y: auto; flex: 1; }}
-        .filter-btn {{
+        .filters-list { padding: 15px; overflow-y: auto; flex: 1; }
+        .filter-btn {
             width: 100%; display: flex; justify-content: space-between; align-items: center;
             padding: 12px 15px; margin-bottom: 10px; background: #fff; border: 1px solid #e0e0e0; border-radius: 12px;
             font-size: 15px; text-align: left; cursor: pointer; box-shadow: 0 2px 4px rgba(0,0,0,0.03); transition: all 0.2s;
-        }}
-        .filter-btn:active {{ transform: scale(0.98); background: #f0f0f0; }}
-        .filter-btn.active {{ border: 2px solid #FFCC00; background: #fff9db; }}
-        .badge {{ background: #eee; color: #555; padding: 4px 10px; border-radius: 20px; font-size: 13px; font-weight: bold; align-self: flex-start; margin-top: 5px; }}
-        .close-btn {{ background: #e0e0e0; border: none; width: 36px; height: 36px; border-radius: 50%; font-size: 20px; cursor: pointer; display: flex; align-items: center; justify-content: center; }}
+        }
+        .filter-btn:active { transform: scale(0.98); background: #f0f0f0; }
+        .filter-btn.active { border: 2px solid #FFCC00; background: #fff9db; }
+        .badge { background: #eee; color: #555; padding: 4px 10px; border-radius: 20px; font-size: 13px; font-weight: bold; align-self: flex-start; margin-top: 5px; }
+        .time-filter { display: flex; gap: 8px; margin-bottom: 10px; }
+        .time-filter select, .time-filter input { flex: 1; padding: 10px; border: 1px solid #e0e0e0; border-radius: 12px; font-size: 14px; background: #fff; }
+        .close-btn { background: #e0e0e0; border: none; width: 36px; height: 36px; border-radius: 50%; font-size: 20px; cursor: pointer; display: flex; align-items: center; justify-content: center; }
        
-        .info-btn {{
+        .info-btn {
             flex: 1;
             background: #007bff; color: white; border: none; padding: 10px 15px; border-radius: 8px;
             cursor: pointer; font-weight: bold; font-size: 13px; display: flex; align-items: center; justify-content: center; gap: 5px; text-decoration: none;
-        }}
-        .info-btn:hover {{ background: #0056b3; }}
-        .manager-btn {{
+        }
+        .info-btn:hover { background: #0056b3; }
+        .manager-btn {
             flex: 1;
             background: #25D366; color: white; border: none; padding: 10px 15px; border-radius: 8px;
             cursor: pointer; font-weight: bold; font-size: 13px; display: flex; align-items: center; justify-content: center; gap: 5px; text-decoration: none;
-        }}
-        .manager-btn:hover {{ background: #1ebc57; }}
-        .modal-overlay {{
+        }
+        .manager-btn:hover { background: #1ebc57; }
+        .modal-overlay {
             display: none; position: fixed; top: 0; left: 0; width: 100%; height: 100%;
             background: rgba(0,0,0,0.5); z-index: 3000;
             justify-content: center; align-items: center;
-        }}
-        .modal-content {{
+        }
+        .modal-content {
             background: white; padding: 25px; border-radius: 16px;
             max-width: 400px; width: 90%; position: relative;
             box-shadow: 0 10px 25px rgba(0,0,0,0.2);
             animation: fadeIn 0.3s;
             display: flex; flex-direction: column; gap: 10px;
-        }}
-        .modal-close {{
+        }
+        .modal-close {
             position: absolute; top: 15px; right: 15px; font-size: 24px; cursor: pointer; color: #999;
-        }}
-        .step-box {{
+        }
+        .step-box {
             margin-bottom: 5px; padding-left: 15px; border-left: 4px solid #25D366;
             background: #f9f9f9; padding: 10px 10px 10px 15px; border-radius: 0 8px 8px 0;
-        }}
-        @keyframes fadeIn {{ from {{ opacity: 0; transform: translateY(10px); }} to {{ opacity: 1; transform: translateY(0); }} }}
-    </style>
+        }
+        @keyframes fadeIn { from { opacity: 0; transform: translateY(10px); } to { opacity: 1; transform: translateY(0); } }
+"""
+
+PAGE_JS = """        let myMap, objectManager, clusterManager, clusterData = null, currentFilter = 'all';
+        const balloonTiles = {};
+       
+        // Без встроенных данных (rawData, pointsUrl задаются перед этим скриптом) точки грузятся из pointsUrl,
+        // а балуны — по тайлам при открытии. Имена файлов содержат хэш, поэтому ?v= не нужен.
+        // Кластеры посчитаны заранее (clustersUrl): страница только выбирает уровень зума и фильтр.
+        function loadPoints() {
+            if (rawData) {
+                rawData.features.forEach(f => { if (f.properties.shifts) f.properties.balloonContentBody = "⏳ Загрузка..."; });
+                return Promise.resolve(rawData);
+            }
+            return fetch(pointsUrl).then(r => r.json()).then(d => ({
+                type: "FeatureCollection",
+                features: d.points.map(p => ({
+                    type: "Feature", id: p[0],
+                    geometry: { type: "Point", coordinates: [p[1], p[2]] },
+                    properties: {
+                        balloonContentBody: "⏳ Загрузка...", clusterCaption: String(p[0]),
+                        hintContent: d.roles[p[3]], filterType: d.filters[p[3]], tile: d.tiles[p[4]], px: p[5], py: p[6]
+                    }
+                }))
+            }));
+        }
+       
+        function loadClusters() {
+            if (!clustersUrl) return Promise.resolve(null);
+            return fetch(clustersUrl).then(r => r.json());
+        }
+       
+        function matchesFilter(obj) {
+            return (!activePoints || activePoints.has(obj.id)) && (currentFilter === 'all' || obj.properties.filterType === currentFilter);
+        }
+       
+        // Фильтр по времени (timesUrl или встроенный timesData): у каждого фильтра смены отсортированы по началу
+        // (минуты от base), offsets — первая смена каждого часа каждого дня из days. Окно находим бинарным
+        // поиском по дням и внутри часа, а не перебором всех смен; индекс грузится при первом выборе времени.
+        let timeIndex = null, activePoints = null, timeCounts = null;
+        function loadTimes() {
+            if (timeIndex || !(timesData || timesUrl)) return Promise.resolve(timeIndex);
+            return (timesData ? Promise.resolve(timesData) : fetch(timesUrl).then(r => r.json())).then(t => timeIndex = t);
+        }
+       
+        function lowerBound(a, x, lo, hi) {
+            while (lo < hi) { const m = (lo + hi) >> 1; if (a[m] < x) lo = m + 1; else hi = m; }
+            return lo;
+        }
+       
+        // Номер первой смены фильтра f, начинающейся не раньше x
+        function firstShift(t, f, x) {
+            const per = t.bucketsPerDay, day = Math.floor(x / 1440), d = lowerBound(t.days, day, 0, t.days.length);
+            if (d === t.days.length) return t.start[f].length;
+            if (t.days[d] > day) return t.offsets[f][d * per];
+            const b = d * per + Math.floor((x - day * 1440) / (1440 / per));
+            return lowerBound(t.start[f], x, t.offsets[f][b], t.offsets[f][b + 1]);
+        }
+       
+        // Время в выгрузках — местное время магазина, как и у посетителя: минуты «по часам» без часового пояса
+        function localMinutes(date) { return Math.floor(date.getTime() / 60000) - date.getTimezoneOffset(); }
+       
+        // Точки со сменами в выбранном окне и их число по фильтрам (точка относится к одному фильтру)
+        function applyTimeFilter() {
+            const mode = document.getElementById('timeFilter').value, dateInput = document.getElementById('timeDate');
+            dateInput.style.display = mode === 'date' ? '' : 'none';
+            if (!mode || !timeIndex) { activePoints = timeCounts = null; return; }
+            const t = timeIndex, now = localMinutes(new Date()) - t.base;
+            let lo = now, hi = now + 60 * Number(mode), running = mode === 'now';
+            if (running) [lo, hi] = [now - t.maxLength, now + 1];  // уже начались, но ещё не закончились
+            if (mode === 'date') {
+                if (!dateInput.value) dateInput.value = new Date(localMinutes(new Date()) * 60000).toISOString().slice(0, 10);
+                lo = Date.parse(dateInput.value) / 60000 - t.base;
+                hi = lo + 1440;
+            }
+            activePoints = new Set();
+            timeCounts = {};
+            t.filters.forEach((name, f) => {
+                const before = activePoints.size, start = t.start[f], length = t.length[f], point = t.point[f];
+                for (let i = firstShift(t, f, lo), end = firstShift(t, f, hi); i < end; i++)
+                    if (!running || start[i] + length[i] > now) activePoints.add(point[i]);
+                timeCounts[name] = activePoints.size - before;
+            });
+        }
+       
+        function updateBadges() {
+            const all = timeCounts && Object.values(timeCounts).reduce((a, b) => a + b, 0);
+            document.querySelectorAll('.filter-btn').forEach(b => {
+                const badge = b.querySelector('.badge');
+                if (!badge.dataset.total) badge.dataset.total = badge.textContent;
+                badge.textContent = !timeCounts ? badge.dataset.total : b.dataset.filter === 'all' ? all : (timeCounts[b.dataset.filter] || 0);
+            });
+        }
+       
+        function setTimeFilter() {
+            loadTimes().then(() => {
+                applyTimeFilter();
+                updateBadges();
+                applyFilter();
+            });
+        }
+       
+        // c = [cx, cy, широта, долгота, всего, фильтр, число, ...]; индексы фильтров — как в points.json
+        function clusterCount(c) {
+            if (currentFilter === 'all') return c[4];
+            let n = 0;
+            for (let i = 5; i < c.length; i += 2) if (clusterData.filters[c[i]] === currentFilter) n += c[i + 1];
+            return n;
+        }
+       
+        // Ячейки, где под фильтр попало 2+ точки, рисуем значком кластера, остальные точки — как есть
+        function renderClusters() {
+            const zoom = Math.round(myMap.getZoom());
+            if (zoom > clusterData.maxZoom) {
+                clusterManager.removeAll();
+                objectManager.setFilter(matchesFilter);
+                return;
+            }
+            const shift = clusterData.maxZoom - zoom + clusterData.gridShift;
+            const cells = new Set(), visible = [];
+            const addCluster = (cell, n, lat, lon) => {
+                cells.add(cell);
+                visible.push({ type: "Feature", id: visible.length, geometry: { type: "Point", coordinates: [lat, lon] },
+                               properties: { iconContent: n, hintContent: `${n} мест` } });
+            };
+            if (activePoints) {
+                // Под фильтром по времени готовые кластеры не подходят — считаем те же ячейки по видимым точкам
+                const groups = new Map();
+                objectManager.objects.each(o => {
+                    if (!matchesFilter(o)) return;
+                    const cell = (o.properties.px >> shift) + ':' + (o.properties.py >> shift), [lat, lon] = o.geometry.coordinates;
+                    const g = groups.get(cell);
+                    if (g) { g.n++; g.lat += lat; g.lon += lon; }
+                    else groups.set(cell, { n: 1, lat: lat, lon: lon });
+                });
+                groups.forEach((g, cell) => { if (g.n >= 2) addCluster(cell, g.n, g.lat / g.n, g.lon / g.n); });
+            } else {
+                clusterData.levels[zoom].forEach(c => {
+                    const n = clusterCount(c);
+                    if (n >= 2) addCluster(c[0] + ':' + c[1], n, c[2], c[3]);
+                });
+            }
+            clusterManager.removeAll();
+            clusterManager.add({ type: "FeatureCollection", features: visible });
+            objectManager.setFilter(o => matchesFilter(o) && !cells.has((o.properties.px >> shift) + ':' + (o.properties.py >> shift)));
+        }
+       
+        function fetchTile(tile) {
+            if (!balloonTiles[tile]) balloonTiles[tile] = fetch(`data/balloons/${tile}.json`).then(r => r.json());
+            return balloonTiles[tile];
+        }
+       
+        // Режим --cards template: карточки собираются здесь из [дата, начало, конец, чел., ставка, сумма]
+        function payText(rate, pay) {
+            if (rate < 0) return "💰 Сдельная";
+            return pay > 0 ? `💰 ${rate} ₽/ч (≈<b>${pay}₽</b>)` : "💰 Уточняйте";
+        }
+       
+        function renderShift(obj, address, shift) {
+            const [date, start, end, count, rate, pay] = shift;
+            const [lat, lon] = obj.geometry.coordinates;
+            const wa = encodeURIComponent(`Здравствуйте! Хочу записаться на смену.\n💼 Должность: ${obj.properties.hintContent}\n📍 Адрес: ${address}\n📅 Дата: ${date}\n🕒 Время: ${start} - ${end}`);
+            return `<div style='margin-bottom:12px; border-bottom:1px solid #eee; padding-bottom:8px; font-family:sans-serif;'>` +
+                `📅 <b>${date}</b> | 👤 ${count} чел.<br>🕒 ${start} - ${end} | ${payText(rate, pay)}<br>` +
+                `<div style='margin-top:8px; display:flex; flex-direction:column; gap:8px;'>` +
+                `<a href='https://wa.me/${managerPhone}?text=${wa}' target='_blank' style='background:#25D366; color:white; padding:10px; border-radius:6px; text-decoration:none; font-weight:bold; text-align:center;'>📝 Записаться через WhatsApp</a>` +
+                `<a href='https://yandex.ru/maps/?rtext=~${lat},${lon}&rtt=mt' target='_blank' style='background:#f0f0f0; color:black; border:1px solid #ccc; padding:8px; border-radius:6px; text-decoration:none; font-size:14px; text-align:center;'>📍 Построить маршрут</a>` +
+                `<div style='display:flex; gap:5px; margin-top:5px;'>` +
+                ` <button onclick='openInfo()' style='flex:1; background:#007bff; color:white; border:none; padding:8px; border-radius:6px; cursor:pointer; font-weight:bold; font-size:12px;'>ℹ️ Инфо</button>` +
+                ` <button onclick='openWhatsAppWithGreeting()' style='flex:1; background:#128c7e; color:white; border:none; padding:8px; border-radius:6px; cursor:pointer; font-weight:bold; font-size:12px;'>📞 Менеджер</button>` +
+                `</div></div></div>`;
+        }
+       
+        function renderBalloon(obj, data) {
+            obj.properties.balloonContentHeader = `<b style='font-size:16px'>${obj.properties.hintContent}</b> (${data.store})<br><span style='color:grey;font-size:13px'>${data.address}</span>`;
+            obj.properties.balloonContentBody = `<div style='max-height:300px; overflow-y:auto; font-size:14px'>${data.shifts.map(s => renderShift(obj, data.address, s)).join('')}</div>`;
+        }
+       
+        function loadBalloons(objects) {
+            const pending = objects.filter(o => !o.properties.loaded && (o.properties.tile !== undefined || o.properties.shifts));
+            return Promise.all(pending.map(o => {
+                const entry = o.properties.tile !== undefined ? fetchTile(o.properties.tile).then(tile => tile[o.id]) : Promise.resolve(o.properties);
+                return entry.then(data => {
+                    if (Array.isArray(data)) [o.properties.balloonContentHeader, o.properties.balloonContentBody] = data;
+                    else renderBalloon(o, data);
+                    o.properties.loaded = true;
+                });
+            })).then(() => pending.length);
+        }
+       
+        function openWhatsAppWithGreeting() {
+            const date = new Date();
+            const hour = date.getHours();
+            let greeting = "Добрый день";
+           
+            if (hour >= 5 && hour < 12) {
+                greeting = "Доброе утро";
+            } else if (hour >= 12 && hour < 17) {
+                greeting = "Добрый день";
+            } else if (hour >= 17 && hour <= 23) {
+                greeting = "Добрый вечер";
+            } else {
+                greeting = "Доброй ночи";
+            }
+           
+            const text = `${greeting}! Хочу узнать подробности о работе во ВкусВилл`;
+            const encoded = encodeURIComponent(text);
+            const url = `https://wa.me/${managerPhone}?text=${encoded}`;
+           
+            window.open(url, '_blank');
+        }
+        ymaps.ready(init);
+        function init () {
+            myMap = new ymaps.Map('map', {
+                center: mapCenter, zoom: mapZoom,
+                controls: ['zoomControl', 'geolocationControl']
+            });
+           
+            objectManager = new ymaps.ObjectManager({
+                clusterize: !clustersUrl, gridSize: 64, clusterDisableClickZoom: false
+            });
+           
+            objectManager.clusters.options.set('preset', 'islands#invertedYellowClusterIcons');
+            myMap.geoObjects.add(objectManager);
+           
+            clusterManager = new ymaps.ObjectManager({ clusterize: false });
+            clusterManager.objects.options.set('preset', 'islands#yellowStretchyIcon');
+            clusterManager.objects.events.add('click', e => {
+                const obj = clusterManager.objects.getById(e.get('objectId'));
+                myMap.setCenter(obj.geometry.coordinates, Math.round(myMap.getZoom()) + 2, { duration: 300 });
+            });
+            myMap.geoObjects.add(clusterManager);
+            myMap.events.add('boundschange', e => {
+                if (clusterData && e.get('newZoom') !== e.get('oldZoom')) renderClusters();
+            });
+           
+            objectManager.objects.events.add('balloonopen', e => {
+                const obj = objectManager.objects.getById(e.get('objectId'));
+                loadBalloons([obj]).then(n => { if (n) objectManager.objects.balloon.setData(obj); });
+            });
+            objectManager.clusters.events.add('balloonopen', e => {
+                const cluster = objectManager.clusters.getById(e.get('objectId'));
+                loadBalloons(cluster.properties.geoObjects).then(n => { if (n) objectManager.clusters.balloon.setData(cluster); });
+            });
+           
+            Promise.all([loadPoints(), loadClusters()]).then(([data, clusters]) => {
+                objectManager.add(data);
+                const bounds = objectManager.getBounds();
+                if (bounds) myMap.setBounds(bounds);
+                if (clusters) {
+                    clusterData = clusters;
+                    renderClusters();
+                }
+            });
+        }
+       
+        // Границы точек под текущим фильтром (getBounds не годится: часть точек скрыта кластерами)
+        function filteredBounds() {
+            let bounds = null;
+            objectManager.objects.each(o => {
+                if (!matchesFilter(o)) return;
+                const [lat, lon] = o.geometry.coordinates;
+                if (!bounds) bounds = [[lat, lon], [lat, lon]];
+                else bounds = [[Math.min(bounds[0][0], lat), Math.min(bounds[0][1], lon)], [Math.max(bounds[1][0], lat), Math.max(bounds[1][1], lon)]];
+            });
+            return bounds;
+        }
+       
+        function closeMenu() { document.getElementById('controls').classList.add('closed'); }
+        function openMenu() { document.getElementById('controls').classList.remove('closed'); }
+       
+        function openInfo() { document.getElementById('infoModal').style.display = 'flex'; }
+        function closeModal(e) { if(e.target.id === 'infoModal') document.getElementById('infoModal').style.display='none'; }
+       
+        function filterMap(category, btn) {
+            document.querySelectorAll('.filter-btn').forEach(b => b.classList.remove('active'));
+            btn.classList.add('active');
+           
+            currentFilter = category;
+            applyFilter();
+           
+            if (window.innerWidth < 768) closeMenu();
+           
+            setTimeout(() => {
+                const bounds = clusterData || activePoints ? filteredBounds() : objectManager.getBounds();
+                if (bounds) myMap.setBounds(bounds, {checkZoomRange:true});
+            }, 100);
+        }
+       
+        function applyFilter() {
+            if (clusterData) renderClusters();
+            else if (currentFilter === 'all' && !activePoints) objectManager.setFilter('id >= 0');
+            else objectManager.setFilter(matchesFilter);
+        }
+"""
+
+# Оболочка страницы: {styles}/{scripts} — встроенные блоки или ссылки на файлы с хэшем в имени
+HTML_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+    <title>Работа - Карта Смен</title>
+    <meta charset="utf-8" />
+    <meta name="viewport" content="width=device-width, initial-scale=1.0, maximum-scale=1.0, user-scalable=no">
+    <script src="https://api-maps.yandex.ru/2.1/?apikey={API_KEY}&lang=ru_RU"></script>
+{styles}
 </head>
 <body>
     <div id="infoModal" class="modal-overlay" onclick="closeModal(event)">
@@ -432,7 +1814,19 @@ html_template = f"""<!DOCTYPE html>
         </div>
        
         <div class="filters-list">
-            <button class="filter-btn active" onclick="filterMap('all', this)">
+            <div class="time-filter">
+                <select id="timeFilter" onchange="setTimeFilter()">
+                    <option value="">🕒 Любое время</option>
+                    <option value="now">Идут сейчас</option>
+                    <option value="2">Начало в ближайшие 2 часа</option>
+                    <option value="4">Начало в ближайшие 4 часа</option>
+                    <option value="8">Начало в ближайшие 8 часов</option>
+                    <option value="24">Начало в ближайшие сутки</option>
+                    <option value="date">На дату…</option>
+                </select>
+                <input type="date" id="timeDate" onchange="setTimeFilter()" style="display:none">
+            </div>
+            <button class="filter-btn active" data-filter="all" onclick="filterMap('all', this)">
                 <span class="btn-text">🌍 ПОКАЗАТЬ ВСЕ</span>
                 <span class="badge">{total_points}</span>
             </button>
@@ -442,111 +1836,1174 @@ html_template = f"""<!DOCTYPE html>
    
     <div id="map"></div>
    
-    <script>
-        let myMap, objectManager;
-        const rawData = {json_data};
-       
-        function openWhatsAppWithGreeting() {{
-            const date = new Date();
-            const hour = date.getHours();
-            let greeting = "Добрый день";
-           
-            if (hour >= 5 && hour < 12) {{
-                greeting = "Доброе утро";
-            }} else if (hour >= 12 && hour < 17) {{
-                greeting = "Добрый день";
-            }} else if (hour >= 17 && hour <= 23) {{
-                greeting = "Добрый вечер";
-            }} else {{
-                greeting = "Доброй ночи";
-            }}
-           
-            const text = `${{greeting}}! Хочу узнать подробности о работе во ВкусВилл`;
-            const encoded = encodeURIComponent(text);
-            const url = `https://wa.me/79152977432?text=${{encoded}}`;
-           
-            window.open(url, '_blank');
-        }}
-        ymaps.ready(init);
-        function init () {{
-            myMap = new ymaps.Map('map', {{
-                center: [55.75, 37.62], zoom: 10,
-                controls: ['zoomControl', 'geolocationControl']
-            }});
-           
-            objectManager = new ymaps.ObjectManager({{
-                clusterize: true, gridSize: 64, clusterDisableClickZoom: false
-            }});
-           
-            objectManager.clusters.options.set('preset', 'islands#invertedYellowClusterIcons');
-            myMap.geoObjects.add(objectManager);
-            objectManager.add(rawData);
-           
-            const bounds = objectManager.getBounds();
-            if (bounds) myMap.setBounds(bounds);
-        }}
-       
-        function closeMenu() {{ document.getElementById('controls').classList.add('closed'); }}
-        function openMenu() {{ document.getElementById('controls').classList.remove('closed'); }}
-       
-        function openInfo() {{ document.getElementById('infoModal').style.display = 'flex'; }}
-        function closeModal(e) {{ if(e.target.id === 'infoModal') document.getElementById('infoModal').style.display='none'; }}
-       
-        function filterMap(category, btn) {{
-            document.querySelectorAll('.filter-btn').forEach(b => b.classList.remove('active'));
-            btn.classList.add('active');
-           
-            if (category === 'all') objectManager.setFilter('id >= 0');
-            else objectManager.setFilter(object => object.properties.filterType === category);
-           
-            if (window.innerWidth < 768) closeMenu();
-           
-            setTimeout(() => {{
-                const bounds = objectManager.getBounds();
-                if (bounds) myMap.setBounds(bounds, {{checkZoomRange:true}});
-            }}, 100);
-        }}
-    </script>
+{scripts}
 </body>
 </html>"""
 
-with open(os.path.join(project_dir, "index.html"), "w", encoding="utf-8") as f:
-    f.write(html_template)
-print("✅ Файл 'index.html' обновлен.")
+# ==========================================
+# 🗂️ ДАННЫЕ КАРТЫ ОТДЕЛЬНО ОТ СТРАНИЦЫ
+# ==========================================
+# index.html содержит только оболочку; точки лежат в data/points.<хэш>.json (id, координаты, тип),
+# а тяжёлое содержимое балунов — в data/balloons/<тайл>.<хэш>.json, которые страница грузит при открытии.
+# CSS и JS тоже вынесены в assets/ с хэшем в имени: браузер кэширует неизменившиеся файлы навсегда.
+# Пути ниже — от папки сайта текущего региона (site_dir): корень проекта или подпапка региона.
+site_dir = project_dir
+DATA_DIR = "data"
+ASSETS_DIR = "assets"
+MANIFEST_PATH = f"{ASSETS_DIR}/manifest.json"
+# Качество brotli: 11 сжимает в десятки раз медленнее 7, а выигрывает на тайлах данных доли процента —
+# его оставляем только для небольших map.js/map.css, которые пересжимаются лишь при смене кода страницы
+BROTLI_QUALITY = 7
+BROTLI_QUALITY_STATIC = 11
+TILE_SIZE_DEG = 0.05  # ~5 км: один тайл — десяток-другой магазинов
+CLUSTER_MAX_ZOOM = 14  # дальше точки показываются без кластеров
+CLUSTER_GRID_SHIFT = 6  # ячейка 2**6 = 64 px, как gridSize у ObjectManager
+WGS84_E = 0.0818191908426  # эксцентриситет эллипсоида: проекция Яндекс.Карт — эллиптический Меркатор
+
+def json_dumps(obj):
+    """Компактный JSON строкой; через orjson, если он установлен (результат тот же, но в разы быстрее)"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+def _json_bytes(obj):
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def json_column(series, unique=True):
+    """JSON-кодирование каждого значения столбца; unique=False — для нехэшируемых значений (списки смен)"""
+    if unique:
+        return map_unique(series, lambda u: u.map(json_dumps))
+    return pd.Series([json_dumps(v) for v in series], index=series.index, dtype=object)
+
+def tile_balloons(features, positions):
+    """{id: балун} для строк positions: [заголовок, тело] или {store, address, shifts} для --cards template.
+    Собирается из срезов столбцов и кодируется одним вызовом на тайл — длинный HTML не копируем лишний раз."""
+    ids = features["id"].to_numpy()[positions].tolist()
+    if "shifts" in features:
+        columns = [features[c].to_numpy(dtype=object)[positions] for c in ("store", "address", "shifts")]
+        values = [{"store": store, "address": address, "shifts": shifts} for store, address, shifts in zip(*columns)]
+    else:
+        values = [[header, body] for header, body in zip(features["header"].to_numpy(dtype=object)[positions],
+                                                         features["body"].to_numpy(dtype=object)[positions])]
+    return dict(zip(ids, values))
+
+def feature_json(features):
+    """GeoJSON Feature каждой точки для встроенного (inline) режима"""
+    index, ids = features.index, features["id"].astype(str)
+    if "shifts" in features:
+        balloon = ""
+        extra = concat_columns(index, ',"store":', json_column(features["store"]), ',"address":', json_column(features["address"]),
+                               ',"shifts":', json_column(features["shifts"], unique=False))
+    else:
+        balloon = concat_columns(index, '"balloonContentHeader":', json_column(features["header"], unique=False),
+                                 ',"balloonContentBody":', json_column(features["body"], unique=False), ",")
+        extra = ""
+    return concat_columns(
+        index, '{"type":"Feature","id":', ids, ',"geometry":{"type":"Point","coordinates":[', json_column(features["lat"]),
+        ",", json_column(features["lon"]), ']},"properties":{', balloon, '"clusterCaption":"', ids,
+        '","hintContent":', json_column(features["hintContent"]), ',"filterType":', json_column(features["filterType"]), extra, "}}")
+
+def compressed_variant(data, suffix, br_quality=BROTLI_QUALITY):
+    """Заранее сжатые копии для сервера (gzip_static / brotli_static); gzip без mtime — одинаковые байты на одинаковый вход"""
+    if suffix == ".gz":
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    return brotli.compress(data, quality=br_quality)
+
+def asset_suffixes():
+    return ["", ".gz"] + ([".br"] if brotli is not None else [])
+
+def _variants_exist(rel_path):
+    return all(os.path.exists(os.path.join(site_dir, rel_path + suffix)) for suffix in asset_suffixes())
+
+def write_asset(rel_path, data, changed, immutable=False, br_quality=BROTLI_QUALITY):
+    """Пишет файл и его .gz/.br, если содержимое изменилось; изменённые пути добавляет в changed.
+    Для файлов с хэшем в имени (immutable) достаточно проверить, что файл уже есть — тогда и сжимать не нужно;
+    для остальных сжатые копии получаются из исходника детерминированно, поэтому при неизменном исходнике их не трогаем."""
+    path = os.path.join(site_dir, rel_path)
+    if not immutable and os.path.exists(path) and _variants_exist(rel_path):
+        with open(path, "rb") as f:
+            if f.read() == data:
+                return
+    for suffix in asset_suffixes():
+        path = os.path.join(site_dir, rel_path + suffix)
+        if immutable and os.path.exists(path):
+            continue
+        blob = data if suffix == "" else compressed_variant(data, suffix, br_quality)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                if f.read() == blob:
+                    continue
+        write_atomic(path, blob)
+        changed.append(rel_path + suffix)
+
+RAW_DATA_MARK = "/*RAW_DATA*/"
+TIMES_DATA_MARK = "/*TIMES_DATA*/"
+
+def write_asset_stream(rel_path, chunks, changed):
+    """Как write_asset, но содержимое приходит кусками: сначала пишем исходник во временный файл; если он совпал
+    с прежним — на этом всё (сжатие, самое дорогое, пропускаем), иначе сжимаем его блоками и подменяем изменившиеся файлы"""
+    target = os.path.join(site_dir, rel_path)
+    with contextlib.ExitStack() as temps:
+        tmp = {suffix: temps.enter_context(atomic_path(target + suffix)) for suffix in asset_suffixes()}
+        with open(tmp[""], "xb") as raw:
+            for chunk in chunks:
+                raw.write(chunk)
+        if os.path.exists(target) and _variants_exist(rel_path) and filecmp.cmp(tmp[""], target, shallow=False):
+            for path in tmp.values():
+                discard_temp(path)
+            return
+        with open(tmp[""], "rb") as raw, open(tmp[".gz"], "xb") as gz_file:
+            gz = gzip.GzipFile(filename="", mode="wb", fileobj=gz_file, compresslevel=9, mtime=0)
+            br = brotli.Compressor(quality=BROTLI_QUALITY) if brotli is not None else None
+            br_file = open(tmp[".br"], "xb") if br is not None else None
+            try:
+                for block in iter(lambda: raw.read(1 << 20), b""):
+                    gz.write(block)
+                    if br is not None:
+                        br_file.write(br.process(block))
+                gz.close()
+                if br is not None:
+                    br_file.write(br.finish())
+            finally:
+                if br_file is not None:
+                    br_file.close()
+        # Подмена — при выходе из ExitStack: сначала сжатые копии, index.html последним
+        for suffix, path in tmp.items():
+            if os.path.exists(target + suffix) and filecmp.cmp(path, target + suffix, shallow=False):
+                discard_temp(path)
+            else:
+                changed.append(rel_path + suffix)
+
+def write_hashed_asset(rel_dir, stem, ext, data, changed, manifest, logical_name, br_quality=BROTLI_QUALITY):
+    digest = hashlib.sha256(data).hexdigest()
+    rel_path = f"{rel_dir}/{stem}.{digest[:10]}{ext}"
+    write_asset(rel_path, data, changed, immutable=True, br_quality=br_quality)
+    manifest[logical_name] = {"file": rel_path, "size": len(data), "sha256": digest}
+    return rel_path
+
+def mercator_pixels(lat, lon, zoom=CLUSTER_MAX_ZOOM):
+    """Целые пиксельные координаты на уровне zoom; на меньших зумах ячейка — просто сдвиг вправо"""
+    phi = np.radians(np.clip(lat, -85.0, 85.0))
+    y = 0.5 - (np.arctanh(np.sin(phi)) - WGS84_E * np.arctanh(WGS84_E * np.sin(phi))) / (2 * np.pi)
+    scale = 256 * 2 ** zoom
+    return np.floor((np.asarray(lon) + 180.0) / 360.0 * scale).astype(np.int64), np.floor(y * scale).astype(np.int64)
+
+def build_clusters(lat, lon, filter_idx, filters, px, py):
+    """Сеточная кластеризация на сервере для зумов 0..CLUSTER_MAX_ZOOM.
+    Кластер: [cx, cy, широта, долгота, всего, фильтр, число, фильтр, число, ...]; ячейки с одной точкой не пишем —
+    страница покажет саму точку."""
+    n_filters, levels = len(filters), []
+    for zoom in range(CLUSTER_MAX_ZOOM + 1):
+        shift = CLUSTER_MAX_ZOOM - zoom + CLUSTER_GRID_SHIFT
+        keys = ((px >> shift) << 32) | (py >> shift)
+        cells, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+        multi = np.flatnonzero(counts > 1)
+        c_lat = np.round(np.bincount(inverse, lat)[multi] / counts[multi], 6)
+        c_lon = np.round(np.bincount(inverse, lon)[multi] / counts[multi], 6)
+        by_filter = np.bincount(inverse * n_filters + filter_idx, minlength=len(cells) * n_filters).reshape(len(cells), n_filters)[multi]
+        level = []
+        for cell, la, lo, total, row in zip(cells[multi].tolist(), c_lat.tolist(), c_lon.tolist(),
+                                            counts[multi].tolist(), by_filter.tolist()):
+            record = [cell >> 32, cell & 0xFFFFFFFF, la, lo, total]
+            for f, n in enumerate(row):
+                if n:
+                    record += [f, n]
+            level.append(record)
+        levels.append(level)
+    return {"filters": filters, "maxZoom": CLUSTER_MAX_ZOOM, "gridShift": CLUSTER_GRID_SHIFT, "levels": levels}
+
+# Индекс по времени для фильтров «идут сейчас», «начало в ближайшие N часов» и «на дату»: у каждого фильтра
+# смены (без повторов) отсортированы по началу — минутам от полуночи первого дня (base), рядом длина и точка.
+# offsets[f][d * 24 + h] — номер первой смены фильтра f, начинающейся не раньше часа h дня days[d]:
+# окно времени страница находит двумя бинарными поисками (день, затем минута внутри часа).
+TIME_BUCKETS_PER_DAY = 24
+
+def feature_times(features):
+    """Смены точек пакета признаков одним куском: (id точки, фильтр, начало, конец) на каждую смену"""
+    times = features["times"].to_numpy(dtype=object)
+    lengths = np.fromiter((len(t) for t in times), dtype=np.int64, count=len(times))
+    pairs = np.concatenate(times.tolist()) if lengths.sum() else np.empty((0, 2), dtype=np.int64)
+    return (np.repeat(features["id"].to_numpy(), lengths), np.repeat(features["filterType"].to_numpy(dtype=object), lengths),
+            pairs[:, 0], pairs[:, 1])
+
+def build_time_index(parts, filters):
+    """parts — результаты feature_times по пакетам, filters — имена фильтров по порядку (как в points.json)"""
+    join = lambda i, dtype: np.concatenate([p[i] for p in parts]).astype(dtype) if parts else np.array([], dtype=dtype)
+    filter_index = {name: i for i, name in enumerate(filters)}
+    codes = pd.Series(join(1, object), dtype=object).map(filter_index).to_numpy(np.int64)
+    starts, ends = join(2, np.int64), join(3, np.int64)
+    # Без повторов, по (фильтр, начало, длина, точка): lexsort в разы быстрее np.unique(axis=0)
+    table = np.column_stack([codes, starts, ends - starts, join(0, np.int64)])
+    table = table[np.lexsort(table.T[::-1])]
+    table = table[np.r_[True, (table[1:] != table[:-1]).any(axis=1)][:len(table)]]
+    base = int(table[:, 1].min() // 1440 * 1440) if len(table) else 0
+    start = table[:, 1] - base
+    days = np.unique(start // 1440)
+    marks = (days[:, None] * 1440 + np.arange(TIME_BUCKETS_PER_DAY) * (1440 // TIME_BUCKETS_PER_DAY)).ravel()
+    bounds = np.searchsorted(table[:, 0], np.arange(len(filters) + 1)).tolist()
+    index = {"filters": filters, "base": base, "days": days.tolist(), "bucketsPerDay": TIME_BUCKETS_PER_DAY,
+             "maxLength": int(table[:, 2].max()) if len(table) else 0, "start": [], "length": [], "point": [], "offsets": []}
+    for a, b in zip(bounds[:-1], bounds[1:]):
+        index["start"].append(start[a:b].tolist())
+        index["length"].append(table[a:b, 2].tolist())
+        index["point"].append(table[a:b, 3].tolist())
+        index["offsets"].append(np.append(np.searchsorted(start[a:b], marks), b - a).tolist())
+    return index
+
+def tile_names(lat, lon):
+    cells = np.floor(np.column_stack([lat, lon]) / TILE_SIZE_DEG).astype(np.int64)
+    return np.array([f"{a}_{b}" for a, b in cells.tolist()], dtype=object)
+
+def write_data_tiles(batches, changed, manifest):
+    """Пишет тайлы балунов, points.json, clusters.json и times.json с хэшами в именах;
+    возвращает пути к points, clusters, times и число точек.
+
+    batches — таблицы признаков (build_features); тайл целиком должен быть в одной таблице (в режиме --stream
+    таблица = тайл), поэтому в памяти держим только текущую таблицу и лёгкие столбцы точек."""
+    ids, lats, lons, point_filters, point_tiles, roles, hashed, times = [], [], [], [], [], {}, {}, []
+    for features in batches:
+        if features.empty:
+            continue
+        if "times" in features:
+            times.append(feature_times(features))
+        tiles = tile_names(features["lat"].to_numpy(), features["lon"].to_numpy())
+        last = features.drop_duplicates("filterType", keep="last")
+        roles.update(zip(last["filterType"], last["hintContent"]))
+        ids.append(features["id"].to_numpy())
+        lats.append(features["lat"].to_numpy())
+        lons.append(features["lon"].to_numpy())
+        point_filters.append(features["filterType"].to_numpy(dtype=object))
+        point_tiles.append(tiles)
+
+        for name, positions in pd.Series(tiles).groupby(tiles, sort=False).indices.items():
+            assert name not in hashed, f"тайл {name} попал в два пакета"
+            with stage("json"):
+                data = _json_bytes(tile_balloons(features, positions))
+            path = write_hashed_asset(f"{DATA_DIR}/balloons", name, ".json", data,
+                                      changed, manifest, f"{DATA_DIR}/balloons/{name}.json")
+            # В points.json тайл записан вместе с хэшем: страница сразу знает точное имя файла
+            hashed[name] = os.path.basename(path)[:-len(".json")]
+
+    join = lambda parts, dtype: np.concatenate(parts).astype(dtype) if parts else np.array([], dtype=dtype)
+    ids, lats, lons = join(ids, np.int64), join(lats, float), join(lons, float)
+    point_filters, point_tiles = join(point_filters, object), join(point_tiles, object)
+    filters = sorted(roles)
+    filter_index = {name: i for i, name in enumerate(filters)}
+    tiles = sorted(hashed)
+    tile_index = {name: i for i, name in enumerate(tiles)}
+    hashed_tiles = [hashed[name] for name in tiles]
+    point_filters = pd.Series(point_filters, dtype=object).map(filter_index).to_numpy(np.int64)
+    point_tiles = pd.Series(point_tiles, dtype=object).map(tile_index).to_numpy(np.int64)
+    px, py = mercator_pixels(lats, lons)
+    points = [list(p) for p in zip(ids.tolist(), lats.tolist(), lons.tolist(), point_filters.tolist(),
+                                   point_tiles.tolist(), px.tolist(), py.tolist())]
+
+    payload = {"filters": filters, "roles": [roles[name] for name in filters], "tiles": hashed_tiles, "points": points}
+    with stage("clusters") as st:
+        clusters = build_clusters(lats, lons, point_filters, filters, px, py)
+        st["rows"] = sum(len(level) for level in clusters["levels"])
+    with stage("time index") as st:
+        time_index = build_time_index(times, filters)
+        st["rows"] = sum(len(s) for s in time_index["start"])
+    with stage("json"):
+        payload, clusters, time_index = _json_bytes(payload), _json_bytes(clusters), _json_bytes(time_index)
+    return (write_hashed_asset(DATA_DIR, "points", ".json", payload, changed, manifest, f"{DATA_DIR}/points.json"),
+            write_hashed_asset(DATA_DIR, "clusters", ".json", clusters, changed, manifest, f"{DATA_DIR}/clusters.json"),
+            write_hashed_asset(DATA_DIR, "times", ".json", time_index, changed, manifest, f"{DATA_DIR}/times.json"),
+            len(points))
+
+def prune_assets(manifest, previous_manifest, changed):
+    """Удаляет из data/ и assets/ файлы, не нужные ни текущей, ни предыдущей сборке
+    (предыдущую оставляем для браузеров, у которых ещё закэширован старый index.html).
+    Пустой manifest — раскладка inline: data/ и assets/ не нужны вовсе, удаляется и сам манифест."""
+    keep = {entry["file"] for entry in list(manifest.values()) + list(previous_manifest.values())}
+    if manifest:
+        keep.add(MANIFEST_PATH)
+    for rel_dir in (DATA_DIR, ASSETS_DIR):
+        for root, _, names in os.walk(os.path.join(site_dir, rel_dir)):
+            for name in names:
+                rel_path = os.path.relpath(os.path.join(root, name), site_dir).replace(os.sep, "/")
+                base = re.sub(r"\.(gz|br)$", "", rel_path)
+                if base not in keep:
+                    os.remove(os.path.join(root, name))
+                    changed.append(rel_path)
+
+def load_manifest():
+    try:
+        with open(os.path.join(site_dir, MANIFEST_PATH), encoding="utf-8") as f:
+            return json.load(f).get("files", {})
+    except (OSError, ValueError):
+        return {}
+
+def region_js(region):
+    """Настройки страницы региона для PAGE_JS: центр карты, зум, WhatsApp менеджера"""
+    return (f"        const mapCenter = {json.dumps(region['center'])}, mapZoom = {region['zoom']}, "
+            f"managerPhone = {json.dumps(region['manager'])};\n")
+
+def write_site(batches, render_html, layout, region=DEFAULT_REGIONS[0]):
+    """Собирает все выходные файлы из таблиц признаков batches; возвращает список изменённых/удалённых путей для git
+    (от site_dir). В режиме split render_html вызывается после того, как все пакеты записаны (в режиме --stream
+    кнопки считаются по ходу)."""
+    changed = []
+    if layout == "inline":
+        styles = f"    <style>\n{PAGE_CSS}    </style>"
+        scripts = (f"    <script>\n        const rawData = {RAW_DATA_MARK};\n        const pointsUrl = null, clustersUrl = null, timesUrl = null;\n"
+                   f"        const timesData = {TIMES_DATA_MARK};\n{region_js(region)}{PAGE_JS}    </script>")
+        head, tail = render_html(styles, scripts).split(RAW_DATA_MARK)
+
+        def chunks():
+            yield (head + '{"type":"FeatureCollection","features":[').encode("utf-8")
+            sep, times, filters = "", [], set()
+            for features in batches:
+                if not features.empty:
+                    if "times" in features:
+                        times.append(feature_times(features))
+                    filters.update(features["filterType"])
+                    with stage("json"):
+                        part = (sep + ",".join(feature_json(features))).encode("utf-8")
+                    yield part
+                    sep = ","
+            # Индекс по времени известен, только когда пройдены все пакеты, поэтому он в хвосте страницы
+            with stage("time index"):
+                time_index = json_dumps(build_time_index(times, sorted(filters)))
+            yield ("]}" + tail.replace(TIMES_DATA_MARK, time_index)).encode("utf-8")
+        write_asset_stream("index.html", chunks(), changed)
+        prune_assets({}, {}, changed)  # тайлы и ассеты прежней split-сборки
+        return changed
+
+    previous_manifest, manifest = load_manifest(), {}
+    points_url, clusters_url, times_url, total_points = write_data_tiles(batches, changed, manifest)
+    css_url = write_hashed_asset(ASSETS_DIR, "map", ".css", PAGE_CSS.encode("utf-8"), changed, manifest, "map.css",
+                                 BROTLI_QUALITY_STATIC)
+    js_url = write_hashed_asset(ASSETS_DIR, "map", ".js", PAGE_JS.encode("utf-8"), changed, manifest, "map.js",
+                                BROTLI_QUALITY_STATIC)
+    styles = f'    <link rel="stylesheet" href="{css_url}">'
+    scripts = (f'    <script>\n        const rawData = null, timesData = null;\n'
+               f'        const pointsUrl = "{points_url}", clustersUrl = "{clusters_url}", timesUrl = "{times_url}";\n'
+               f'{region_js(region)}    </script>\n'
+               f'    <script src="{js_url}"></script>')
+    html = render_html(styles, scripts).encode("utf-8")
+    write_asset("index.html", html, changed)
+    manifest["index.html"] = {"file": "index.html", "size": len(html), "sha256": hashlib.sha256(html).hexdigest()}
+
+    prune_assets(manifest, previous_manifest, changed)
+    write_asset(MANIFEST_PATH, json.dumps({"files": manifest}, ensure_ascii=False, indent=1, sort_keys=True).encode("utf-8"), changed)
+    print(f"🗂️ Данные: {total_points} точек, {len(manifest)} файлов в манифесте, изменено {len(changed)}.")
+    return changed
 
 # ==========================================
 # 🚀 АВТОЗАГРУЗКА
 # ==========================================
-print("\n☁️ Начинаем загрузку на GitHub...")
-
-def run_git_command(commands):
+def run_git_command(commands, input=None):
     try:
-        result = subprocess.run(commands, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        result = subprocess.run(commands, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, input=input)
         return True, result.stdout
     except subprocess.CalledProcessError as e:
         return False, e.stderr
 
-if run_git_command(["git", "--version"])[0]:
-    run_git_command(["git", "add", "index.html"])
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
-    commit_success, commit_output = run_git_command(["git", "commit", "-m", f"Update salaries {timestamp}"])
+OUTPUT_ROOTS = ["index.html", "index.html.gz", "index.html.br", DATA_DIR, ASSETS_DIR]
 
-    print("🔄 Синхронизация с сервером (git pull)...")
-    pull_success, pull_output = run_git_command(["git", "pull", "--rebase", "--autostash", "-X", "ours"])
-    if not pull_success:
-        print(f"⚠️ Ошибка при пуле: {pull_output}")
-    else:
-        print(f"✅ Пул успешен: {pull_output}")
+def output_roots():
+    """Что публикуем: сайт в корне и папки регионов (верхний уровень)"""
+    try:
+        regions = load_regions()
+    except (OSError, ValueError):
+        regions = []
+    return OUTPUT_ROOTS + sorted({r["dir"].split("/")[0] for r in regions if r["dir"]})
+# Поля записи git status --porcelain=v2 до пути: обычная, переименование (за путём ещё и старый), конфликт, новый файл
+GIT_STATUS_FIELDS = {"1": 8, "2": 9, "u": 10, "?": 1}
+
+def git_pending(pathspecs):
+    """Одним вызовом git status: пути в pathspecs, отличающиеся от последнего коммита, и на сколько коммитов
+    ветка впереди upstream (непушнутый прошлый коммит). None — не git-репозиторий."""
+    ok, output = run_git_command(["git", "status", "--porcelain=v2", "-z", "--branch", "--untracked-files=all",
+                                  "--", *pathspecs])
+    if not ok:
+        return None
+    entries, changed, ahead = iter(output.split("\0")), [], 0
+    for entry in entries:
+        kind = entry[:1]
+        if entry.startswith("# branch.ab "):
+            ahead = int(entry.split()[2])
+        elif kind in GIT_STATUS_FIELDS:
+            changed.append(entry.split(" ", GIT_STATUS_FIELDS[kind])[-1])
+            if kind == "2":
+                changed.append(next(entries))  # старое имя: его удаление тоже коммитим
+    return changed, ahead
+
+def publish(paths):
+    """Коммит и push выходных файлов; True, если карта на сервере актуальна (или git нет вовсе).
+
+    Содержимое сравнивает с закоммиченным сам git (git status по хэшам): если отличий нет и всё уже запушено —
+    ни одной сетевой и ни одной лишней команды. Иначе add -A + commit + push, а pull --rebase — только если
+    push отклонён (кто-то запушил раньше нас): в обычном случае одна сетевая операция вместо двух."""
+    if shutil.which("git") is None:
+        print("⚠️ Git не найден.")
+        return True
+    # Папки и файлы верхнего уровня, а не сотни путей тайлов: так же ловим и хвосты прошлой неудачной публикации
+    pathspecs = sorted({p.replace(os.sep, "/").split("/")[0] for p in paths} | set(output_roots()))
+    state = git_pending(pathspecs)
+    if state is None:
+        print("⚠️ Папка проекта не git-репозиторий — публикацию пропускаем.")
+        return False
+    dirty, ahead = state
+    if not dirty and not ahead:
+        print("ℹ️ Изменений нет (карта уже актуальна) — git не трогаем.")
+        return True
+
+    print(f"\n☁️ Начинаем загрузку на GitHub ({len(dirty)} файлов)...")
+    if dirty:
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
+        # Список путей — через stdin: тайлов может быть столько, что командная строка не вместит
+        added, add_output = run_git_command(["git", "--literal-pathspecs", "add", "-A", "--pathspec-from-file=-",
+                                             "--pathspec-file-nul"], input="\0".join(dirty))
+        committed, commit_output = run_git_command(["git", "commit", "-q", "-m", f"Update salaries {timestamp}"])
+        if not (added and committed):
+            print(f"⚠️ Ошибка при коммите: {add_output if not added else commit_output}")
+            return False
 
     print("⏳ Отправка на сервер...")
-    push_success, push_output = run_git_command(["git", "push"])
+    push_success, push_output = run_git_command(["git", "push", "-q"])
+    if not push_success and "rejected" in push_output:
+        print("🔄 На сервере есть новые коммиты — синхронизация (git pull)...")
+        pull_success, pull_output = run_git_command(["git", "pull", "-q", "--rebase", "--autostash", "-X", "ours"])
+        if not pull_success:
+            print(f"⚠️ Ошибка при пуле: {pull_output}")
+            return False
+        push_success, push_output = run_git_command(["git", "push", "-q"])
     if push_success:
         print("🎉 УСПЕХ! Карта обновлена.")
         print("🔗 Ссылка: https://JobMaps01.github.io/Map/")
     else:
-        if "nothing to commit" in commit_output:
-            print("ℹ️ Изменений нет (карта уже актуальна).")
+        print(f"⚠️ Ошибка при пуше: {push_output}")
+    return push_success
+
+# ==========================================
+# 👀 РЕЖИМ НАБЛЮДЕНИЯ (--watch)
+# ==========================================
+# Процесс не завершается: pandas, реестр магазинов и кэши уже в памяти/на диске, поэтому сборка после
+# изменения одного файла перечитывает только его и перерисовывает только затронутые группы и тайлы.
+# Изменения ловим через inotify (Linux), иначе опрашиваем папку. Пачку записей пережидаем (debounce),
+# а публикуем не чаще раза в окно — несколько сборок уходят одним коммитом.
+WATCH_DEBOUNCE_S = 2.0
+WATCH_MAX_DELAY_S = 30.0  # даже при непрерывных записях собираем не позже, чем через столько секунд
+PUBLISH_WINDOW_S = 60.0
+POLL_INTERVAL_S = 1.0
+
+IN_CLOSE_WRITE, IN_MOVED_FROM, IN_MOVED_TO, IN_DELETE = 0x008, 0x040, 0x080, 0x200
+
+def _inotify_watcher(directory):
+    """wait(timeout) -> имена изменившихся входных файлов; None, если inotify недоступен"""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        fd = libc.inotify_init1(os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0 or libc.inotify_add_watch(fd, os.fsencode(directory),
+                                        IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE) < 0:
+        return None
+
+    def wait(timeout):
+        # События чужих файлов (свои же index.html/data, временные файлы редакторов) не прерывают ожидание
+        deadline = None if timeout is None else time.monotonic() + timeout
+        names = set()
+        while not names:
+            left = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not select.select([fd], [], [], left)[0]:
+                break
+            data, pos = os.read(fd, 64 * 1024), 0
+            while pos < len(data):
+                _, _, _, length = struct.unpack_from("iIII", data, pos)
+                name = os.fsdecode(data[pos + 16:pos + 16 + length].rstrip(b"\0"))
+                pos += 16 + length
+                if is_input_file(name):
+                    names.add(name)
+        return names
+    return wait
+
+def _input_snapshot(directory):
+    snapshot = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if is_input_file(entry.name):
+                stat = entry.stat()
+                snapshot[entry.name] = (stat.st_mtime_ns, stat.st_size)
+    return snapshot
+
+def _polling_watcher(directory):
+    state = {"snapshot": _input_snapshot(directory)}
+
+    def wait(timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            current, previous = _input_snapshot(directory), state["snapshot"]
+            state["snapshot"] = current
+            names = {n for n in current.keys() | previous.keys() if current.get(n) != previous.get(n)}
+            if names:
+                return names
+            if deadline is not None and time.monotonic() >= deadline:
+                return set()
+            time.sleep(POLL_INTERVAL_S if deadline is None else max(0.0, min(POLL_INTERVAL_S, deadline - time.monotonic())))
+    return wait
+
+def make_watcher(directory):
+    wait = _inotify_watcher(directory)
+    if wait is not None:
+        print("👀 Слежу за папкой (inotify).")
+        return wait
+    print(f"👀 Слежу за папкой (опрос раз в {POLL_INTERVAL_S:g} с).")
+    return _polling_watcher(directory)
+
+def seconds_to_midnight():
+    now = datetime.datetime.now()
+    return (datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time()) - now).total_seconds()
+
+def watch(args, cache_index):
+    """Цикл --watch: изменения -> debounce -> сборка -> публикация пачкой раз в окно.
+    В полночь пересобираем и без изменений: вчерашние смены должны пропасть с карты."""
+    wait = make_watcher(project_dir)
+    pending, built_key, published_key = set(), None, cache_index.get("build")
+    last_publish = float("-inf")
+    changes = {"старт"}
+    while True:
+        if changes:
+            first_change = time.monotonic()
+            # Debounce: ждём тишины, но не дольше WATCH_MAX_DELAY_S
+            while time.monotonic() - first_change < WATCH_MAX_DELAY_S:
+                more = wait(args.debounce)
+                if not more:
+                    break
+                changes |= more
+            print(f"\n🔔 Изменения: {', '.join(sorted(changes))} (в очереди {len(changes)})")
+            started = time.monotonic()
+            try:
+                with run_lock():
+                    take_run_request()  # разовый запуск, заставший эту сборку, ею и обслужен
+                    result = run_build(args, cache_index, built_key or published_key)
+            except Exception as e:
+                result = None
+                print(f"⚠️ Сборка упала: {e}")
+            if result is not None:
+                built_key, changed = result
+                pending.update(changed)
+            save_cache_index(cache_index)
+            done = time.monotonic()
+            print(f"⏱️ Сборка {done - started:.1f} с, от первого изменения {done - first_change:.1f} с; "
+                  f"ждут публикации {len(pending)} файлов")
+
+        if pending and not args.no_publish and time.monotonic() - last_publish >= args.publish_window:
+            last_publish = time.monotonic()
+            with stage("publish") as st, run_lock():
+                published = publish(sorted(pending))
+                st["rows"] = len(pending)
+            if published:
+                pending.clear()
+                published_key = cache_index["build"] = built_key
+                save_cache_index(cache_index)
+        # Замеры: строка журнала на каждый проход цикла, где была сборка или публикация
+        if stage_metrics:
+            report_metrics(args.metrics_log, run_info(args, "watch"))
+
+        # Разовый запуск, заставший нашу сборку, оставил заявку и вышел — повторяем сборку за него
+        if take_run_request():
+            changes = {"запуск извне"}
+            continue
+        timeout = seconds_to_midnight() + 1
+        if pending:
+            timeout = min(timeout, max(0.0, last_publish + args.publish_window - time.monotonic()))
+        day = datetime.date.today()
+        changes = wait(timeout)
+        if not changes and datetime.date.today() != day:
+            changes = {"новый день"}
+
+# ==========================================
+# 🌐 HTTP API (--serve)
+# ==========================================
+# Те же данные, что и на карте, но по запросу: точки в прямоугольнике, по фильтру/должности, диапазону дат
+# и времени начала смены, N ближайших магазинов, число точек по фильтрам. Таблицы строятся один раз при старте:
+# точки (магазин + должность) с сеткой координат и смены, отсортированные по (точка, минута начала) —
+# окно времени ищется бинарным поиском.
+# Одинаковые запросы отдаются из LRU-кэша готовых ответов. Только stdlib asyncio, без внешних зависимостей.
+API_HOST, API_PORT = "127.0.0.1", 8080
+API_CACHE_BYTES = 256 << 20  # кэш готовых ответов
+API_MAX_NEAREST = 100
+API_DEFAULT_LIMIT, API_MAX_LIMIT = 1000, 50_000  # точек в одном ответе /api/points
+API_MAX_RADIUS_KM = 200.0  # дальше магазины для /api/nearest не ищем
+API_MINUTE_BITS = 27  # ключ смены: (номер точки << API_MINUTE_BITS) | минута начала от 1970-01-01 (до 2225 года)
+
+def build_api_index(full_data):
+    groups = full_data.groupby(GROUP_COLUMNS, observed=True)
+    points = groups.size().reset_index(name='Shifts_Total')
+    group_ids = groups.ngroup().to_numpy()
+    # Время начала не распознано — смена считается с полуночи своего дня; нет и даты (NaT) — минута 0
+    day = full_data['Дата_DT'].to_numpy('datetime64[m]')
+    start = full_data['Start_DT'].to_numpy('datetime64[m]')
+    start = np.where(np.isnat(start), day, start)
+    minutes = np.where(np.isnat(start), 0, start.astype(np.int64))
+    minutes = np.clip(minutes, 0, (1 << API_MINUTE_BITS) - 1)
+    order = np.lexsort((minutes, group_ids))
+    rows = full_data.iloc[order]
+
+    iso = map_unique(rows['Дата_DT'], lambda u: pd.to_datetime(u).dt.strftime('%Y-%m-%d'))
+    lat, lon = points['Широта'].to_numpy(float), points['Долгота'].to_numpy(float)
+    filter_codes, filters = pd.factorize(as_str(points['Filter_Name']))
+    role_codes, roles = pd.factorize(as_str(points['Должность']))
+    return {
+        "lat": lat, "lon": lon, "grid": build_grid(lat, lon),
+        "tt": as_str(points['ТТ']).to_numpy(), "address": as_str(points['Адрес']).to_numpy(),
+        "store": np.where(points['Тип_По_ТТ'] == "Darkstore", "DS", "WS"),
+        "filter_codes": filter_codes, "filters": list(filters),
+        "role_codes": role_codes, "roles": list(roles),
+        "shift_keys": (group_ids[order].astype(np.int64) << API_MINUTE_BITS) | minutes[order],
+        "shifts": list(zip(iso.where(rows['Дата_DT'].notna(), as_str(rows['Дата выхода'])).tolist(),
+                           as_str(rows['Начало смены']).tolist(), as_str(rows['Конец смены']).tolist(),
+                           as_str(rows['Количество сотрудников']).tolist(), rate_values(rows['Rate']), rows['Pay_Numeric'].tolist())),
+    }
+
+def _api_float(query, name, default=None):
+    value = query.get(name, default)
+    if value is None:
+        raise ValueError(f"нужен параметр {name}")
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"{name}: ожидается число, получено {value!r}") from None
+
+def _api_int(query, name, default, low, high):
+    """Целый параметр от low до high: дробное (2.9) или вне диапазона — ошибка 400, а не молча усечённое значение"""
+    value = query.get(name, default)
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f"{name}: ожидается целое число, получено {value!r}") from None
+    if not low <= number <= high:
+        raise ValueError(f"{name} должно быть от {low} до {high}, получено {number}")
+    return number
+
+def _api_lat_lon(lat, lon, name="lat/lon"):
+    """Проверка координат запроса: широта от -90 до 90, долгота от -180 до 180 (NaN и бесконечность — тоже ошибка)"""
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError(f"{name}: широта от -90 до 90, долгота от -180 до 180, получено {lat}, {lon}")
+    return lat, lon
+
+def _api_day(value):
+    try:
+        return (datetime.date.fromisoformat(value) - datetime.date(1970, 1, 1)).days
+    except ValueError:
+        raise ValueError(f"дата должна быть в виде ГГГГ-ММ-ДД, получено {value!r}") from None
+
+def _api_minute(value):
+    try:
+        moment = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"now: ожидается ГГГГ-ММ-ДДTЧЧ:ММ, получено {value!r}") from None
+    return int((moment.replace(tzinfo=None) - datetime.datetime(1970, 1, 1)).total_seconds() // 60)
+
+def api_window(query):
+    """Окно минут начала смены [lo, hi) из from/to/date (дни включительно) и within=N часов от now"""
+    lo, hi = 0, 1 << API_MINUTE_BITS
+    first, last = query.get("date") or query.get("from"), query.get("date") or query.get("to")
+    if first:
+        lo = max(lo, _api_day(first) * 1440)
+    if last:
+        hi = min(hi, (_api_day(last) + 1) * 1440)
+    if query.get("within"):
+        within = _api_float(query, "within")
+        if not 0 < within <= 24 * 366:
+            raise ValueError("within: число часов от 0 до 8784")
+        now = _api_minute(query["now"]) if query.get("now") else _api_minute(datetime.datetime.now().isoformat())
+        lo, hi = max(lo, now), min(hi, now + int(within * 60))
+    return max(lo, 0), min(max(hi, lo), 1 << API_MINUTE_BITS)
+
+def api_select(index, query, rows):
+    """Оставляет из rows точки, подходящие под filter/role и окно времени (api_window); -> (точки, границы их смен)"""
+    for name, codes, values in (("filter", "filter_codes", "filters"), ("role", "role_codes", "roles")):
+        if query.get(name):
+            code = index[values].index(query[name]) if query[name] in index[values] else -1
+            rows = rows[index[codes][rows] == code]
+    lo_minute, hi_minute = api_window(query)
+    base = rows.astype(np.int64) << API_MINUTE_BITS
+    lo = np.searchsorted(index["shift_keys"], base + lo_minute, side="left")
+    hi = np.searchsorted(index["shift_keys"], base + hi_minute, side="left")
+    keep = hi > lo
+    return rows[keep], lo[keep], hi[keep]
+
+def api_features(index, rows, lo, hi, distances=None):
+    shifts = index["shifts"]
+    features = []
+    for i, (row, a, b) in enumerate(zip(rows.tolist(), lo.tolist(), hi.tolist())):
+        props = {"tt": index["tt"][row], "role": index["roles"][index["role_codes"][row]],
+                 "filterType": index["filters"][index["filter_codes"][row]], "store": str(index["store"][row]),
+                 "address": index["address"][row], "shifts": shifts[a:b]}
+        if distances is not None:
+            props["distanceKm"] = round(float(distances[i]), 3)
+        features.append({"type": "Feature", "id": row, "properties": props,
+                         "geometry": {"type": "Point", "coordinates": [float(index["lat"][row]), float(index["lon"][row])]}})
+    return {"type": "FeatureCollection", "features": features}
+
+def api_points(index, query):
+    """/api/points?bbox=lat1,lon1,lat2,lon2&filter=&role=&from=ГГГГ-ММ-ДД&to=ГГГГ-ММ-ДД&date=&within=&now=&limit=1000"""
+    if query.get("bbox"):
+        try:
+            lat1, lon1, lat2, lon2 = (float(v) for v in query["bbox"].split(","))
+        except ValueError:
+            raise ValueError("bbox: ожидается lat1,lon1,lat2,lon2") from None
+        _api_lat_lon(lat1, lon1, "bbox")
+        _api_lat_lon(lat2, lon2, "bbox")
+        rows = rows_in_bbox(index, min(lat1, lat2), min(lon1, lon2), max(lat1, lat2), max(lon1, lon2))
+    else:
+        rows = np.arange(len(index["lat"]))
+    limit = _api_int(query, "limit", str(API_DEFAULT_LIMIT), 1, API_MAX_LIMIT)
+    rows, lo, hi = api_select(index, query, rows)
+    result = api_features(index, rows[:limit], lo[:limit], hi[:limit])
+    result["total"] = len(rows)  # больше limit — клиенту стоит приблизить карту или взять clusters.json
+    return result
+
+def api_nearest(index, query):
+    """/api/nearest?lat=&lon=&n=5&filter=&role=&from=&to=&date=&within=&now= — точки n ближайших магазинов с подходящими сменами"""
+    lat, lon = _api_lat_lon(_api_float(query, "lat"), _api_float(query, "lon"))
+    n = _api_int(query, "n", "5", 1, API_MAX_NEAREST)
+    radius = GRID_CELL_DEG * 111.0
+    while True:  # как nearest_stores, но считаем магазины, а не точки, и только подходящие под фильтры
+        rows, dist = stores_within(index, lat, lon, radius)
+        picked, lo, hi = api_select(index, query, rows)
+        stores = pd.unique(index["tt"][picked])
+        if len(stores) >= n or radius >= API_MAX_RADIUS_KM:
+            break
+        radius *= 2
+    keep = np.isin(index["tt"][picked], stores[:n])
+    dist = dist[np.isin(rows, picked)]
+    return api_features(index, picked[keep], lo[keep], hi[keep], dist[keep])
+
+def api_counts(index, query):
+    """/api/counts?role=&from=&to=&date=&within=&now= — число точек с подходящими сменами по фильтрам (для кнопок)"""
+    rows, _, _ = api_select(index, query, np.arange(len(index["lat"])))
+    counts = np.bincount(index["filter_codes"][rows], minlength=len(index["filters"]))
+    return {"filters": dict(zip(index["filters"], counts.tolist())), "total": len(rows)}
+
+def make_api(index):
+    """-> respond(path, query_string) -> (статус, тело JSON). Ответы кэшируются по нормализованному запросу;
+    кэш ограничен суммарным размером тел, а не числом записей — ответ на крупный bbox весит мегабайты."""
+    routes = {
+        "/api/points": api_points,
+        "/api/nearest": api_nearest,
+        "/api/counts": api_counts,
+        "/api/filters": lambda index, query: {"filters": index["filters"], "roles": index["roles"], "points": len(index["lat"])},
+    }
+    cache, stats = OrderedDict(), Counter()
+
+    def build(path, query):
+        if path not in routes:
+            return 404, _json_bytes({"error": "нет такого адреса", "endpoints": sorted(routes)})
+        try:
+            return 200, _json_bytes(routes[path](index, dict(query)))
+        except (ValueError, OverflowError) as e:
+            return 400, _json_bytes({"error": str(e)})
+
+    def respond(path, query_string):
+        query = urllib.parse.parse_qsl(query_string)
+        # within без now отсчитывается от текущей минуты: она входит в ключ, иначе кэш отдавал бы старое окно
+        if any(name == "within" for name, _ in query) and not any(name == "now" for name, _ in query):
+            query.append(("now", datetime.datetime.now().strftime("%Y-%m-%dT%H:%M")))
+        key = (path, tuple(sorted(query)))
+        if key in cache:
+            cache.move_to_end(key)
+            stats["hits"] += 1
+            return cache[key]
+        stats["misses"] += 1
+        cache[key] = response = build(*key)
+        stats["bytes"] += len(response[1])
+        while stats["bytes"] > API_CACHE_BYTES and cache:
+            stats["bytes"] -= len(cache.popitem(last=False)[1][1])
+        return response
+
+    respond.cache_info = lambda: f"попаданий {stats['hits']}, промахов {stats['misses']}, " \
+                                 f"{len(cache)} ответов / {stats['bytes'] >> 20} МБ"
+    return respond
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                431: "Request Header Fields Too Large"}
+HTTP_LINE_LIMIT = 64 * 1024  # длиннее строка запроса или заголовка — 400 / 431 и закрываем соединение
+
+def http_response(status, body, keep_alive):
+    return (f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\nContent-Length: {len(body)}\r\n"
+            f"Access-Control-Allow-Origin: *\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+            .encode("latin-1") + body)
+
+async def handle_http(reader, writer, respond):
+    """Минимальный HTTP/1.1 с keep-alive: только GET, тело запроса не читаем"""
+    try:
+        while True:
+            status = 400
+            try:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers, status = {}, 431
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+            except (ValueError, asyncio.LimitOverrunError):
+                # Строка длиннее HTTP_LINE_LIMIT: читать дальше этот поток нельзя — отвечаем и закрываем
+                what = "строка запроса" if status == 400 else "заголовок"
+                writer.write(http_response(status, _json_bytes({"error": f"{what} длиннее {HTTP_LINE_LIMIT} байт"}), False))
+                await writer.drain()
+                break
+            parts = request_line.decode("latin-1").split()
+            if len(parts) != 3:
+                break
+            method, target, version = parts
+            if method == "GET":
+                url = urllib.parse.urlsplit(target)
+                status, body = respond(url.path, url.query)
+            else:
+                status, body = 405, _json_bytes({"error": "только GET"})
+            keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+            writer.write(http_response(status, body, keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+def serve(args, cache_index):
+    inputs = find_inputs(cache_index)
+    if inputs is None:
+        return
+    full_data = load_full_data(*inputs, args)
+    if full_data is None:
+        return
+    with stage("api index") as st:
+        index = build_api_index(full_data)
+        st["rows"] = len(index["lat"])
+    respond = make_api(index)
+    save_cache_index(cache_index)
+    report_metrics(args.metrics_log, run_info(args, "serve"))
+
+    async def run():
+        server = await asyncio.start_server(lambda r, w: handle_http(r, w, respond), args.host, args.port,
+                                            backlog=1024, limit=HTTP_LINE_LIMIT)
+        print(f"🌐 API: http://{args.host}:{args.port}/api/points — {len(index['lat'])} точек, "
+              f"{len(index['shifts'])} смен. Ctrl+C — остановить.")
+        async with server:
+            await server.serve_forever()
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        print(f"\n⏹ Сервер остановлен. Кэш ответов: {respond.cache_info()}")
+
+# ==========================================
+# 🔒 ОДИН ЗАПУСК ЗА РАЗ
+# ==========================================
+# Запуски по расписанию могут наложиться: сборка и публикация идут под блокировкой файла RUN_LOCK_FILE.
+# Запуск, заставший чужую сборку, не собирает параллельно и не ждёт, а оставляет заявку (RUN_PENDING_FILE)
+# и выходит; владелец блокировки, закончив, видит заявку и собирает ещё раз — один повтор на все заявки.
+RUN_LOCK_FILE = ".map_run.lock"
+RUN_PENDING_FILE = ".map_run.pending"
+RUN_LOCK_POLL_S = 0.5  # --watch ждёт чужую сборку, проверяя блокировку с таким шагом
+
+def _try_lock(f):
+    """Исключительная блокировка открытого файла без ожидания; False — её держит другой процесс"""
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
         else:
-            print(f"⚠️ Ошибка при пуше: {push_output}")
-else:
-    print("⚠️ Git не найден.")
\ No newline at end of file
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+def _unlock(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def take_run_request():
+    """Снять заявку на повторную сборку; True — она была"""
+    try:
+        os.remove(os.path.join(project_dir, RUN_PENDING_FILE))
+        return True
+    except FileNotFoundError:
+        return False
+
+@contextlib.contextmanager
+def run_lock():
+    """Блокировка запуска с ожиданием — для --watch, который не может просто выйти"""
+    with open(os.path.join(project_dir, RUN_LOCK_FILE), "a") as lock:
+        while not _try_lock(lock):
+            time.sleep(RUN_LOCK_POLL_S)
+        try:
+            yield
+        finally:
+            _unlock(lock)
+
+def run_exclusive(run):
+    """run() под блокировкой запуска и повторы по заявкам, пришедшим, пока он шёл.
+    -> False, если сборку уже ведёт другой процесс (ему оставлена заявка)"""
+    pending = os.path.join(project_dir, RUN_PENDING_FILE)
+    with open(os.path.join(project_dir, RUN_LOCK_FILE), "a") as lock:
+        if not _try_lock(lock):
+            open(pending, "a").close()
+            # Владелец мог отпустить блокировку, не успев увидеть заявку, — тогда выполняем её сами
+            if not _try_lock(lock):
+                print("⏳ Сборка уже идёт в другом процессе — после неё карта соберётся ещё раз. Выходим.")
+                return False
+        while True:
+            take_run_request()  # эта сборка учтёт всё, что пришло до её начала
+            run()
+            if not os.path.exists(pending):
+                _unlock(lock)
+                # Заявка, оставленная между проверкой и снятием блокировки, тоже не должна потеряться
+                if not os.path.exists(pending) or not _try_lock(lock):
+                    return True
+            print("\n🔁 Пока шла сборка, пришли новые запуски — собираем ещё раз.")
+
+def main(argv=None):
+    global use_cache
+    parser = argparse.ArgumentParser(description="Генерация карты смен (index.html) и публикация на GitHub Pages")
+    parser.add_argument("--force", action="store_true", help="пересобрать карту, даже если входные файлы не менялись")
+    parser.add_argument("--no-cache", action="store_true", help="не читать и не писать кэш разобранных файлов")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="сколько процессов читают листы Excel (1 — без пула)")
+    parser.add_argument("--excel-engine", choices=["auto", "openpyxl", "calamine"], default="auto",
+                        help="движок чтения xlsx; auto берёт calamine, если он установлен")
+    parser.add_argument("--layout", choices=["split", "inline"], default="split",
+                        help="split — оболочка index.html + папка data/ с ленивой подгрузкой; inline — всё в одном файле")
+    parser.add_argument("--cards", choices=["html", "template"], default="html",
+                        help="html — готовый HTML карточек в данных; template — только данные смен, карточки рисует JS страницы")
+    parser.add_argument("--stream", action="store_true",
+                        help="потоковый режим для очень больших выгрузок: куски CSV, тайлы через временные файлы (только --layout split)")
+    parser.add_argument("--chunksize", type=int, default=200_000, help="строк CSV в одном куске для --stream")
+    parser.add_argument("--watch", action="store_true",
+                        help="не выходить: следить за папкой и пересобирать карту при изменении входных файлов")
+    parser.add_argument("--debounce", type=float, default=WATCH_DEBOUNCE_S,
+                        help="--watch: сколько секунд тишины ждать после изменения, прежде чем собирать")
+    parser.add_argument("--publish-window", type=float, default=PUBLISH_WINDOW_S,
+                        help="--watch: не чаще одного коммита за столько секунд; сборки внутри окна публикуются вместе")
+    parser.add_argument("--serve", action="store_true",
+                        help="не собирать карту, а поднять HTTP API над данными (/api/points, /api/nearest, /api/counts, /api/filters)")
+    parser.add_argument("--host", default=API_HOST, help="--serve: адрес, на котором слушать")
+    parser.add_argument("--port", type=int, default=API_PORT, help="--serve: порт")
+    parser.add_argument("--no-publish", action="store_true", help="только собрать, без git commit/push (для замеров и проверки)")
+    parser.add_argument("--metrics-log", default=METRICS_LOG,
+                        help="куда дописывать строку JSON с замерами этапов каждого запуска ('' — не писать)")
+    parser.add_argument("--profile", choices=STAGES, help="снять профиль одного этапа (файл profile_<этап> в папке проекта)")
+    parser.add_argument("--profiler", choices=["cprofile", "pyinstrument"], default="cprofile",
+                        help="--profile: чем профилировать (pyinstrument — если установлен)")
+    args = parser.parse_args(argv)
+    if args.stream and args.layout != "split":
+        parser.error("--stream работает только с --layout split")
+    use_cache = not args.no_cache
+    if args.profile:
+        start_profiling(args.profile, args.profiler)
+
+    print(f"📂 Папка проекта: {project_dir}")
+    if args.serve:
+        serve(args, load_cache_index())
+        return
+    if args.watch:
+        watch(args, load_cache_index())
+        return
+    run_exclusive(lambda: build_and_publish(args))
+
+def build_and_publish(args):
+    """Один запуск: сборка, если входные файлы изменились, и публикация. Кэш читается здесь, под блокировкой:
+    предыдущая сборка могла его обновить"""
+    cache_index = load_cache_index()
+    result = run_build(args, cache_index, cache_index.get("build"))
+    if result is None:
+        save_cache_index(cache_index)
+        report_metrics(args.metrics_log, run_info(args, "unchanged"))
+        return
+    build_key, changed = result
+    if args.no_publish:
+        print(f"ℹ️ Публикация отключена (--no-publish): изменено {len(changed)} файлов.")
+        save_cache_index(cache_index)
+        report_metrics(args.metrics_log, run_info(args, "built"))
+        return
+    with stage("publish") as st:
+        published = publish(changed)
+        st["rows"] = len(changed)
+    if published:
+        cache_index["build"] = build_key
+    save_cache_index(cache_index)
+    report_metrics(args.metrics_log, run_info(args, "published" if published else "built"))
+
+def run_info(args, result):
+    """Что записать в журнал замеров рядом с этапами: режим сборки и чем закончился запуск"""
+    return {"result": result, "layout": args.layout, "cards": args.cards, "stream": args.stream,
+            "workers": args.workers, "cache": use_cache}
+
+def run_build(args, cache_index, last_build):
+    """Одна сборка без публикации: -> (отпечаток сборки, изменённые пути) или None, если строить нечего"""
+    inputs = find_inputs(cache_index)
+    if inputs is None:
+        return None
+    files, coords_filename, file_digests, regions = inputs
+
+    # Если ни один входной файл (и regions.json, rules.json) не изменился с прошлой сборки — карта уже актуальна
+    build_key = build_fingerprint([f"{f}:{digest}" for f, digest in file_digests.items()] + [f"layout:{args.layout}", f"cards:{args.cards}", f"stream:{args.stream}"])
+    if (use_cache and not args.force and last_build == build_key
+            and all(os.path.exists(os.path.join(project_dir, r["dir"], "index.html")) for r in regions)):
+        print("ℹ️ Входные файлы не изменились — карта уже актуальна.")
+        return None
+
+    if args.stream:
+        changed = build_streaming(files, coords_filename, file_digests, regions, args)
+    else:
+        changed = build_in_memory(files, coords_filename, file_digests, regions, args)
+    if changed is None:
+        return None
+    print("✅ Файл 'index.html' обновлен." if len(regions) == 1 else f"✅ Обновлены карты регионов: {len(regions)}.")
+    prune_cache(cache_index, file_digests, regions)
+    return build_key, changed
+
+def find_inputs(cache_index):
+    """-> (файлы потребности, файл координат, sha256 каждого файла, регионы) или None, если нет координат
+    или regions.json / rules.json с ошибкой"""
+    with stage("discovery") as st:
+        # Ищем файлы (оптимизация: объединяем поиск Excel и CSV)
+        files, coords_files, stats = discover_inputs(project_dir)
+        if not coords_files:
+            print("🛑 ОШИБКА: Файл координат не найден.")
+            return None
+        coords_filename = coords_files[0]  # Берем первый подходящий
+        file_digests = {f: content_hash(os.path.join(project_dir, f), cache_index, stats[f]) for f in files + [coords_filename]}
+        for name in (REGIONS_FILE, RULES_FILE):
+            if name in stats:
+                file_digests[name] = content_hash(os.path.join(project_dir, name), cache_index, stats[name])
+        try:
+            regions = load_regions()
+        except (OSError, ValueError) as e:
+            print(f"🛑 ОШИБКА в {REGIONS_FILE}: {e}")
+            return None
+        try:
+            set_role_rules(load_role_rules())
+        except (OSError, ValueError) as e:
+            print(f"🛑 ОШИБКА в {RULES_FILE}: {e}")
+            return None
+        st["rows"] = len(file_digests)
+    return files, coords_filename, file_digests, regions
+
+def render_page(buttons_html, total_points):
+    return lambda styles, scripts: HTML_TEMPLATE.format(
+        API_KEY=API_KEY, buttons_html=buttons_html, total_points=total_points, styles=styles, scripts=scripts)
+
+def load_needs_df(files, file_digests, args, registry):
+    """-> (актуальные смены с оплатой, сколько строк найдено по номеру магазина) или None, если файлов нет"""
+    with stage("load") as st:
+        all_needs = load_needs(files, file_digests, pick_excel_engine(args.excel_engine), args.workers)
+        if not all_needs:
+            print("🛑 ОШИБКА: Файлы не найдены.")
+            return None
+        needs_df = standardize_needs(concat_needs(all_needs))
+        st["rows"] = len(needs_df)
+    with stage("merge"):
+        fuzzy = canonicalize_tt(needs_df, registry)
+    return prepare_needs(needs_df), fuzzy
+
+def load_registry(coords_filename, file_digests, regions):
+    """Реестр магазинов с номером региона каждого магазина (registry["region"], -1 — вне регионов)"""
+    with stage("merge"):
+        registry = load_store_registry(coords_filename, file_digests[coords_filename])
+        registry["region"] = assign_regions(registry["lat"], registry["lon"], regions)
+        return registry
+
+def load_full_data(files, coords_filename, file_digests, regions, args):
+    """Актуальные смены с координатами магазинов всех регионов (для --serve)"""
+    registry = load_registry(coords_filename, file_digests, regions)
+    loaded = load_needs_df(files, file_digests, args, registry)
+    if loaded is None:
+        return None
+    needs_df, fuzzy = loaded
+    return merge_coords(needs_df, registry, fuzzy)
+
+def build_in_memory(files, coords_filename, file_digests, regions, args):
+    registry = load_registry(coords_filename, file_digests, regions)
+    loaded = load_needs_df(files, file_digests, args, registry)
+    if loaded is None:
+        return None
+    needs_df, fuzzy = loaded
+    full_data = merge_coords(needs_df, registry, fuzzy)
+    codes = full_data['Регион'].to_numpy()
+    parts = [full_data if len(regions) == 1 else full_data[codes == i] for i in range(len(regions))]
+    return build_regions(build_region, regions, [(part, args) for part in parts], args)
+
+def build_region(region, full_data, args):
+    """Сайт одного региона из его строк -> изменённые пути"""
+    # --- СБОР СТАТИСТИКИ ПО ЗАРПЛАТАМ ДЛЯ МЕНЮ ---
+    with stage("pay calc"):
+        salary_stats = salary_ranges(full_data)
+    grouped = group_shifts(full_data) if args.cards == "template" else group_cards(full_data, region)
+
+    print("\n🚀 Генерируем обновленный интерфейс...")
+    with stage("json") as st:
+        features, filter_counts = build_features(grouped, args.cards)
+        st["rows"] = len(features)
+    buttons_html = build_buttons(filter_counts, salary_stats)
+    with stage("write") as st:
+        changed = write_site([features], render_page(buttons_html, len(grouped)), args.layout, region)
+        st["rows"] = len(changed)
+    return changed
+
+def build_streaming(files, coords_filename, file_digests, regions, args):
+    registry = load_registry(coords_filename, file_digests, regions)
+    with tempfile.TemporaryDirectory(prefix="map_spill_") as spill_dir:
+        salary = stream_needs(files, registry, pick_excel_engine(args.excel_engine), args.chunksize, spill_dir)
+        jobs = [(os.path.join(spill_dir, str(i)), salary.get(i, {}), args) for i in range(len(regions))]
+        return build_regions(build_region_streaming, regions, jobs, args)
+
+def build_region_streaming(region, spill_dir, salary_stats, args):
+    """Сайт одного региона из его тайлов во временной папке -> изменённые пути"""
+    print("\n🚀 Генерируем обновленный интерфейс...")
+    filter_counts = Counter()
+    # Кнопки зависят от счётчиков, которые наполняются по ходу записи тайлов: страницу рендерим последней
+    with stage("write") as st:
+        changed = write_site(stream_features(spill_dir, args.cards, filter_counts, region["manager"]),
+                             lambda styles, scripts: render_page(build_buttons(filter_counts, salary_stats),
+                                                                 sum(filter_counts.values()))(styles, scripts),
+                             args.layout, region)
+        st["rows"] = len(changed)
+    return changed
+
+def run_region(build, region, cache_enabled, *job):
+    """build для одного региона с site_dir = папка региона -> изменённые пути от папки проекта.
+    Годится и для пула процессов: при spawn (Windows) дочерний процесс не видит флагов родителя — use_cache передаём."""
+    global use_cache, site_dir
+    use_cache = cache_enabled
+    site_dir = os.path.join(project_dir, region["dir"])
+    try:
+        changed = build(region, *job)
+    finally:
+        site_dir = project_dir
+    return [f"{region['dir']}/{path}" if region["dir"] else path for path in changed]
+
+def build_regions(build, regions, jobs, args):
+    """Сайты всех регионов: по очереди или параллельно в пуле процессов (--workers).
+    jobs[i] — аргументы build для i-го региона после самого региона."""
+    workers = min(args.workers, len(regions))
+    calls = [(build, region, use_cache, *job) for region, job in zip(regions, jobs)]
+    if len(regions) > 1:
+        print(f"🗺️ Регионы: {', '.join(r['name'] for r in regions)}"
+              + (f" — собираем параллельно ({workers} процессов)" if workers > 1 else ""))
+    if workers > 1:
+        with stage("regions") as st:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(run_region, *zip(*calls)))
+            st["rows"] = len(regions)
+    else:
+        results = [run_region(*call) for call in calls]
+    return [path for region_changed in results for path in region_changed]
+
+# Запуск: python Map1.py [флаги] или python -m Map1 [флаги] — во втором случае байт-код берётся
+# из __pycache__, и на старте не тратятся ~40 мс на компиляцию скрипта. Из других скриптов: Map1.main([...]).
+if __name__ == "__main__":
+    main()
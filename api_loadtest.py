@@ -0,0 +1,119 @@
+"""Нагрузочный тест HTTP API карты (python Map1.py --serve).
+
+Держит --concurrency соединений keep-alive, каждое шлёт запросы подряд: прямоугольники вокруг Москвы,
+фильтры, диапазоны дат и «ближайшие N часов», ближайшие магазины. Печатает p50/p90/p99/max задержки и запросы в секунду.
+Только stdlib: python api_loadtest.py --port 8080 --concurrency 300 --requests 30000
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import datetime
+import urllib.parse
+
+# Москва и ближайшее Подмосковье — там же, где точки карты
+LAT_RANGE, LON_RANGE = (55.55, 55.95), (37.35, 37.85)
+
+
+async def fetch(reader, writer, host, target):
+    writer.write(f"GET {target} HTTP/1.1\r\nHost: {host}\r\nConnection: keep-alive\r\n\r\n".encode("latin-1"))
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while (line := await reader.readline()) not in (b"\r\n", b""):
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    return status, await reader.readexactly(length)
+
+
+def make_targets(filters, roles, count, distinct, seed):
+    """count запросов из distinct разных: реальная карта шлёт одни и те же окна снова и снова"""
+    rnd = random.Random(seed)
+    today = datetime.date.today()
+    pool = []
+    for _ in range(distinct):
+        kind = rnd.random()
+        params = {}
+        if rnd.random() < 0.5 and filters:
+            params["filter"] = rnd.choice(filters)
+        elif rnd.random() < 0.3 and roles:
+            params["role"] = rnd.choice(roles)
+        if rnd.random() < 0.3:
+            start = today + datetime.timedelta(days=rnd.randint(0, 3))
+            params["from"] = start.isoformat()
+            params["to"] = (start + datetime.timedelta(days=rnd.randint(0, 7))).isoformat()
+        elif rnd.random() < 0.2:
+            params["within"] = rnd.choice([2, 4, 8, 24])  # «начало в ближайшие N часов»
+        lat, lon = rnd.uniform(*LAT_RANGE), rnd.uniform(*LON_RANGE)
+        if kind < 0.7:
+            size = rnd.choice([0.005, 0.01, 0.02, 0.04])  # окно карты на телефоне/ноутбуке, зум 12–15
+            params["bbox"] = f"{lat - size:.4f},{lon - size * 1.8:.4f},{lat + size:.4f},{lon + size * 1.8:.4f}"
+            pool.append("/api/points?" + urllib.parse.urlencode(params))
+        else:
+            params.update(lat=f"{lat:.4f}", lon=f"{lon:.4f}", n=rnd.choice([1, 5, 10, 20]))
+            pool.append("/api/nearest?" + urllib.parse.urlencode(params))
+    return [rnd.choice(pool) for _ in range(count)]
+
+
+async def worker(host, port, queue, latencies, sizes, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while True:
+            try:
+                target = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            start = time.perf_counter()
+            status, body = await fetch(reader, writer, host, target)
+            latencies.append(time.perf_counter() - start)
+            sizes.append(len(body))
+            if status != 200:
+                errors.append((status, target))
+    finally:
+        writer.close()
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+
+async def run(args):
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+    status, body = await fetch(reader, writer, args.host, "/api/filters")
+    writer.close()
+    info = json.loads(body)
+    print(f"📋 Сервер: {info['points']} точек, фильтров {len(info['filters'])}, должностей {len(info['roles'])}")
+
+    queue = asyncio.Queue()
+    for target in make_targets(info["filters"], info["roles"], args.requests, args.distinct, args.seed):
+        queue.put_nowait(target)
+    latencies, sizes, errors = [], [], []
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(args.host, args.port, queue, latencies, sizes, errors) for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    ms = lambda p: f"{percentile(latencies, p) * 1000:.1f}"
+    print(f"🚀 {len(latencies)} запросов, {args.concurrency} соединений, {elapsed:.1f} с — {len(latencies) / elapsed:.0f} запр/с")
+    print(f"📦 Ответ в среднем {sum(sizes) / len(sizes) / 1024:.0f} КБ, всего {sum(sizes) >> 20} МБ")
+    print(f"⏱ p50 {ms(50)} мс · p90 {ms(90)} мс · p99 {ms(99)} мс · max {latencies[-1] * 1000:.1f} мс")
+    if errors:
+        print(f"⚠️ Ошибок: {len(errors)}, например {errors[0]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест API карты смен (Map1.py --serve)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--concurrency", type=int, default=300, help="одновременных соединений")
+    parser.add_argument("--requests", type=int, default=30_000, help="всего запросов")
+    parser.add_argument("--distinct", type=int, default=2_000,
+                        help="разных запросов среди них (меньше — больше попаданий в кэш сервера)")
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
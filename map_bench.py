@@ -0,0 +1,491 @@
+"""Воспроизводимые замеры Map1.py по этапам на синтетических данных (map_synth.py) — в духе asv.
+
+    python map_bench.py run --scales 10k,100k,1m --modes split-html,split-template,stream-template --repeat 3
+    python map_bench.py compare HEAD~3            # последние результаты HEAD~3 против текущего коммита
+    python map_bench.py compare v1 v2 --threshold 0.15
+    python map_bench.py compare HEAD HEAD+dirty   # незакоммиченные правки против HEAD
+    python map_bench.py micro --case columns --rows 500k   # векторные столбцы против прежних apply по строкам
+    python map_bench.py micro --case dates --rows 1m       # даты и время смен против разбора по строкам
+
+run: для каждого масштаба генерирует данные (один раз, кэшируются в .map_bench/data), запускает Map1.py
+--force --no-publish в отдельной папке и берёт замеры этапов из его журнала (--metrics-log). Каждый запуск —
+с нуля: без кэша разобранных файлов и без прошлых выходных файлов (--warm — наоборот, повторная сборка с кэшем).
+Медианы по повторам дописываются в .map_bench/results.jsonl вместе с коммитом, версиями библиотек и машиной.
+
+micro: замер отдельных функций Map1.py в этом процессе против исходных построчных реализаций (они же — эталон
+для tests/): результаты обязаны совпасть, иначе замер падает. В results.jsonl попадают с режимом micro-<case>,
+этапы — столбцы, так что compare работает и для них.
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+import urllib.parse
+
+import numpy as np
+import pandas as pd
+
+import Map1
+import map_synth
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+MAP_SCRIPT = os.path.join(ROOT, "Map1.py")
+BENCH_DIR = os.path.join(ROOT, ".map_bench")
+RESULTS = os.path.join(BENCH_DIR, "results.jsonl")
+MODES = {
+    "split-html": ["--layout", "split", "--cards", "html"],
+    "split-template": ["--layout", "split", "--cards", "template"],
+    "inline-html": ["--layout", "inline", "--cards", "html"],
+    "stream-template": ["--layout", "split", "--cards", "template", "--stream"],
+}
+OUTPUTS = ["index.html", "index.html.gz", "index.html.br", "data", "assets", ".map_cache", "unmatched_tt.csv"]
+
+
+def git(*args):
+    try:
+        return subprocess.run(["git", *args], cwd=ROOT, check=True, capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def machine_info():
+    import numpy
+    import pandas
+    return {"python": platform.python_version(), "pandas": pandas.__version__, "numpy": numpy.__version__,
+            "platform": platform.platform(), "cpus": os.cpu_count()}
+
+
+def dataset(scale, seed, fmt, files):
+    """Папка с входными файлами для масштаба; генерируется один раз"""
+    path = os.path.join(BENCH_DIR, "data", f"{scale}-{fmt}-f{files}-s{seed}")
+    done = os.path.join(path, ".done")
+    if not os.path.exists(done):
+        shutil.rmtree(path, ignore_errors=True)
+        print(f"🧪 Генерируем {scale} строк ({fmt}, файлов: {files})...")
+        map_synth.generate(path, map_synth.parse_rows(scale), files, fmt, seed)
+        open(done, "w").close()
+    return path
+
+
+def prepare_workdir(data_dir, name, warm):
+    """Рабочая папка сборки: ссылки на входные файлы; для холодного запуска — без выходных файлов и кэша"""
+    work = os.path.join(BENCH_DIR, "work", name)
+    os.makedirs(work, exist_ok=True)
+    if not warm:
+        for entry in OUTPUTS:
+            target = os.path.join(work, entry)
+            if os.path.isdir(target):
+                shutil.rmtree(target)
+            elif os.path.exists(target):
+                os.remove(target)
+    for entry in os.listdir(data_dir):
+        link = os.path.join(work, entry)
+        if not entry.startswith(".") and not os.path.lexists(link):
+            os.symlink(os.path.join(data_dir, entry), link)
+    return work
+
+
+def run_once(work, mode_args, warm):
+    """Один запуск Map1.py: -> (стена процесса вместе с импортами, строка журнала этапов)"""
+    log = os.path.join(work, "bench_metrics.jsonl")
+    if os.path.exists(log):
+        os.remove(log)
+    cmd = [sys.executable, MAP_SCRIPT, "--force", "--no-publish", "--metrics-log", log, *mode_args]
+    if not warm:
+        cmd.append("--no-cache")
+    start = time.perf_counter()
+    with open(os.path.join(work, "bench_output.txt"), "w+", encoding="utf-8") as output:
+        returncode = subprocess.run(cmd, cwd=work, stdout=output, stderr=subprocess.STDOUT).returncode
+        wall = time.perf_counter() - start
+        if returncode != 0:
+            output.seek(0)
+            raise RuntimeError(f"Map1.py завершился с кодом {returncode}:\n{output.read()[-2000:]}")
+    with open(log, encoding="utf-8") as f:
+        return wall, json.loads(f.read().splitlines()[-1])
+
+
+def summarize(runs):
+    """Медианы стены/CPU и максимум пика памяти по повторам, по каждому этапу"""
+    stages = {}
+    for name in dict.fromkeys(n for _, line in runs for n in line["stages"]):
+        values = [line["stages"][name] for _, line in runs if name in line["stages"]]
+        stages[name] = {"wall_s": round(statistics.median(v["wall_s"] for v in values), 4),
+                        "cpu_s": round(statistics.median(v["cpu_s"] for v in values), 4),
+                        "peak_mb": round(max(v["peak_mb"] for v in values), 1),
+                        "rows": values[-1]["rows"]}
+    # Map1.py сбрасывает пик RSS в начале каждого этапа, так что пик процесса — максимум пиков этапов.
+    # Сбросить пик можно только на Linux: на других системах пик этапа — пик процесса с начала запуска
+    return {"total_wall_s": round(statistics.median(w for w, _ in runs), 3),
+            "peak_rss_mb": max((m["peak_mb"] for m in stages.values()), default=0.0),
+            "peak_per_stage": all(line.get("peak_per_stage", True) for _, line in runs),
+            "stages": stages}
+
+
+def cmd_run(args):
+    commit = git("rev-parse", "HEAD")
+    dirty = bool(git("status", "--porcelain", "--", "Map1.py"))
+    info = machine_info()
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    for scale in args.scales.split(","):
+        data_dir = dataset(scale, args.seed, args.format, args.files)
+        for mode in args.modes.split(","):
+            work = prepare_workdir(data_dir, f"{scale}-{mode}", args.warm)
+            if args.warm:
+                run_once(work, MODES[mode], warm=True)  # прогрев: кэш и выходные файлы
+            runs = []
+            for i in range(args.repeat):
+                if not args.warm:
+                    work = prepare_workdir(data_dir, f"{scale}-{mode}", False)
+                runs.append(run_once(work, MODES[mode], args.warm))
+                print(f"   {scale:>6} {mode:<16} #{i + 1}: {runs[-1][0]:.2f} с")
+            result = {"time": datetime.datetime.now().isoformat(timespec="seconds"), "commit": commit, "dirty": dirty,
+                      "scale": scale, "mode": mode, "warm": args.warm, "seed": args.seed, "format": args.format,
+                      "files": args.files, "repeat": args.repeat, "machine": info, **summarize(runs)}
+            with open(RESULTS, "a", encoding="utf-8") as f:
+                f.write(json.dumps(result, ensure_ascii=False) + "\n")
+            print_result(result)
+
+
+def print_result(result):
+    print(f"\n⏱️ {result['scale']} / {result['mode']}{' (warm)' if result['warm'] else ''}: "
+          f"{result['total_wall_s']:.2f} с, пик {result['peak_rss_mb']} МБ")
+    for name, m in result["stages"].items():
+        print(f"   {name:<12} {m['wall_s']:>8.3f} с {m['cpu_s']:>8.3f} CPU {m['peak_mb']:>8.0f} МБ {m['rows'] or '—':>10}")
+
+
+def load_results(rev):
+    """Последний результат каждого (масштаб, режим, warm) для коммита rev; 'rev+dirty' — замеры с незакоммиченным Map1.py"""
+    dirty = rev.endswith("+dirty")
+    rev = rev[:-len("+dirty")] if dirty else rev
+    commit = git("rev-parse", rev) or rev
+    latest = {}
+    if os.path.exists(RESULTS):
+        with open(RESULTS, encoding="utf-8") as f:
+            for line in f:
+                r = json.loads(line)
+                if r["commit"].startswith(commit) and r["dirty"] == dirty:
+                    latest[(r["scale"], r["mode"], r["warm"])] = r
+    return commit + ("+dirty" if dirty else ""), latest
+
+
+def cmd_compare(args):
+    base_commit, base = load_results(args.base)
+    head_commit, head = load_results(args.head)
+    if not base or not head:
+        sys.exit(f"🛑 Нет результатов для {args.base if not base else args.head} — сначала map_bench.py run на этом коммите.")
+    worse = 0
+    print(f"📊 {base_commit[:10]} → {head_commit[:10]} (порог {args.threshold:.0%})")
+    for key in sorted(base.keys() & head.keys()):
+        a, b = base[key], head[key]
+        print(f"\n{key[0]} / {key[1]}{' (warm)' if key[2] else ''}")
+        rows = [("всего", a["total_wall_s"], b["total_wall_s"])]
+        rows += [(n, a["stages"][n]["wall_s"], b["stages"][n]["wall_s"]) for n in b["stages"] if n in a["stages"]]
+        for name, before, after in rows:
+            ratio = after / before if before > 0 else float("inf")
+            # Доли секунды шумят сильнее порога — отмечаем только заметные в абсолютном выражении
+            mark = ""
+            if abs(after - before) >= args.min_seconds:
+                if ratio > 1 + args.threshold:
+                    mark, worse = "📈 медленнее", worse + 1
+                elif ratio < 1 - args.threshold:
+                    mark = "📉 быстрее"
+            print(f"   {name:<12} {before:>9.3f} → {after:>9.3f} с  ×{ratio:5.2f}  {mark}")
+        if a["peak_rss_mb"] and b["peak_rss_mb"]:
+            print(f"   {'пик памяти':<12} {a['peak_rss_mb']:>9.0f} → {b['peak_rss_mb']:>9.0f} МБ")
+    sys.exit(1 if worse and args.fail else 0)
+
+
+# === ИСХОДНЫЕ ПОСТРОЧНЫЕ РЕАЛИЗАЦИИ ===
+# Так Map1.py считал столбцы до векторизации — apply по строкам. Ставки и телефон — те же, что в Map1.py.
+def standardize_role_name(name):
+    clean = str(name).lower().strip()
+    clean = " ".join(clean.split())
+
+    if "построчно" in clean:
+        if "сборщик" in clean:
+            return "Сборщик (построчно)"
+        return clean.capitalize()
+
+    if "грузчик" in clean:
+        return "Ночной грузчик" if "ноч" in clean else "Дневной грузчик"
+
+    if "сборщик" in clean:
+        return "Ночной сборщик" if "ноч" in clean else "Дневной сборщик"
+
+    if "продавец" in clean:
+        return "Ночной продавец" if "ноч" in clean else "Дневной продавец"
+
+    if "кассир" in clean:
+        return "Кассир"
+    if "бариста" in clean:
+        return "Бариста"
+    if "убор" in clean or "клинер" in clean:
+        return "Уборщица"
+    if "повар" in clean:
+        return "Повар"
+    return clean.capitalize()
+
+
+def detect_store_type(tt_str):
+    return "Darkstore" if "дс" in str(tt_str).lower() else "Whitestore"
+
+
+def parse_time(time_str):
+    try:
+        h, m = map(int, str(time_str).split(':'))
+        return h + m / 60
+    except:  # noqa: E722 — как в исходной версии
+        return np.nan
+
+
+def parse_date_row(value):
+    """Дата одной ячейки: первый подошедший формат из DATE_FORMATS — разбор по строкам, без определения формата файла"""
+    for fmt in Map1.DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(value.strip(), fmt)
+        except ValueError:
+            pass
+    return None
+
+
+def get_pay_value(row):
+    role = str(row['Должность'])
+    hours = row['Часы']
+    s_type = row['Тип_По_ТТ']
+
+    if "построчно" in role.lower():
+        return 0
+
+    rate = Map1.RATES_DS.get(role, 0) if s_type == "Darkstore" else Map1.RATES_WS.get(role, 0)
+    return int(hours * rate)
+
+
+def get_pay_str(row):
+    val = row['Pay_Numeric']
+    role = str(row['Должность'])
+    s_type = row['Тип_По_ТТ']
+    rate = Map1.RATES_DS.get(role, 0) if s_type == "Darkstore" else Map1.RATES_WS.get(role, 0)
+
+    if "построчно" in role.lower():
+        return "💰 Сдельная"
+    if val > 0:
+        return f"💰 {rate} ₽/ч (≈<b>{val}₽</b>)"
+    return "💰 Уточняйте"
+
+
+def get_role_icon(role):
+    role = role.lower()
+    if "грузчик" in role:
+        return "📦"
+    if "бариста" in role:
+        return "☕"
+    if "сборщик" in role:
+        return "🎒"
+    return "🛒"
+
+
+def make_card_html(row, manager=Map1.MANAGER_PHONE):
+    d_str = row['Дата_DT'].strftime('%d.%m') if not pd.isna(row['Дата_DT']) else str(row['Дата выхода'])
+    lat, lon = row['Широта'], row['Долгота']
+
+    wa_text = (f"Здравствуйте! Хочу записаться на смену.\n"
+               f"💼 Должность: {row['Должность']}\n"
+               f"📍 Адрес: {row['Адрес']}\n"
+               f"📅 Дата: {d_str}\n"
+               f"🕒 Время: {row['Начало смены']} - {row['Конец смены']}")
+
+    wa_encoded = urllib.parse.quote(wa_text)
+    wa_link = f"https://wa.me/{manager}?text={wa_encoded}"
+    w_nav = f"https://yandex.ru/maps/?rtext=~{lat},{lon}&rtt=mt"
+
+    return (f"<div style='margin-bottom:12px; border-bottom:1px solid #eee; padding-bottom:8px; font-family:sans-serif;'>"
+            f"📅 <b>{d_str}</b> | 👤 {row['Количество сотрудников']} чел.<br>"
+            f"🕒 {row['Начало смены']} - {row['Конец смены']} | {row['Pay']}<br>"
+            f"<div style='margin-top:8px; display:flex; flex-direction:column; gap:8px;'>"
+            f"<a href='{wa_link}' target='_blank' style='background:#25D366; color:white; padding:10px; border-radius:6px; text-decoration:none; font-weight:bold; text-align:center;'>📝 Записаться через WhatsApp</a>"
+            f"<a href='{w_nav}' target='_blank' style='background:#f0f0f0; color:black; border:1px solid #ccc; padding:8px; border-radius:6px; text-decoration:none; font-size:14px; text-align:center;'>📍 Построить маршрут</a>"
+            f"<div style='display:flex; gap:5px; margin-top:5px;'>"
+            f" <button onclick='openInfo()' style='flex:1; background:#007bff; color:white; border:none; padding:8px; border-radius:6px; cursor:pointer; font-weight:bold; font-size:12px;'>ℹ️ Инфо</button>"
+            f" <button onclick='openWhatsAppWithGreeting()' style='flex:1; background:#128c7e; color:white; border:none; padding:8px; border-radius:6px; cursor:pointer; font-weight:bold; font-size:12px;'>📞 Менеджер</button>"
+            f"</div>"
+            f"</div></div>")
+
+
+def columns_frame(rows, seed=1):
+    """rows строк map_synth, прошедших clean_and_check и расчёт столбцов Map1.py (без фильтра по дате), только
+    найденные в реестре магазины — с адресом и координатами. Исходное написание должности — в 'Должность_исх'."""
+    coords_path = os.path.join(ROOT, "Мапа - result_coords.csv")
+    rng = np.random.default_rng(seed)
+    raw = map_synth.generate_chunk(map_synth.store_codes(coords_path), rng, rows, datetime.date.today(), 0.3, "%d.%m.%Y")
+    df = Map1.clean_and_check(raw.rename(columns=map_synth.HEADERS[1]), "Сегодня.csv")
+    df['Должность_исх'] = df['Должность'].astype(object)
+    coords = pd.read_csv(coords_path)
+    coords.columns = [c.strip() for c in coords.columns]
+    registry = Map1.build_store_registry(coords)
+    Map1.canonicalize_tt(df, registry)
+    found = Map1.match_stores(registry, df['ТТ'])[0].to_numpy()
+    df = df[found >= 0].copy()
+    found = found[found >= 0]
+    df['Адрес'], df['Широта'], df['Долгота'] = registry["address"][found], registry["lat"][found], registry["lon"][found]
+    return Map1.add_pay_columns(Map1.add_store_types(Map1.standardize_needs(df)))
+
+
+def column_cases(df):
+    """Столбец -> (векторная версия, исходная построчная); обе -> список значений по строкам"""
+    def roles():
+        Map1.role_rules = Map1.compile_role_rules({})  # без памяти прошлых прогонов: честный холодный замер
+        return Map1.standardize_roles(df['Должность_исх']).astype(object).tolist()
+
+    def pay():
+        rates, piecework, icons, names = Map1.role_columns(df['Должность'], df['Тип_По_ТТ'])
+        values = Map1.get_pay_values(df['Должность'], df['Часы'], rates, piecework)
+        return list(zip(values.tolist(), Map1.get_pay_strs(values, rates, piecework).astype(object).tolist(),
+                        icons.astype(object).tolist(), names.astype(object).tolist()))
+
+    def pay_reference():
+        values = df.apply(get_pay_value, axis=1)
+        strs = df.assign(Pay_Numeric=values).apply(get_pay_str, axis=1)
+        icons = df['Должность'].astype(object).apply(get_role_icon)
+        return list(zip(values.tolist(), strs.tolist(), icons.tolist(), (icons + " " + df['Должность'].astype(object)).tolist()))
+
+    def cards(render, block=50_000):
+        # Карточки 500k строк — гигабайты строк: сравниваем хэши кусков, а не сами строки
+        return [hashlib.sha256("\0".join(render(df.iloc[i:i + block])).encode()).hexdigest()
+                for i in range(0, len(df), block)]
+
+    # Исходный parse_time понимал только 'Ч:ММ'; на остальных форматах сравнивать нечего
+    starts = df['Начало смены'][df['Начало смены'].astype(object).apply(parse_time).notna().to_numpy()]
+    return {
+        "store type": (lambda: Map1.detect_store_types(df['ТТ']).astype(object).tolist(),
+                       lambda: df['ТТ'].astype(object).apply(detect_store_type).tolist()),
+        "roles": (roles, lambda: df['Должность_исх'].apply(standardize_role_name).tolist()),
+        "time": (lambda: (Map1.parse_minutes(starts).astype(float).fillna(-60) / 60).round(9).tolist(),
+                 lambda: starts.astype(object).apply(parse_time).fillna(-1).round(9).tolist()),
+        "pay": (pay, pay_reference),
+        "cards": (lambda: cards(lambda part: Map1.make_card_html(part).tolist()),
+                  lambda: cards(lambda part: part.apply(make_card_html, axis=1).tolist())),
+    }
+
+
+def dates_frame(rows, seed=1):
+    """rows строк сырых дат и времени смен map_synth: по «файлу» на каждый формат map_synth.DATE_FORMATS,
+    дата — категорией на все файлы, как после склейки выгрузок"""
+    coords_path = os.path.join(ROOT, "Мапа - result_coords.csv")
+    codes, rng = map_synth.store_codes(coords_path), np.random.default_rng(seed)
+    parts = []
+    for k, fmt in enumerate(map_synth.DATE_FORMATS):
+        size = rows // len(map_synth.DATE_FORMATS) + (k < rows % len(map_synth.DATE_FORMATS))
+        chunk = map_synth.generate_chunk(codes, rng, size, datetime.date.today(), 0.3, fmt)
+        parts.append(pd.DataFrame({"file": k, "date": chunk["date"], "time": chunk["Начало смены"]}))
+    df = pd.concat(parts, ignore_index=True)
+    df["date"] = df["date"].astype("category")
+    df["time"] = df["time"].astype("category")
+    return df
+
+
+def date_cases(df):
+    """Даты: формат на файл (detect_date_format) и разбор по нему (parse_dates) против разбора каждой строки;
+    время: parse_minutes против parse_time по строкам"""
+    files = [part for _, part in df.groupby("file", sort=False)["date"]]
+
+    def nanoseconds(values):
+        return pd.Series(values).to_numpy(dtype="datetime64[ns]").astype(np.int64).tolist()
+
+    def dates():
+        return nanoseconds(pd.concat([Map1.parse_dates(part, Map1.detect_date_format(part)) for part in files]))
+
+    # Исходный parse_time понимал только 'Ч:ММ'; на остальных форматах сравнивать нечего
+    times = df["time"][df["time"].astype(object).apply(parse_time).notna().to_numpy()]
+    return {
+        "dates": (dates, lambda: nanoseconds(df["date"].astype(object).map(parse_date_row).tolist())),
+        "times": (lambda: (Map1.parse_minutes(times).astype(float).fillna(-60) / 60).round(9).tolist(),
+                  lambda: times.astype(object).apply(parse_time).fillna(-1).round(9).tolist()),
+    }
+
+
+# Случай -> (данные, пары функций, строк по умолчанию)
+MICRO_CASES = {"columns": (columns_frame, column_cases, "500k"), "dates": (dates_frame, date_cases, "1m")}
+
+
+def timed(func, repeat):
+    """-> (результат последнего повтора, медиана стены, медиана CPU)"""
+    walls, cpus = [], []
+    for _ in range(repeat):
+        wall, cpu = time.perf_counter(), time.process_time()
+        result = func()
+        walls.append(time.perf_counter() - wall)
+        cpus.append(time.process_time() - cpu)
+    return result, statistics.median(walls), statistics.median(cpus)
+
+
+def cmd_micro(args):
+    make_frame, make_cases, default_rows = MICRO_CASES[args.case]
+    rows = map_synth.parse_rows(args.rows or default_rows)
+    print(f"🧪 {args.case}: готовим {rows} строк...")
+    df = make_frame(rows, args.seed)
+    stages, reference, mismatched = {}, {}, []
+    print(f"   {'столбец':<12} {'apply':>9} {'вектор':>9}  ускорение")
+    for name, (vectorized, original) in make_cases(df).items():
+        expected, before, _ = timed(original, args.repeat)
+        got, after, cpu = timed(vectorized, args.repeat)
+        if got != expected:
+            mismatched.append(name)
+        stages[name] = {"wall_s": round(after, 4), "cpu_s": round(cpu, 4), "peak_mb": 0.0, "rows": len(df)}
+        reference[name] = round(before, 4)
+        print(f"   {name:<12} {before:>8.3f}с {after:>8.3f}с  ×{before / max(after, 1e-9):.0f}"
+              f"{'' if name not in mismatched else '  ❌ результаты различаются'}")
+    result = {"time": datetime.datetime.now().isoformat(timespec="seconds"), "commit": git("rev-parse", "HEAD"),
+              "dirty": bool(git("status", "--porcelain", "--", "Map1.py")), "scale": args.rows or default_rows, "mode": f"micro-{args.case}",
+              "warm": False, "seed": args.seed, "repeat": args.repeat, "machine": machine_info(),
+              "total_wall_s": round(sum(m["wall_s"] for m in stages.values()), 4), "peak_rss_mb": 0.0,
+              "stages": stages, "reference_wall_s": reference}
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    with open(RESULTS, "a", encoding="utf-8") as f:
+        f.write(json.dumps(result, ensure_ascii=False) + "\n")
+    if mismatched:
+        sys.exit(f"🛑 Векторная версия разошлась с исходной: {', '.join(mismatched)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры Map1.py по этапам на синтетических данных")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", help="замерить текущий Map1.py и дописать результаты")
+    run.add_argument("--scales", default="10k,100k", help="через запятую: 1k … 10m")
+    run.add_argument("--modes", default="split-html,split-template", help=f"через запятую из: {', '.join(MODES)}")
+    run.add_argument("--repeat", type=int, default=3)
+    run.add_argument("--warm", action="store_true", help="повторная сборка с кэшем и прошлыми выходными файлами")
+    run.add_argument("--format", choices=["csv", "xlsx"], default="csv")
+    run.add_argument("--files", type=int, default=2)
+    run.add_argument("--seed", type=int, default=1)
+    compare = sub.add_parser("compare", help="сравнить сохранённые результаты двух коммитов")
+    compare.add_argument("base")
+    compare.add_argument("head", nargs="?", default="HEAD")
+    compare.add_argument("--threshold", type=float, default=0.10, help="относительное изменение, которое считаем значимым")
+    compare.add_argument("--min-seconds", type=float, default=0.05, help="и абсолютное, в секундах")
+    compare.add_argument("--fail", action="store_true", help="код выхода 1, если что-то замедлилось (для CI)")
+    micro = sub.add_parser("micro", help="функции Map1.py против исходных построчных реализаций")
+    micro.add_argument("--case", choices=list(MICRO_CASES), default="columns")
+    micro.add_argument("--rows", help="по умолчанию: columns — 500k, dates — 1m")
+    micro.add_argument("--repeat", type=int, default=1)
+    micro.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    if args.command == "run":
+        unknown = set(args.modes.split(",")) - set(MODES)
+        if unknown:
+            parser.error(f"неизвестные режимы: {', '.join(sorted(unknown))}")
+        cmd_run(args)
+    elif args.command == "micro":
+        cmd_micro(args)
+    else:
+        cmd_compare(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""Стресс-тест одновременных запусков Map1.py: блокировка запуска, атомарная запись, публикация в git.
+
+Во временной папке создаёт голый репозиторий (вместо GitHub) и его клон с синтетическими выгрузками (map_synth.py).
+Затем волнами запускает по --concurrency процессов Map1.py разом; перед каждой волной выгрузки пересоздаются
+с другим seed, так что каждой волне есть что собрать и опубликовать, а волны накладываются на ещё идущие сборки.
+Всё это время отдельный поток читает index.html и проверяет, что страница целая и файлы, на которые она
+ссылается, на месте. В конце проверяет:
+  - все запуски завершились без ошибок, а лишние слились в повторные сборки;
+  - сборки не шли одновременно (по журналу замеров);
+  - в удалённом репозитории линейная история без конфликтов, git fsck чист, клон совпадает с удалённым;
+  - опубликованный сайт согласован: файлы манифеста на месте и с теми же sha256; временных файлов не осталось;
+  - ещё один запуск после всех видит, что карта уже актуальна.
+
+    python map_stress.py --concurrency 20 --waves 5 --rows 20k
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import map_synth
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+MAP_SCRIPT = os.path.join(ROOT, "Map1.py")
+METRICS = "stress_metrics.jsonl"
+ASSET_RE = re.compile(r'(?:pointsUrl|clustersUrl|timesUrl) = "([^"]+)"|(?:src|href)="((?:assets|data)/[^"]+)"')
+
+
+def git(cwd, *args):
+    return subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True, text=True).stdout.strip()
+
+
+def make_repos(base):
+    """Голый «удалённый» репозиторий и клон, в котором работает Map1.py; первый коммит — чтобы было куда пушить"""
+    remote, work = os.path.join(base, "remote.git"), os.path.join(base, "work")
+    git(base, "init", "-q", "--bare", remote)
+    git(base, "clone", "-q", remote, work)
+    git(work, "config", "user.name", "map-stress")
+    git(work, "config", "user.email", "map-stress@localhost")
+    with open(os.path.join(work, "README.md"), "w", encoding="utf-8") as f:
+        f.write("stress\n")
+    git(work, "add", "README.md")
+    git(work, "commit", "-q", "-m", "init")
+    git(work, "push", "-q", "-u", "origin", "HEAD")
+    return remote, work
+
+
+def refresh_inputs(work, rows, files, seed):
+    """Новые выгрузки: генерируем рядом и подменяем файлы целиком, чтобы Map1.py не прочитал половину"""
+    staging = tempfile.mkdtemp(prefix="synth_", dir=os.path.dirname(work))
+    try:
+        for path in map_synth.generate(staging, rows, files, "csv", seed):
+            os.replace(path, os.path.join(work, os.path.basename(path)))
+        for name in os.listdir(staging):  # файл координат
+            os.replace(os.path.join(staging, name), os.path.join(work, name))
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def launch(work, args):
+    cmd = [sys.executable, MAP_SCRIPT, "--metrics-log", METRICS, "--layout", args.layout, "--cards", args.cards]
+    log = tempfile.TemporaryFile(mode="w+", encoding="utf-8")
+    return subprocess.Popen(cmd, cwd=work, stdout=log, stderr=subprocess.STDOUT), log
+
+
+def watch_page(work, stop, problems, reads):
+    """Читатель, как веб-сервер: index.html всегда целиком, а всё, на что он ссылается, уже записано"""
+    path = os.path.join(work, "index.html")
+    while not stop.is_set():
+        try:
+            with open(path, encoding="utf-8") as f:
+                page = f.read()
+        except FileNotFoundError:
+            time.sleep(0.01)
+            continue
+        reads[0] += 1
+        if not page.rstrip().endswith("</html>"):
+            problems.append(f"index.html прочитан не целиком ({len(page)} байт)")
+        for match in ASSET_RE.finditer(page):
+            asset = match.group(1) or match.group(2)
+            if not os.path.exists(os.path.join(work, asset)):
+                problems.append(f"index.html ссылается на ещё не записанный {asset}")
+        time.sleep(0.005)
+
+
+def check_overlaps(work, problems):
+    """Запуски из журнала замеров: конец (с точностью до секунды) и длительность — пересекаться не должны"""
+    with open(os.path.join(work, METRICS), encoding="utf-8") as f:
+        runs = [json.loads(line) for line in f]
+    spans = sorted((datetime.datetime.fromisoformat(r["time"]).timestamp() - r["wall_s"],
+                    datetime.datetime.fromisoformat(r["time"]).timestamp()) for r in runs if r["result"] != "unchanged")
+    for (_, end), (start, _) in zip(spans, spans[1:]):
+        if start < end - 1.0:  # секунда — точность метки времени в журнале
+            problems.append(f"сборки шли одновременно: одна кончилась в {end:.0f}, другая началась в {start:.0f}")
+    return runs
+
+
+def check_repos(remote, work, problems):
+    for line in git(remote, "rev-list", "--parents", "HEAD").splitlines():
+        if len(line.split()) > 2:
+            problems.append(f"merge-коммит в удалённом репозитории: {line}")
+    try:
+        git(remote, "fsck", "--strict")
+    except subprocess.CalledProcessError as e:
+        problems.append(f"git fsck: {e.stderr.strip()}")
+    if git(work, "rev-parse", "HEAD") != git(remote, "rev-parse", "HEAD"):
+        problems.append("клон и удалённый репозиторий разошлись")
+    if any(os.path.exists(os.path.join(work, ".git", d)) for d in ("rebase-merge", "rebase-apply", "MERGE_HEAD")):
+        problems.append("в клоне остался незавершённый rebase/merge")
+    dirty = git(work, "status", "--porcelain", "--", "index.html", "data", "assets")
+    if dirty:
+        problems.append(f"неопубликованные изменения сайта:\n{dirty}")
+
+
+def check_site(work, problems):
+    manifest_path = os.path.join(work, "assets", "manifest.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)["files"]
+        for entry in manifest.values():
+            path = os.path.join(work, entry["file"])
+            if not os.path.exists(path):
+                problems.append(f"нет файла из манифеста: {entry['file']}")
+                continue
+            with open(path, "rb") as f:
+                if hashlib.sha256(f.read()).hexdigest() != entry["sha256"]:
+                    problems.append(f"sha256 не совпадает: {entry['file']}")
+    leftovers = [os.path.join(root, name) for root, _, names in os.walk(work) if ".git" not in root
+                 for name in names if name.endswith(".tmp")]
+    if leftovers:
+        problems.append(f"остались временные файлы: {leftovers[:5]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Стресс-тест одновременных запусков Map1.py с публикацией в git")
+    parser.add_argument("--concurrency", type=int, default=20, help="процессов Map1.py в одной волне")
+    parser.add_argument("--waves", type=int, default=5, help="сколько раз менять выгрузки и запускать волну")
+    parser.add_argument("--interval", type=float, default=2.0,
+                        help="секунд между волнами: меньше длительности сборки — волны накладываются")
+    parser.add_argument("--rows", default="20k")
+    parser.add_argument("--files", type=int, default=2)
+    parser.add_argument("--layout", choices=["split", "inline"], default="split")
+    parser.add_argument("--cards", choices=["html", "template"], default="template")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--keep", action="store_true", help="не удалять временную папку (для разбора)")
+    args = parser.parse_args()
+    if shutil.which("git") is None:
+        sys.exit("🛑 Нужен git.")
+
+    base = tempfile.mkdtemp(prefix="map_stress_")
+    rnd = random.Random(args.seed)
+    problems, reads, stop = [], [0], threading.Event()
+    try:
+        remote, work = make_repos(base)
+        print(f"🧪 {base}: {args.waves} волн по {args.concurrency} запусков, выгрузки {args.rows} строк")
+        reader = threading.Thread(target=watch_page, args=(work, stop, problems, reads), daemon=True)
+        reader.start()
+        procs, started = [], time.perf_counter()
+        for wave in range(args.waves):
+            refresh_inputs(work, map_synth.parse_rows(args.rows), args.files, args.seed + wave)
+            for _ in range(args.concurrency):
+                procs.append(launch(work, args))
+                time.sleep(rnd.uniform(0, 0.02))
+            time.sleep(args.interval)
+        coalesced = 0
+        for proc, log in procs:
+            proc.wait()
+            log.seek(0)
+            output = log.read()
+            coalesced += "Сборка уже идёт в другом процессе" in output
+            if proc.returncode != 0:
+                problems.append(f"Map1.py завершился с кодом {proc.returncode}:\n{output[-1500:]}")
+        elapsed = time.perf_counter() - started
+        stop.set()
+        reader.join()
+
+        runs = check_overlaps(work, problems)
+        check_repos(remote, work, problems)
+        check_site(work, problems)
+        final, log = launch(work, args)
+        final.wait()
+        log.seek(0)
+        if "карта уже актуальна" not in log.read():
+            problems.append("запуск после всех снова что-то собирал: последняя волна не была учтена")
+
+        builds = sum(r["result"] != "unchanged" for r in runs)
+        commits = len(git(remote, "rev-list", "HEAD").splitlines()) - 1
+        print(f"🚀 {len(procs)} запусков за {elapsed:.1f} с: сборок {builds}, слились в повтор {coalesced}, "
+              f"коммитов {commits}, чтений index.html {reads[0]}")
+        if problems:
+            print(f"❌ Проблем: {len(problems)}")
+            for problem in problems[:20]:
+                print(f"   {problem}")
+            sys.exit(1)
+        print("✅ Ни одной гонки: сборки по очереди, файлы целые, история линейная.")
+    finally:
+        stop.set()
+        if args.keep:
+            print(f"📁 Оставлено: {base}")
+        else:
+            shutil.rmtree(base, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""Синтетические выгрузки потребности для замеров и проверки Map1.py — без настоящих файлов заказчика.
+
+Столбцы — как в реальных выгрузках (с разными вариантами заголовков, которые приводит clean_and_check):
+коды ТТ берутся из файла координат (часть — в другом регистре, с пробелами или только номером магазина,
+немного — неизвестные), должности — в разных написаниях для standardize_roles, есть ночные смены через полночь,
+время в виде 8:00 / 08:00 / 08:00:00, пустые и битые значения, дубли (в том числе между файлами) и прошедшие даты.
+Результат воспроизводим: одинаковые --seed и --rows дают одинаковые файлы.
+
+    python map_synth.py OUT_DIR --rows 1000000 --files 2 --format csv
+"""
+import argparse
+import datetime
+import os
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+
+import Map1
+
+CHUNK_ROWS = 500_000  # столько строк генерируем и дописываем за раз: память не зависит от --rows
+XLSX_SHEET_ROWS = 1_000_000  # лист Excel вмещает 1 048 576 строк
+XLSX_SHEETS = ["Сегодня", "Завтра", "ДС", "ВС-ГС"]
+
+# Написание должности -> вес. Веса примерно как в выгрузках: грузчики и сборщики — большинство
+ROLE_VARIANTS = {
+    "Грузчик": 8, "грузчик": 3, " Дневной  Грузчик": 2, "ГРУЗЧИК": 1, "Ночной грузчик": 5, "ночной грузчик": 2,
+    "Грузчик ночь": 1, "Грузчик-переборщик": 2,
+    "Сборщик": 6, "сборщик": 2, "Ночной сборщик": 4, "Сборщик построчно": 4, "сборщик  построчно": 1,
+    "Продавец": 5, "продавец-кассир": 1, "Ночной продавец": 2,
+    "Кассир": 4, "кассир": 1, "Кассир построчно": 1,
+    "Бариста": 1, "бариста": 1, "Уборщица": 2, "Клинер": 1, "уборка": 1, "Повар": 1,
+    "Охранник": 1, "Мерчендайзер": 1, "": 1,
+}
+# (начало, конец) -> вес; конец раньше начала — смена через полночь
+SHIFTS = {
+    ("08:00", "20:00"): 8, ("07:00", "19:00"): 5, ("09:00", "21:00"): 4, ("10:00", "14:00"): 2, ("08:00", "17:00"): 3,
+    ("20:00", "08:00"): 5, ("19:00", "07:00"): 3, ("21:00", "09:00"): 3, ("23:00", "07:00"): 3, ("22:00", "06:30"): 1,
+}
+DATE_FORMATS = ["%d.%m.%Y", "%d.%m.%Y", "%d.%m.%Y", "%Y-%m-%d", "%d.%m.%y"]  # у каждого файла свой
+HEADERS = [
+    {"role": "Роль", "date": "Дата", "count": "Кол-во"},
+    {"role": "Должность", "date": "Дата выхода", "count": "Количество сотрудников"},
+    {"role": "Роль", "date": "Дата выхода", "count": "Кол-во сотрудников"},
+]
+
+
+def parse_rows(text):
+    """'10k', '1.5m', '200000' -> int"""
+    text = text.strip().lower().replace("_", "")
+    scale = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text[:-1] if scale > 1 else text) * scale)
+
+
+def store_codes(coords_path):
+    coords = pd.read_csv(coords_path)
+    coords.columns = [str(c).strip() for c in coords.columns]
+    codes = coords["Описание"].map(Map1.extract_tt).dropna()
+    return np.array(sorted(set(codes) - {""}), dtype=object)
+
+
+def tt_variants(codes, rng, size):
+    """Коды ТТ так, как их набирают в выгрузках: в основном точно, но бывает регистр, пробелы, только номер"""
+    tt = codes[rng.integers(0, len(codes), size)]
+    kind = rng.random(size)
+    out = tt.copy()
+    lower = kind < 0.03
+    out[lower] = [s.lower() for s in tt[lower]]
+    spaced = (kind >= 0.03) & (kind < 0.05)
+    out[spaced] = [f" {s} " for s in tt[spaced]]
+    number = (kind >= 0.05) & (kind < 0.06)
+    out[number] = [s[:len(s) - len(s.lstrip("0123456789"))] or s for s in tt[number]]
+    unknown = kind >= 0.995
+    out[unknown] = [f"{n}Х_Нет" for n in rng.integers(90000, 99999, int(unknown.sum()))]
+    return out
+
+
+def weighted(choices, rng, size):
+    """size случайных номеров ключей choices с их весами"""
+    p = np.array(list(choices.values()), dtype=float)
+    return rng.choice(len(p), size, p=p / p.sum())
+
+
+def time_variants(times, rng):
+    """08:00 -> иногда 8:00, 08:00:00, пусто или мусор"""
+    kind = rng.random(len(times))
+    out = times.copy()
+    short = kind < 0.1
+    out[short] = [t[1:] if t.startswith("0") else t for t in times[short]]
+    seconds = (kind >= 0.1) & (kind < 0.15)
+    out[seconds] = [t + ":00" for t in times[seconds]]
+    out[(kind >= 0.15) & (kind < 0.16)] = None
+    out[(kind >= 0.16) & (kind < 0.163)] = "уточнить"
+    return out
+
+
+def generate_chunk(codes, rng, size, today, stale, date_format):
+    """size строк без дублей; stale — доля смен с уже прошедшей датой"""
+    shifts = np.array(list(SHIFTS), dtype=object)[weighted(SHIFTS, rng, size)]
+    past = rng.random(size) < stale
+    offsets = np.where(past, -rng.integers(1, 15, size), rng.integers(0, 8, size))
+    days = {d: (today + datetime.timedelta(days=int(d))).strftime(date_format) for d in range(-14, 8)}
+    return pd.DataFrame({
+        "ТТ": tt_variants(codes, rng, size),
+        "role": np.array(list(ROLE_VARIANTS), dtype=object)[weighted(ROLE_VARIANTS, rng, size)],
+        "date": pd.Series(offsets).map(days).to_numpy(dtype=object),
+        "Начало смены": time_variants(shifts[:, 0].copy(), rng),
+        "Конец смены": time_variants(shifts[:, 1].copy(), rng),
+        "count": rng.integers(1, 6, size),
+    })
+
+
+def add_duplicates(chunk, rng, dup, carry):
+    """Дубли: доля dup строк повторяется внутри куска, а часть прошлого куска — между файлами (carry)"""
+    n = int(len(chunk) * dup)
+    parts = [chunk, chunk.iloc[rng.integers(0, len(chunk), n)]]
+    if carry is not None and len(carry):
+        parts.append(carry)
+    out = pd.concat(parts, ignore_index=True)
+    return out.iloc[rng.permutation(len(out))].reset_index(drop=True)
+
+
+def write_csv(path, chunks, header):
+    first = True
+    for chunk in chunks:
+        chunk.rename(columns=header).to_csv(path, index=False, header=first, mode="w" if first else "a")
+        first = False
+
+
+def write_xlsx(path, chunks, header):
+    """Листы по XLSX_SHEET_ROWS строк с именами из SHEET_MARKERS; время частью — объектами time, как в Excel"""
+    frames, rows = [], 0
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        def flush(index):
+            df = pd.concat(frames, ignore_index=True).rename(columns=header)
+            for col in ("Начало смены", "Конец смены"):
+                as_time = pd.to_datetime(df[col], format="%H:%M", errors="coerce")
+                use = as_time.notna().to_numpy() & (np.arange(len(df)) % 3 == 0)
+                df[col] = df[col].astype(object)
+                df.loc[use, col] = as_time[use].dt.time
+            name = XLSX_SHEETS[index % len(XLSX_SHEETS)] + (f" {index // len(XLSX_SHEETS) + 1}" if index >= len(XLSX_SHEETS) else "")
+            df.to_excel(writer, sheet_name=name, index=False)
+        sheet = 0
+        for chunk in chunks:
+            frames.append(chunk)
+            rows += len(chunk)
+            if rows >= XLSX_SHEET_ROWS:
+                flush(sheet)
+                frames, rows, sheet = [], 0, sheet + 1
+        if frames:
+            flush(sheet)
+
+
+def generate(out_dir, rows, files=1, fmt="csv", seed=1, stale=0.3, dup=0.1, coords=None, today=None):
+    """Пишет files файлов потребности (всего ~rows строк, включая дубли) и копию файла координат; -> список путей"""
+    coords = coords or os.path.join(os.path.dirname(os.path.abspath(__file__)), "Мапа - result_coords.csv")
+    today = today or datetime.date.today()
+    os.makedirs(out_dir, exist_ok=True)
+    shutil.copy(coords, os.path.join(out_dir, os.path.basename(coords)))
+    codes = store_codes(coords)
+    rng = np.random.default_rng(seed)
+    carry, paths = None, []
+    per_file = [rows // files + (k < rows % files) for k in range(files)]
+    for k, file_rows in enumerate(per_file):
+        header = HEADERS[k % len(HEADERS)]
+        date_format = DATE_FORMATS[k % len(DATE_FORMATS)]
+        unique_rows = int(file_rows / (1 + dup))
+
+        def chunks():
+            nonlocal carry
+            left = unique_rows
+            while left > 0:
+                size = min(CHUNK_ROWS, left)
+                chunk = generate_chunk(codes, rng, size, today, stale, date_format)
+                # Между файлами повторяются строки прошлого файла — с его форматом даты, как при пересохранении
+                out = add_duplicates(chunk, rng, dup, carry)
+                carry = chunk.iloc[:max(1, int(size * dup / 4))]
+                left -= size
+                yield out
+
+        name = f"Сегодня_{k}.csv" if fmt == "csv" else f"потребность_{k:02d}.xlsx"
+        path = os.path.join(out_dir, name)
+        (write_csv if fmt == "csv" else write_xlsx)(path, chunks(), header)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Синтетические выгрузки потребности для Map1.py")
+    parser.add_argument("out_dir")
+    parser.add_argument("--rows", default="100k", help="всего строк во всех файлах: 1k … 10m")
+    parser.add_argument("--files", type=int, default=1)
+    parser.add_argument("--format", choices=["csv", "xlsx"], default="csv")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--stale", type=float, default=0.3, help="доля смен с прошедшей датой")
+    parser.add_argument("--dup", type=float, default=0.1, help="доля дублей")
+    parser.add_argument("--coords", help="файл координат (по умолчанию — из папки Map1.py)")
+    args = parser.parse_args()
+    rows = parse_rows(args.rows)
+    if args.format == "xlsx" and rows > 2_000_000:
+        print("⚠️ xlsx пишется через openpyxl медленно (~1 мин на миллион строк); для больших объёмов лучше csv.",
+              file=sys.stderr)
+    paths = generate(args.out_dir, rows, args.files, args.format, args.seed, args.stale, args.dup, args.coords)
+    for path in paths:
+        print(f"📝 {path}: {os.path.getsize(path) >> 10} КБ")
+
+
+if __name__ == "__main__":
+    main()
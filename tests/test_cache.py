@@ -0,0 +1,52 @@
+"""Кэш разобранных файлов и карточек: после сборки остаётся только то, на что ссылаются текущие входные файлы;
+правка кода разбора или карточки сбрасывает кэш"""
+import os
+
+import Map1
+import map_bench
+
+
+def touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, "wb").close()
+
+
+def test_prune_cache_keeps_only_current_inputs(tmp_path, monkeypatch):
+    cache = tmp_path / ".map_cache"
+    monkeypatch.setattr(Map1, "project_dir", str(tmp_path))
+    monkeypatch.setattr(Map1, "CACHE_DIR", str(cache))
+    file_digests = {"Сегодня.csv": "aaa", "coords.csv": "ccc"}
+    current = [Map1._frame_path("needs", "aaa") + ".parquet", Map1._registry_path("ccc"), Map1._card_cache_path("moscow")]
+    stale = [Map1._frame_path("needs", "old") + ".parquet", str(cache / "frames" / "needs-v1-aaa.pkl"),
+             str(cache / "frames" / f"needs-v{Map1.CACHE_VERSION}-000000000000-aaa.parquet"),
+             Map1._registry_path("old"), str(cache / "registry-ccc.pkl"), Map1._card_cache_path("spb")]
+    for path in current + stale:
+        touch(path)
+    index = {"files": {str(tmp_path / name): {} for name in ["Сегодня.csv", "Вчера.csv", "coords.csv"]}}
+
+    Map1.prune_cache(index, file_digests, [{"name": "moscow"}])
+
+    assert all(os.path.exists(p) for p in current)
+    assert not any(os.path.exists(p) for p in stale)
+    assert sorted(index["files"]) == [str(tmp_path / "coords.csv"), str(tmp_path / "Сегодня.csv")]
+
+
+def test_card_template_change_rerenders_cards(monkeypatch):
+    full_data = map_bench.columns_frame(500, seed=5)
+    cards = {}
+    grouped, stale = Map1.render_cards(full_data, {}, cards)
+    assert stale == len(grouped)
+    assert Map1.render_cards(full_data, cards, None)[1] == 0
+
+    render = Map1.make_card_html
+
+    def make_card_html(df, manager=Map1.MANAGER_PHONE):
+        return render(df, manager).str.replace("Записаться через WhatsApp", "Записаться")
+    monkeypatch.setattr(Map1, "make_card_html", make_card_html)
+    Map1.card_fingerprint.cache_clear()
+    try:
+        grouped, stale = Map1.render_cards(full_data, cards, None)
+    finally:
+        Map1.card_fingerprint.cache_clear()
+    assert stale == len(grouped)
+    assert not grouped['HTML_Card'].str.contains("Записаться через WhatsApp").any()
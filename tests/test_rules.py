@@ -0,0 +1,27 @@
+"""Ставки из rules.json: дробная ставка не округляется, целая выглядит как раньше"""
+import pandas as pd
+import pytest
+
+import Map1
+
+
+@pytest.fixture
+def rules():
+    Map1.set_role_rules({"rates": {"WS": {"Бариста": 270.5, "Кассир": 265}, "DS": {}}})
+    yield
+    Map1.set_role_rules({})
+
+
+def test_fractional_rate_is_kept(rules):
+    roles = pd.Series(["Бариста", "Кассир", "Сборщик (построчно)"], dtype="category")
+    store_types = pd.Series(["Whitestore"] * 3)
+    hours = pd.Series([10.0, 12.0, 8.0])
+    rates, piecework, _, _ = Map1.role_columns(roles, store_types)
+    pay = Map1.get_pay_values(roles, hours, rates, piecework)
+
+    assert rates.tolist()[:2] == [270.5, 265.0]
+    assert pay.tolist() == [2705, 3180, 0]
+    assert Map1.get_pay_strs(pay, rates, piecework).astype(object).tolist() == [
+        "💰 270.5 ₽/ч (≈<b>2705₽</b>)", "💰 265 ₽/ч (≈<b>3180₽</b>)", "💰 Сдельная"]
+    assert Map1.rate_values(rates.where(~piecework, -1)) == [270.5, 265, -1]
+    assert [type(v) for v in Map1.rate_values(rates.where(~piecework, -1))] == [float, int, int]
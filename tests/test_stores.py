@@ -0,0 +1,114 @@
+"""Сопоставление кодов ТТ с реестром магазинов: разные написания одного магазина — одна точка на карте;
+поиск магазинов рядом с точкой по сетке совпадает с перебором всех магазинов"""
+import datetime
+
+import numpy as np
+import pandas as pd
+
+import Map1
+
+
+def make_registry():
+    coords = pd.DataFrame({
+        "Адрес": ["Тверская ул., 1", "Арбат ул., 2"],
+        "Широта": [55.76, 55.75],
+        "Долгота": [37.61, 37.59],
+        "Описание": ["Формат: ДС\nКод ТТ: 6737ДС_Тверская", "Формат: Жук\nКод ТТ: 1201_Арбат"],
+    })
+    registry = Map1.build_store_registry(coords)
+    registry["region"] = np.zeros(len(registry["codes"]), dtype=np.int64)
+    return registry
+
+
+def needs(rows):
+    today = datetime.date.today()
+    df = pd.DataFrame([{
+        "ТТ": tt, "Роль": "Грузчик", "Дата": (today + datetime.timedelta(days=day)).strftime("%d.%m.%Y"),
+        "Начало смены": "08:00", "Конец смены": "20:00", "Кол-во": 2,
+    } for tt, day in rows])
+    return Map1.standardize_needs(Map1.clean_and_check(df, "Сегодня.csv"))
+
+
+def test_spellings_of_one_store_make_one_placemark():
+    registry = make_registry()
+    needs_df = needs([("6737ДС_Тверская", 0), ("6737", 1), (" 6737дс_тверская ", 2), ("1201_Арбат", 0)])
+    fuzzy = Map1.canonicalize_tt(needs_df, registry)
+    assert fuzzy == 1
+    full_data = Map1.merge_coords(Map1.prepare_needs(needs_df), registry, fuzzy)
+    grouped = Map1.group_shifts(full_data).set_index("ТТ")
+
+    assert sorted(grouped.index) == ["1201_Арбат", "6737ДС_Тверская"]
+    assert grouped.loc["6737ДС_Тверская", "Shifts_Total"] == 3
+    assert grouped.loc["6737ДС_Тверская", "Тип_По_ТТ"] == "Darkstore"
+    assert grouped.loc["1201_Арбат", "Тип_По_ТТ"] == "Whitestore"
+
+
+def test_spellings_are_deduplicated_as_one_store():
+    registry = make_registry()
+    needs_df = needs([("6737ДС_Тверская", 0), ("6737", 0)])
+    Map1.canonicalize_tt(needs_df, registry)
+    assert len(Map1.prepare_needs(needs_df)) == 1
+
+
+def test_unknown_codes_stay_as_is():
+    registry = make_registry()
+    needs_df = needs([("99999Х_Нет", 0), (None, 0)])
+    Map1.canonicalize_tt(needs_df, registry)
+    assert needs_df["ТТ"].iloc[0] == "99999Х_Нет"
+    assert pd.isna(needs_df["ТТ"].iloc[1])
+
+
+def grid_registry(lat, lon):
+    # stores_within и nearest_stores нужны только grid, lat и lon
+    lat, lon = np.asarray(lat, dtype=float), np.asarray(lon, dtype=float)
+    return {"lat": lat, "lon": lon, "grid": Map1.build_grid(lat, lon)}
+
+
+def brute_force(registry, lat, lon):
+    dist = Map1.haversine_km(lat, lon, registry["lat"], registry["lon"])
+    order = np.argsort(dist, kind="stable")
+    return order, dist[order]
+
+
+rng = np.random.default_rng(11)
+SCATTERED = grid_registry(np.r_[rng.uniform(55.5, 56.0, 400), 56.86, 54.19],
+                          np.r_[rng.uniform(37.3, 37.9, 400), 35.90, 37.62])
+# Центр Москвы, окраина, поле в ~30 км от ближайшего магазина (радиус удваивается несколько раз), Тверь
+POINTS = [(55.75, 37.62), (55.51, 37.31), (56.30, 36.90), (56.85, 35.92)]
+
+
+def test_stores_within_matches_brute_force():
+    for lat, lon in POINTS:
+        rows, dist = brute_force(SCATTERED, lat, lon)
+        for radius in (0.5, 3.0, 25.0, 150.0):
+            found_rows, found_dist = Map1.stores_within(SCATTERED, lat, lon, radius)
+            assert found_rows.tolist() == rows[dist <= radius].tolist()
+            assert found_dist.tolist() == dist[dist <= radius].tolist()
+
+
+def test_nearest_stores_matches_brute_force():
+    for lat, lon in POINTS:
+        rows, dist = brute_force(SCATTERED, lat, lon)
+        for k in (1, 5, 40):
+            found_rows, found_dist = Map1.nearest_stores(SCATTERED, lat, lon, k)
+            assert found_rows.tolist() == rows[:k].tolist()
+            assert found_dist.tolist() == dist[:k].tolist()
+    assert Map1.haversine_km(56.30, 36.90, SCATTERED["lat"], SCATTERED["lon"]).min() > 4 * Map1.GRID_CELL_DEG * 111.0
+
+
+def test_nearest_stores_stops_at_max_radius():
+    # Ближе max_radius_km магазинов меньше k: отдаём те, что нашлись в последнем круге
+    rows, dist = brute_force(SCATTERED, 56.86, 35.90)
+    found_rows, found_dist = Map1.nearest_stores(SCATTERED, 56.86, 35.90, k=3, max_radius_km=50.0)
+    last_radius = Map1.GRID_CELL_DEG * 111.0
+    while last_radius < 50.0:
+        last_radius *= 2
+    assert found_rows.tolist() == rows[dist <= last_radius][:3].tolist() == [400]
+    assert found_dist.tolist() == dist[:1].tolist()
+
+
+def test_empty_registry_finds_nothing():
+    empty = grid_registry([], [])
+    for find in (lambda: Map1.stores_within(empty, 55.75, 37.62, 10.0), lambda: Map1.nearest_stores(empty, 55.75, 37.62, 5)):
+        rows, dist = find()
+        assert len(rows) == 0 and len(dist) == 0
@@ -0,0 +1,133 @@
+"""Раздельная раскладка (points.json + тайлы балунов + clusters.json + times.json) несёт ровно те же данные,
+что и встроенный в index.html rawData — на одном и том же синтетическом входе"""
+import json
+import os
+import re
+
+import numpy as np
+import pytest
+
+import Map1
+import map_bench
+
+
+def page_value(page, name):
+    start = page.index(f"const {name} = ") + len(f"const {name} = ")
+    return page[start:page.index(";\n", start)]
+
+
+def write_site(features, layout, site, total):
+    """Сайт в папке site; split — по пакету на тайл, как в режиме --stream"""
+    old_site_dir, Map1.site_dir = Map1.site_dir, str(site)
+    try:
+        if layout == "split":
+            tiles = Map1.tile_names(features["lat"].to_numpy(), features["lon"].to_numpy())
+            batches = [features.iloc[positions] for positions in features.groupby(tiles, sort=False).indices.values()]
+        else:
+            batches = [features]
+        Map1.write_site(batches, Map1.render_page("", total), layout)
+    finally:
+        Map1.site_dir = old_site_dir
+    with open(os.path.join(site, "index.html"), encoding="utf-8") as f:
+        return f.read()
+
+
+def read_json(site, rel_path):
+    with open(os.path.join(site, rel_path), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def decode_split(site, page):
+    """Признаки так, как их собирает PAGE_JS: точка из points.json, балун — из её тайла"""
+    points = read_json(site, re.search(r'pointsUrl = "([^"]+)"', page).group(1))
+    tiles = {}
+    features = {}
+    for p in points["points"]:
+        tile = points["tiles"][p[4]]
+        if tile not in tiles:
+            tiles[tile] = read_json(site, f"{Map1.DATA_DIR}/balloons/{tile}.json")
+        balloon = tiles[tile][str(p[0])]
+        properties = ({"balloonContentHeader": balloon[0], "balloonContentBody": balloon[1]} if isinstance(balloon, list)
+                      else {})
+        properties.update({"clusterCaption": str(p[0]), "hintContent": points["roles"][p[3]],
+                           "filterType": points["filters"][p[3]]})
+        if isinstance(balloon, dict):
+            properties.update(balloon)
+        features[p[0]] = {"type": "Feature", "id": p[0], "geometry": {"type": "Point", "coordinates": [p[1], p[2]]},
+                          "properties": properties}
+    return points, features
+
+
+def reference_clusters(features, filters):
+    """Та же сетка, что у ObjectManager (gridSize 64 px), посчитанная в лоб по точкам встроенного rawData"""
+    lat = np.array([f["geometry"]["coordinates"][0] for f in features])
+    lon = np.array([f["geometry"]["coordinates"][1] for f in features])
+    px, py = Map1.mercator_pixels(lat, lon)
+    filter_index = {name: i for i, name in enumerate(filters)}
+    levels = []
+    for zoom in range(Map1.CLUSTER_MAX_ZOOM + 1):
+        shift = Map1.CLUSTER_MAX_ZOOM - zoom + Map1.CLUSTER_GRID_SHIFT
+        cells = {}
+        for i, feature in enumerate(features):
+            cells.setdefault((int(px[i]) >> shift, int(py[i]) >> shift), []).append(i)
+        level = []
+        for (cx, cy), members in sorted(cells.items()):
+            if len(members) < 2:
+                continue
+            counts = {}
+            for i in members:
+                f = filter_index[features[i]["properties"]["filterType"]]
+                counts[f] = counts.get(f, 0) + 1
+            record = [cx, cy, sum(lat[members]) / len(members), sum(lon[members]) / len(members), len(members)]
+            for f in sorted(counts):
+                record += [f, counts[f]]
+            level.append(record)
+        levels.append(level)
+    return levels
+
+
+@pytest.fixture(scope="module")
+def full_data():
+    return map_bench.columns_frame(3000, seed=3)
+
+
+@pytest.mark.parametrize("cards", ["html", "template"])
+def test_split_tiles_match_inline_payload(full_data, cards, tmp_path):
+    grouped = Map1.group_shifts(full_data) if cards == "template" else Map1.render_cards(full_data, {}, None)[0]
+    features, _ = Map1.build_features(grouped, cards)
+    inline_page = write_site(features, "inline", tmp_path / "inline", len(grouped))
+    split_page = write_site(features, "split", tmp_path / "split", len(grouped))
+
+    raw = json.loads(page_value(inline_page, "rawData"))
+    points, split_features = decode_split(tmp_path / "split", split_page)
+    assert len(raw["features"]) == len(grouped) > 100
+    assert {f["id"]: f for f in raw["features"]} == split_features
+    px, py = Map1.mercator_pixels(np.array([p[1] for p in points["points"]]), np.array([p[2] for p in points["points"]]))
+    assert [p[5:] for p in points["points"]] == [list(xy) for xy in zip(px.tolist(), py.tolist())]
+
+    clusters = read_json(tmp_path / "split", re.search(r'clustersUrl = "([^"]+)"', split_page).group(1))
+    assert clusters["filters"] == points["filters"] == sorted({f["properties"]["filterType"] for f in raw["features"]})
+    expected = reference_clusters(raw["features"], points["filters"])
+    for level, reference in zip(clusters["levels"], expected, strict=True):
+        assert [r[:2] + r[4:] for r in sorted(level)] == [r[:2] + r[4:] for r in reference]
+        assert [v for r in sorted(level) for v in r[2:4]] == pytest.approx([v for r in reference for v in r[2:4]], abs=1e-6)
+
+    times = read_json(tmp_path / "split", re.search(r'timesUrl = "([^"]+)"', split_page).group(1))
+    assert times == json.loads(page_value(inline_page, "timesData"))
+
+
+def test_inline_build_removes_split_files(full_data, tmp_path):
+    features, _ = Map1.build_features(Map1.group_shifts(full_data), "template")
+    site = tmp_path / "site"
+    write_site(features, "split", site, len(features))
+    split_files = [os.path.relpath(os.path.join(root, name), site).replace(os.sep, "/")
+                   for root, _, names in os.walk(site) for name in names if not name.startswith("index.html")]
+    assert Map1.MANIFEST_PATH in split_files and any(f.startswith(Map1.DATA_DIR + "/") for f in split_files)
+
+    old_site_dir, Map1.site_dir = Map1.site_dir, str(site)
+    try:
+        changed = Map1.write_site([features], Map1.render_page("", len(features)), "inline")
+    finally:
+        Map1.site_dir = old_site_dir
+    assert not [name for rel_dir in (Map1.DATA_DIR, Map1.ASSETS_DIR) for _, _, names in os.walk(site / rel_dir) for name in names]
+    assert sorted(split_files) == sorted(f for f in changed if not f.startswith("index.html"))
@@ -0,0 +1,53 @@
+"""Векторные столбцы Map1.py совпадают с исходными построчными реализациями (apply) на данных map_synth"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import Map1
+import map_bench
+
+
+@pytest.fixture(scope="module")
+def cases():
+    return map_bench.column_cases(map_bench.columns_frame(5000, seed=7))
+
+
+@pytest.mark.parametrize("column", ["store type", "roles", "time", "pay", "cards"])
+def test_column_matches_apply(cases, column):
+    vectorized, original = cases[column]
+    assert vectorized() == original()
+
+
+@pytest.fixture(scope="module")
+def date_cases():
+    return map_bench.date_cases(map_bench.dates_frame(5000, seed=7))
+
+
+@pytest.mark.parametrize("column", ["dates", "times"])
+def test_dates_and_times_match_row_parsing(date_cases, column):
+    vectorized, original = date_cases[column]
+    assert vectorized() == original()
+
+
+def test_map_unique_matches_map():
+    series = pd.Series(["b", "a", np.nan, "b", np.nan, "c"] * 3, dtype=object)
+    expected = series.map(lambda v: f"<{v}>").tolist()
+    for categorical in (False, True):
+        result = Map1.map_unique(series, lambda u: u.map(lambda v: f"<{v}>"), categorical)
+        assert result.astype(object).tolist() == expected
+
+
+def test_hours_and_pay_match_original_arithmetic():
+    # map_synth даёт только :00 и :30 — здесь все минуты, в том числе смены через полночь
+    times = [f"{h}:{m:02d}" for h in (0, 1, 7, 23) for m in range(60)] + ["24:00", "ночь"]
+    start, end = zip(*[(a, b) for a in times for b in times])
+    df = pd.DataFrame({"Начало смены": start, "Конец смены": end, "Должность": "Бариста", "Тип_По_ТТ": "Whitestore",
+                       "Дата_DT": pd.Timestamp("2024-01-01")})
+    result = Map1.add_pay_columns(df.copy())
+
+    start_h, end_h = df['Начало смены'].apply(map_bench.parse_time), df['Конец смены'].apply(map_bench.parse_time)
+    hours = pd.Series(np.where(end_h < start_h, (24 - start_h) + end_h, end_h - start_h)).fillna(0.0)
+    assert result['Часы'].tolist() == hours.tolist()
+    assert result['Pay_Numeric'].tolist() == df.assign(Часы=hours).apply(map_bench.get_pay_value, axis=1).tolist()
+    first = (df['Начало смены'] == "0:00") & (df['Конец смены'] == "1:40")
+    assert result.loc[first, 'Pay_Numeric'].tolist() == [449]